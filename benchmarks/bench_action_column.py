@@ -0,0 +1,63 @@
+"""
+Time of general.generate_action_column (default consensus of the LLM opinions) on large frames,
+against the former per-row decide_final_action.
+
+Run from the project root: python benchmarks/bench_action_column.py [rows]
+"""
+import os
+import sys
+import time
+import logging
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from tools import general
+
+OPINIONS = [
+    "BUY - RSI oversold and price above SMA200",
+    "SELL - MACD bearish crossover",
+    "HOLD - no clear signal",
+    "error: metrics not provided",
+    None,
+]
+
+
+def make_opinions(rows, rng):
+    return pd.DataFrame({
+        "symbol": [f"SYM{i}" for i in range(rows)],
+        "llm_opinion": [OPINIONS[i] for i in rng.integers(0, len(OPINIONS), rows)],
+        "llm_2_opinion": [OPINIONS[i] for i in rng.integers(0, len(OPINIONS), rows)],
+    })
+
+
+def per_row(df):
+    # Former implementation: extraction with Series.apply, decision with DataFrame.apply(axis=1)
+    df['llm_opinion'] = df['llm_opinion'].apply(general.extract_llm_decision)
+    df['llm_2_opinion'] = df['llm_2_opinion'].apply(general.extract_llm_decision)
+    df['action'] = df.apply(lambda row: general.decide_final_action(row['llm_opinion'], row['llm_2_opinion']), axis=1)
+    return df.drop(columns=['llm_opinion', 'llm_2_opinion'])
+
+
+def timed(fn, df):
+    start = time.perf_counter()
+    result = fn(df.copy())
+    return (time.perf_counter() - start) * 1000, result
+
+
+def main(rows=100_000):
+    logging.disable(logging.INFO)
+    df = make_opinions(rows, np.random.default_rng(0))
+    old_ms, old = timed(per_row, df)
+    new_ms, new = timed(lambda frame: general.generate_action_column(frame, "DEFAULT"), df)
+    assert old["action"].tolist() == new["action"].tolist()
+    print(f"{rows} rows: per-row apply {old_ms:.0f} ms, vectorized {new_ms:.0f} ms ({old_ms / new_ms:.0f}x)")
+    for policy in ("majority", "weighted"):
+        ms, _ = timed(lambda frame: general.generate_action_column(frame, "DEFAULT", policy=policy,
+                                                                   weights={"llm_opinion": 2}), df)
+        print(f"  {policy}: {ms:.0f} ms")
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,52 @@
+"""
+Time to attach the LLM opinions of a run to the analysis frame: one general.add_opinion call per
+symbol and column (a full-column scan each) against a single general.add_opinions call.
+
+Run from the project root: python benchmarks/bench_add_opinions.py [symbols]
+"""
+import os
+import sys
+import time
+import logging
+
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from tools import general
+
+
+def make_run(symbols):
+    names = [f"SYM{i:05d}" for i in range(symbols)]
+    df = pd.DataFrame({"symbol": names, "current_price": [100.0] * symbols})
+    opinions = {
+        "llm_opinion": {name: f"BUY - RSI oversold ({i})" for i, name in enumerate(names)},
+        "llm_2_opinion": {name: f"HOLD - no clear signal ({i})" for i, name in enumerate(names)},
+    }
+    return df, opinions
+
+
+def per_symbol(df, opinions):
+    for column, by_symbol in opinions.items():
+        for symbol, opinion in by_symbol.items():
+            general.add_opinion(symbol, df, column, opinion)
+    return df
+
+
+def timed(fn, df, opinions):
+    start = time.perf_counter()
+    result = fn(df.copy(), opinions)
+    return (time.perf_counter() - start) * 1000, result
+
+
+def main(symbols=10_000):
+    logging.disable(logging.INFO)
+    df, opinions = make_run(symbols)
+    old_ms, old = timed(per_symbol, df, opinions)
+    new_ms, new = timed(general.add_opinions, df, opinions)
+    pd.testing.assert_frame_equal(old, new)
+    print(f"{symbols} symbols x {len(opinions)} columns: add_opinion per symbol {old_ms:.0f} ms, "
+          f"add_opinions {new_ms:.1f} ms ({old_ms / new_ms:.0f}x)")
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,91 @@
+"""
+Query time of the analysis history for "signals of one symbol over time" and "BUYs in a date range",
+against reading the whole history and filtering it in pandas.
+
+Run from the project root: python benchmarks/bench_analysis_history.py [days] [symbols]
+"""
+import os
+import sys
+import time
+import logging
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as ds
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from tools import analysis_history as history
+
+
+def make_run(day, symbols, rng):
+    run_at = datetime(2023, 1, 2, 17, 0, tzinfo=timezone.utc) + timedelta(days=day)
+    rows = len(symbols)
+    return pd.DataFrame({
+        "run_id": f"run{day}",
+        "run_at": pd.Timestamp(run_at),
+        "run_date": run_at.date(),
+        "symbol": symbols,
+        "current_price": rng.uniform(5, 500, rows).round(2),
+        "change_percent": rng.normal(0, 2, rows).round(3),
+        "evaluation": rng.choice(["BUY", "HOLD", "SELL"], rows),
+        "confidence": rng.uniform(-1, 1, rows).round(2),
+        "signals": '{"RSI": "BUY", "MACD": "SELL", "SMA200": "BUY"}',
+        "llm_opinion": "HOLD - RSI neutral, MACD flat, price above SMA200",
+        "llm_2_opinion": None,
+        "action": rng.choice(["BUY", "HOLD", "SELL"], rows, p=[0.05, 0.85, 0.1]),
+        "llm_model": "gpt-4o",
+        "llm_latency_ms": rng.uniform(300, 3000, rows).round(1),
+    })
+
+
+def best_of(fn, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings), result
+
+
+def main(days=730, symbols=2000):
+    logging.disable(logging.INFO)
+    rng = np.random.default_rng(0)
+    names = [f"SYM{i:05d}" for i in range(symbols)]
+    last_day = (datetime(2023, 1, 2) + timedelta(days=days - 1)).date()
+
+    with tempfile.TemporaryDirectory() as root:
+        started = time.perf_counter()
+        for day in range(days):
+            history.append_run(make_run(day, names, rng), root)
+        print(f"{days} daily runs x {symbols} symbols appended in {time.perf_counter() - started:.1f} s")
+
+        def full_scan_symbol():
+            df = ds.dataset(root, format="parquet").to_table().to_pandas()
+            return df[df["symbol"] == "SYM01234"]
+
+        def full_scan_buys():
+            df = ds.dataset(root, format="parquet").to_table().to_pandas()
+            return df[(df["action"] == "BUY") & (df["run_date"] >= last_day - timedelta(days=29))]
+
+        queries = {
+            "symbol over time": lambda: history.get_symbol_history("SYM01234", root=root,
+                                                                   columns=["run_date", "confidence", "action"]),
+            "BUYs, last 30 days": lambda: history.get_buys(start=last_day - timedelta(days=29), end=last_day, root=root),
+        }
+        full_ms, _ = best_of(full_scan_symbol, repeat=1)
+        print(f"{'full read + pandas filter':<36} {full_ms:>9.1f} ms")
+
+        for label in ("daily files", "compacted months"):
+            if label == "compacted months":
+                started = time.perf_counter()
+                months = history.compact(root, keep_month=last_day)
+                print(f"compacted {months} months in {time.perf_counter() - started:.1f} s")
+            for name, query in queries.items():
+                elapsed, df = best_of(query)
+                print(f"{name + ' (' + label + ')':<36} {elapsed:>9.1f} ms  {len(df)} rows")
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:3]])
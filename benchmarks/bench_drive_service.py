@@ -0,0 +1,66 @@
+"""
+Per-call overhead of getting the Drive service: previous behaviour (parse credentials + build() on
+every load/save) vs the cached service, using a generated service account key (no network needed).
+
+Run from the project root: python benchmarks/bench_drive_service.py [calls]
+"""
+import os
+import sys
+import json
+import time
+import statistics
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from google.oauth2 import service_account
+from googleapiclient.discovery import build
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from tools import google_handler
+
+
+def fake_credentials_json():
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                            serialization.NoEncryption()).decode("ascii")
+    return json.dumps({
+        "type": "service_account", "project_id": "bench", "private_key_id": "1", "private_key": pem,
+        "client_email": "bench@bench.iam.gserviceaccount.com", "client_id": "1",
+        "token_uri": "https://oauth2.googleapis.com/token",
+    })
+
+
+def previous_get_drive_service():
+    creds_dict = json.loads(os.environ["GDRIVE_CREDENTIALS_JSON"])
+    credentials = service_account.Credentials.from_service_account_info(
+        creds_dict, scopes=["https://www.googleapis.com/auth/drive"]
+    )
+    return build("drive", "v3", credentials=credentials)
+
+
+def timed(fn, calls):
+    samples = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def report(label, samples):
+    print(f"{label:<34} mean={statistics.mean(samples):8.3f} ms  p50={statistics.median(samples):8.3f} ms")
+
+
+def main(calls=50):
+    os.environ["GDRIVE_CREDENTIALS_JSON"] = fake_credentials_json()
+    google_handler.reset_drive_service()
+
+    report("build() per call (previous)", timed(previous_get_drive_service, calls))
+    first = timed(google_handler.get_drive_service, 1)
+    report("cached service, first call", first)
+    report("cached service, next calls", timed(google_handler.get_drive_service, calls))
+    print("A main.py run gets the service 4+ times (1 load + 3 saves); HTTP connections are reused per thread.")
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:2]])
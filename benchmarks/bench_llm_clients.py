@@ -0,0 +1,84 @@
+"""
+Per-call latency of the LLM clients against a local stub server.
+
+Compares the old behaviour (a new OpenAI/httpx client or a bare requests.post per call)
+with the pooled clients from llms.client_manager.
+
+Run from the project root: python benchmarks/bench_llm_clients.py [calls]
+"""
+import os
+import sys
+import time
+import statistics
+
+import httpx
+import requests
+from openai import OpenAI
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from tools import llms
+from tools.llm_stub_server import start_stub_server, stop_stub_server
+
+MESSAGES = [
+    {"role": "system", "content": llms.system_prompt},
+    {"role": "user", "content": "RSI = 45\nMACD = 1.2"}
+]
+
+
+def timed(fn, calls):
+    samples = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def report(label, samples):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{label:<28} mean={statistics.mean(samples):7.2f} ms  p50={statistics.median(samples):7.2f} ms  p95={p95:7.2f} ms")
+
+
+def main(calls=200):
+    server = start_stub_server()
+    os.environ["OPENAI_API_KEY"] = "stub-key"
+    base_url = f"{server.base_url}/v1"
+    deepseek_url = f"{server.base_url}/chat/completions"
+
+    def openai_per_call():
+        client = OpenAI(api_key="stub-key", base_url=base_url, http_client=httpx.Client(verify=False))
+        client.chat.completions.create(model="stub", messages=MESSAGES)
+
+    manager = llms.LLMClientManager()
+    os.environ["OPENAI_BASE_URL"] = base_url
+
+    def openai_pooled():
+        manager.get_openai_client().chat.completions.create(model="stub", messages=MESSAGES)
+
+    def deepseek_per_call():
+        requests.post(deepseek_url, json={"model": "stub", "messages": MESSAGES}).raise_for_status()
+
+    def deepseek_pooled():
+        manager.get_deepseek_session().post(
+            deepseek_url, json={"model": "stub", "messages": MESSAGES}, timeout=manager.timeout
+        ).raise_for_status()
+
+    try:
+        for label, fn in [
+            ("openai new client per call", openai_per_call),
+            ("openai pooled client", openai_pooled),
+            ("deepseek requests.post", deepseek_per_call),
+            ("deepseek pooled session", deepseek_pooled),
+        ]:
+            fn()  # warm-up
+            connections_before = server.stats["connections"]
+            report(label, timed(fn, calls))
+            print(f"{'':<28} connections opened: {server.stats['connections'] - connections_before}")
+    finally:
+        manager.close()
+        stop_stub_server(server)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,41 @@
+"""
+Estimated prompt tokens per symbol with the verbose and the compact signal encoding.
+
+Run from the project root: python benchmarks/bench_prompt_tokens.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from tools import llms
+
+# Signals as produced by custom_financial_calc.evaluate_buy_interest (rounded to 4 decimals)
+SIGNALS = {
+    "SMA_50": 412.3456, "SMA_200": 398.1234, "RSI": 55.1234, "MACD": 1.2345,
+    "MACD_Signal": 1.1234, "MACD_Hist": 0.1111, "MA50_Slope": 2.3456, "ROC_10": 0.0559,
+    "Volatility_20": 0.0317, "ATR_14": 9.307, "Breakout_20": 0.0,
+    "Monthly_10pct_Prob": 0.2739, "Current_Price": 415.26
+}
+PRICE = 415.26
+
+
+def measure(compact):
+    os.environ["LLM_COMPACT_PROMPT"] = "true" if compact else "false"
+    metrics = llms.format_metrics(SIGNALS, PRICE)
+    prompt = llms.generate_prompt(metrics, PRICE)
+    return llms.estimate_tokens(metrics), llms.estimate_tokens(llms.system_prompt) + llms.estimate_tokens(prompt)
+
+
+def main():
+    os.environ.setdefault("REVENUE_PERCENTAGE", "10")
+    verbose_metrics, verbose_total = measure(compact=False)
+    compact_metrics, compact_total = measure(compact=True)
+    print(f"{'encoding':<10} {'metrics':>8} {'prompt':>8}")
+    print(f"{'verbose':<10} {verbose_metrics:>8} {verbose_total:>8}")
+    print(f"{'compact':<10} {compact_metrics:>8} {compact_total:>8}")
+    print(f"reduction: {1 - compact_metrics / verbose_metrics:.0%} of metrics tokens, "
+          f"{1 - compact_total / verbose_total:.0%} of prompt tokens per symbol")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Ticks per second processed by the streaming take-profit monitor against the local trade stream.
+
+Targets are set out of reach so every trade goes through the full path
+(WebSocket frame, JSON decode, target check) without ending the stream.
+
+Run from the project root: python benchmarks/bench_quote_stream.py [symbols] [messages]
+"""
+import os
+import sys
+import time
+import logging
+
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from tools import finnhub_client
+from tools.finnhub_ws_stub import start_stub_stream_server, stop_stub_stream_server
+
+
+def make_transactions(symbols):
+    return pd.DataFrame({
+        "symbol": [f"SYM{i}" for i in range(symbols)],
+        "buy_value": [100.0] * symbols,
+        "buy_date": [pd.Timestamp.today().date()] * symbols,
+        "sell_value": [None] * symbols,
+    })
+
+
+def run(symbols, messages, trades_per_message):
+    server = start_stub_stream_server(max_messages=messages, trades_per_message=trades_per_message, seed=1)
+    try:
+        # 1000% target: never reached by the random walk
+        monitor = finnhub_client.TakeProfitMonitor(make_transactions(symbols), 1000, lambda df, sold: None)
+        started = time.perf_counter()
+        stats = finnhub_client.stream_take_profit(monitor, url=server.url)
+        elapsed = time.perf_counter() - started
+    finally:
+        stop_stub_stream_server(server)
+    return stats["ticks"], elapsed
+
+
+def main(symbols=50, messages=2000):
+    # The stub ends each run by closing the stream, which the client logs as a warning
+    logging.disable(logging.WARNING)
+    print(f"{symbols} symbols, {messages} messages per run")
+    print(f"{'trades/msg':>10} {'ticks':>8} {'seconds':>8} {'ticks/s':>10}")
+    for trades_per_message in (1, 10, 50):
+        ticks, elapsed = run(symbols, messages, trades_per_message)
+        print(f"{trades_per_message:>10} {ticks:>8} {elapsed:>8.2f} {ticks / elapsed:>10.0f}")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:3]]
+    main(*args)
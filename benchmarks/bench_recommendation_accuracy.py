@@ -0,0 +1,79 @@
+"""
+Walk-forward accuracy over years of synthetic daily prices: the vectorized evaluation of all
+recommendations at once against a per-recommendation pandas loop.
+
+Run from the project root: python benchmarks/bench_recommendation_accuracy.py [symbols] [years] [recommendations]
+"""
+import os
+import sys
+import time
+import logging
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from tools import recommendation_accuracy as accuracy
+
+
+def make_prices(symbols, years, rng):
+    dates = pd.bdate_range("2020-01-01", periods=252 * years)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, (symbols, len(dates))), axis=1))
+    return pd.DataFrame({
+        "symbol": np.repeat([f"SYM{i:04d}" for i in range(symbols)], len(dates)),
+        "date": np.tile(dates, symbols),
+        "close": close.ravel(),
+        "high": (close * 1.01).ravel(),
+        "low": (close * 0.99).ravel(),
+    })
+
+
+def make_recommendations(prices, count, rng):
+    rows = prices.sample(count, random_state=0)
+    return pd.DataFrame({
+        "symbol": rows["symbol"].to_numpy(),
+        "buy_date": rows["date"].dt.strftime("%Y-%m-%d 18:00").to_numpy(),
+        "buy_value": rows["close"].to_numpy(),
+        "source": rng.choice(["LLM1", "LLM2", "CUSTOM", "FINAL"], count),
+    })
+
+
+def loop_evaluate(recommendations, prices, revenue_percentage):
+    # One recommendation at a time: filter the symbol's bars after the buy and scan them
+    by_symbol = {symbol: df.sort_values("date") for symbol, df in prices.groupby("symbol")}
+    rows = []
+    for rec in recommendations.itertuples():
+        bars = by_symbol[rec.symbol]
+        bars = bars[bars["date"] > pd.Timestamp(rec.buy_date).normalize()].head(accuracy.MAX_DAYS)
+        target = rec.buy_value * (1 + revenue_percentage / 100)
+        hits = bars[bars["high"] >= target]
+        rows.append({"reached_target": not hits.empty,
+                     "days_to_target": (hits["date"].iloc[0] - pd.Timestamp(rec.buy_date).normalize()).days
+                     if not hits.empty else np.nan})
+    return pd.DataFrame(rows)
+
+
+def main(symbols=2000, years=5, recommendations=50_000):
+    logging.disable(logging.INFO)
+    rng = np.random.default_rng(0)
+    prices = make_prices(symbols, years, rng)
+    recs = make_recommendations(prices, recommendations, rng)
+    print(f"{len(prices):,} daily bars ({symbols} symbols x {years} years), {len(recs):,} recommendations")
+
+    started = time.perf_counter()
+    results = accuracy.evaluate_recommendations(recs, prices, 10)
+    summary = accuracy.summarize_by_source(results)
+    vectorized = time.perf_counter() - started
+    print(f"vectorized: {vectorized:.2f} s")
+    print(summary.to_string())
+
+    sample = recs.head(500)
+    started = time.perf_counter()
+    loop_results = loop_evaluate(sample, prices, 10)
+    loop = (time.perf_counter() - started) * len(recs) / len(sample)
+    print(f"per-recommendation loop: {loop:.1f} s (extrapolated from {len(sample)})")
+    assert (loop_results["reached_target"].to_numpy() == results["reached_target"].head(len(sample)).to_numpy()).all()
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:4]])
@@ -0,0 +1,56 @@
+"""
+Save/load time and file size of the local storage backend (Parquet vs CSV) for analysis-like frames,
+independent of Drive latency.
+
+Run from the project root: python benchmarks/bench_storage.py [rows]
+"""
+import os
+import sys
+import time
+import logging
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from tools import storage
+
+
+def make_analysis(rows):
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        "symbol": [f"SYM{i}" for i in range(rows)],
+        "current_price": rng.uniform(5, 500, rows).round(2),
+        "change_percent": rng.normal(0, 2, rows).round(3),
+        "llm_opinion": ["HOLD - RSI neutral, MACD flat, price above SMA200"] * rows,
+        "action": rng.choice(["BUY", "HOLD", "SELL"], rows),
+        "buy_date": ["2025-09-01 10:00"] * rows,
+    })
+
+
+def best_of(fn, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings)
+
+
+def main(rows=100_000):
+    logging.disable(logging.INFO)
+    df = make_analysis(rows)
+    print(f"{rows} rows")
+    print(f"{'format':<8} {'save':>10} {'load':>10} {'size':>10}")
+    with tempfile.TemporaryDirectory() as root:
+        for file_format in storage.LOCAL_FORMATS:
+            backend = storage.LocalStorage(root, file_format, keep_versions=0)
+            save_ms = best_of(lambda: backend.save_frame(df, "analysis"))
+            load_ms = best_of(lambda: backend.load_frame("analysis"))
+            size_kb = os.path.getsize(os.path.join(root, f"analysis.{file_format}")) / 1024
+            print(f"{file_format:<8} {save_ms:>7.1f} ms {load_ms:>7.1f} ms {size_kb:>7.0f} KB")
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:2]])
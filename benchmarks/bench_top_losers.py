@@ -0,0 +1,57 @@
+"""
+Top-N losers selection: previous loop + full sort vs the vectorized mask + partial selection.
+
+Run from the project root: python benchmarks/bench_top_losers.py
+"""
+import os
+import sys
+import time
+import logging
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from tools import finnhub_client
+
+
+def previous_losers(symbols, top_n=None):
+    losers = []
+    for symbol in symbols:
+        try:
+            change_percent = symbol['change_percent']
+            if change_percent is not None and change_percent < 0:
+                losers.append(symbol)
+        except Exception:
+            pass
+    losers.sort(key=lambda x: x["change_percent"])
+    return losers if top_n is None else losers[:top_n]
+
+
+def best_of(fn, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings), result
+
+
+def main():
+    logging.disable(logging.INFO)
+    rng = np.random.default_rng(42)
+    top_n = 10
+    print(f"{'symbols':>8} {'previous':>12} {'vectorized':>12} {'selection only':>15}")
+    for size in (1_000, 10_000, 100_000):
+        changes = rng.normal(0, 2, size).round(2)
+        symbols = [{"symbol": f"S{i}", "current_price": 100.0, "change_percent": float(c)}
+                   for i, c in enumerate(changes)]
+
+        previous_ms, expected = best_of(lambda: previous_losers(symbols, top_n))
+        vectorized_ms, result = best_of(lambda: finnhub_client.analyze_market_losers_from_interest_list(symbols, top_n))
+        selection_ms, _ = best_of(lambda: finnhub_client.select_top_losers(changes, top_n))
+        assert result == expected
+        print(f"{size:>8} {previous_ms:>9.2f} ms {vectorized_ms:>9.2f} ms {selection_ms:>12.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Load test of the LLM stage of the pipeline (main.enrich_analysis_df) against the local stub server.
+
+Synthetic symbols are split between N workers, each running enrich_analysis_df on its share,
+for every concurrency level given. Throughput and tail latency come from the LLM telemetry.
+
+Run from the project root, e.g.:
+    python benchmarks/load_test_pipeline.py --symbols 200 --concurrency 1 4 16 \\
+        --latency lognormal:300:0.5 --error-rate 0.02 --max-rps 40
+"""
+import os
+import sys
+import time
+import random
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import main as pipeline
+from tools import llms, llm_telemetry, run_metrics
+from tools.llm_stub_server import start_stub_server, stop_stub_server, hashed_responder
+
+
+def synthetic_analysis(count, seed=42):
+    """analyze_symbol-like results with random but reproducible signals."""
+    rng = random.Random(seed)
+    analysis = []
+    for i in range(count):
+        price = round(rng.uniform(10, 500), 2)
+        analysis.append({
+            "symbol": f"SYM{i:04d}",
+            "current_price": price,
+            "metrics": {
+                "evaluation": rng.choice(["BUY", "HOLD", "SELL"]),
+                "confidence": round(rng.uniform(-1, 1), 2),
+                "signals": {
+                    "SMA_50": round(price * rng.uniform(0.9, 1.1), 4),
+                    "SMA_200": round(price * rng.uniform(0.8, 1.2), 4),
+                    "RSI": round(rng.uniform(10, 90), 4),
+                    "MACD": round(rng.uniform(-5, 5), 4),
+                    "ROC_10": round(rng.uniform(-0.2, 0.2), 4),
+                    "Current_Price": price,
+                },
+            },
+        })
+    return analysis
+
+
+def run_level(analysis, concurrency, options):
+    llm_telemetry.reset()
+    run_metrics.reset()
+    llms.client_manager.configure(pool_size=concurrency)
+
+    chunks = [analysis[i::concurrency] for i in range(concurrency)]
+
+    def work(chunk):
+        df = pd.DataFrame([{"symbol": item["symbol"], "current_price": item["current_price"]} for item in chunk])
+        return pipeline.enrich_analysis_df(df, chunk, options.force_opinion, llm_batch_size=options.batch_size,
+                                           confidence_band=options.confidence_band,
+                                           second_opinion=options.second_opinion, llm_deadline=options.deadline)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(work, [chunk for chunk in chunks if chunk]))
+    wall = time.perf_counter() - started
+
+    records = llm_telemetry.get_records()
+    latencies = [record["latency_ms"] for record in records if record["latency_ms"] is not None]
+    actions = pd.concat(results)["action"].value_counts().to_dict()
+    return {
+        "concurrency": concurrency,
+        "wall_s": round(wall, 2),
+        "symbols_per_s": round(len(analysis) / wall, 1),
+        "calls": len(records),
+        "errors": sum(1 for record in records if record["status"] != "ok"),
+        "retries": sum(record["retries"] for record in records),
+        "p50_ms": run_metrics.percentile(latencies, 50),
+        "p95_ms": run_metrics.percentile(latencies, 95),
+        "p99_ms": run_metrics.percentile(latencies, 99),
+        "actions": actions,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="load test the LLM stage against a local stub server")
+    parser.add_argument("--symbols", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--latency", default="lognormal:200:0.5")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--max-rps", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--second-opinion", action="store_true")
+    parser.add_argument("--deadline", type=float, default=30.0)
+    parser.add_argument("--confidence-band", type=llms.get_confidence_band, default=None)
+    parser.add_argument("--force-opinion", default="LLM1")
+    options = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    server = start_stub_server(responder=hashed_responder, latency=options.latency, error_rate=options.error_rate,
+                               max_rps=options.max_rps, seed=options.seed)
+    os.environ.update({
+        "OPENAI_API_KEY": "stub-key",
+        "DEEPKSEEK_API_KEY": "stub-key",
+        "GPT_MODEL_NAME": "gpt-4o-mini",
+        "REVENUE_PERCENTAGE": os.getenv("REVENUE_PERCENTAGE") or "10",
+        "OPENAI_BASE_URL": f"{server.base_url}/v1",
+        "DEEPSEEK_API_URL": f"{server.base_url}/chat/completions",
+    })
+
+    analysis = synthetic_analysis(options.symbols, options.seed)
+    print(f"{options.symbols} symbols, latency {options.latency}, error rate {options.error_rate}, "
+          f"max rps {options.max_rps}")
+    print(f"{'conc':>4} {'wall s':>7} {'sym/s':>7} {'calls':>6} {'errors':>6} {'retries':>7} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    try:
+        for concurrency in options.concurrency:
+            result = run_level(analysis, concurrency, options)
+            print(f"{result['concurrency']:>4} {result['wall_s']:>7} {result['symbols_per_s']:>7} "
+                  f"{result['calls']:>6} {result['errors']:>6} {result['retries']:>7} "
+                  f"{result['p50_ms']:>8} {result['p95_ms']:>8} {result['p99_ms']:>8}")
+        print(f"stub server stats: {server.stats}")
+    finally:
+        llms.client_manager.close()
+        stop_stub_server(server)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,13 @@
 from dotenv import load_dotenv
 import ast
+import json
 import argparse
 import os
 import pandas as pd
 import logging
-from tools import google_handler, finnhub_client, historicals, custom_financial_calc as cfc, general, llms
+from tools import google_handler, finnhub_client, historicals, custom_financial_calc as cfc, general, llms, run_metrics, llm_telemetry, screening, transactions_ledger, storage, analysis_history, recommendation_accuracy, symbol_registry
 import numpy as np
+import time
 
 
 def load_config():
@@ -18,27 +20,67 @@ def load_config():
     
     logging.basicConfig(level=log_level)
     logger = logging.getLogger(__name__)
+    storage_backend = storage.get_storage()
     
     return {
         "logger": logger,
+        "storage": storage_backend,
         "symbols_interest_list": ast.literal_eval(os.environ.get("SYMBOLS_INTEREST_LIST", "[]")),
         "revenue_percentage": os.environ.get("REVENUE_PERCENTAGE"),
         "max_records": int(os.environ.get("TRANSACTIONS_MAX_RECORDS", 100)),
-        "transactions_file_id": os.environ.get("GDRIVE_FILE_ID"),
-        "buy_file_id": os.environ.get("BUY_RECOMMENDATIONS_ID"),
-        "analysis_file_id": os.environ.get("ANALYSIS_FILE_ID"),
+        "transactions_file_id": os.environ.get("GDRIVE_FILE_ID") or storage_backend.default_file_id("transactions"),
+        "transactions_delta_file_id": os.environ.get("GDRIVE_TRANSACTIONS_DELTA_ID"),
+        "buy_file_id": os.environ.get("BUY_RECOMMENDATIONS_ID") or storage_backend.default_file_id("buy_recommendations"),
+        "analysis_file_id": os.environ.get("ANALYSIS_FILE_ID") or storage_backend.default_file_id("analysis"),
         "force_opinion": os.environ.get("FORCE_OPINION"),
+        "llm_batch_size": int(os.environ.get("LLM_BATCH_SIZE", 1)),
+        "llm_mode": os.environ.get("LLM_MODE", "sync").strip().lower(),
+        "llm_confidence_band": llms.get_confidence_band(os.environ.get("LLM_CONFIDENCE_BAND", "")),
+        "llm_second_opinion": os.environ.get("LLM_SECOND_OPINION", "false").strip().lower() in ("true", "1", "yes"),
+        "llm_deadline_seconds": float(os.environ.get("LLM_DEADLINE_SECONDS") or 60),
+        "llm_telemetry_file": os.environ.get("LLM_TELEMETRY_FILE") or "llm_telemetry.json",
+        "consensus_policy": os.environ.get("CONSENSUS_POLICY") or "unanimous",
+        "consensus_weights": json.loads(os.environ.get("CONSENSUS_WEIGHTS") or "{}"),
+        "screen_top_k": int(os.environ.get("SCREEN_TOP_K") or 0),
+        "screen_universe_file": os.environ.get("SCREEN_UNIVERSE_FILE", ""),
+        "analysis_history_dir": os.environ.get("ANALYSIS_HISTORY_DIR", "history"),
+        "analysis_history_file_id": os.environ.get("ANALYSIS_HISTORY_FILE_ID") or storage_backend.default_file_id("analysis_history"),
     }
 
+def get_candidates(config):
+    """
+    Fetch the quotes and choose the symbols that get a full evaluation.
+
+    With SCREEN_TOP_K set, the screening universe (SCREEN_UNIVERSE_FILE, or SYMBOLS_INTEREST_LIST)
+    is ranked by the cheap quote-based stage and only the top K survivors are returned as candidates;
+    otherwise every symbol of SYMBOLS_INTEREST_LIST is a candidate.
+
+    Returns:
+        (symbols_info_list, candidates): all quotes (used to update transactions) and the candidates
+    """
+    symbols = config["symbols_interest_list"]
+    if config["screen_top_k"] and config["screen_universe_file"]:
+        symbols = list(dict.fromkeys(screening.load_universe(config["screen_universe_file"]) + symbols))
+
+    started = time.perf_counter()
+    symbols_info_list = finnhub_client.get_symbols_info(symbols)
+    if not config["screen_top_k"]:
+        return symbols_info_list, symbols_info_list
+
+    run_metrics.set_value("screening.quotes_ms", round((time.perf_counter() - started) * 1000, 1))
+    candidates, _ = screening.screen_symbols(symbols_info_list, config["screen_top_k"],
+                                             indicators=screening.load_indicator_cache())
+    return symbols_info_list, candidates
+
 def analyze_symbol(symbol_data):
     """Analyze a single stock symbol."""
     symbol = symbol_data['symbol']
     current_price = symbol_data['current_price']
-    #normalize symbol in cases like: RHM.DE
-    symbol = symbol.split(".")[0]
+    # Provider ticker from the symbol registry (RHM.DE -> RHM); results keep the listed symbol
+    ticker = symbol_registry.get_registry().provider_ticker(symbol, "historicals")
 
-    hist_data = historicals.get_historical_data(symbol)
-    metrics = cfc.evaluate_buy_interest(symbol, hist_data, current_price)
+    hist_data = historicals.get_historical_data(ticker)
+    metrics = cfc.evaluate_buy_interest(ticker, hist_data, current_price)
 
     return {
         "symbol": symbol,
@@ -46,55 +88,257 @@ def analyze_symbol(symbol_data):
         "metrics": metrics,
     }
 
-def enrich_analysis_df(df, analysis, force_opinion):
-    """Add analysis opinions to the DataFrame."""
+def is_evaluation_failed(metrics):
+    return "failed" in str(metrics.get("evaluation", "")).lower()
+
+def enrich_analysis_df(df, analysis, force_opinion, llm_batch_size=1, llm_mode="sync", confidence_band=None,
+                       second_opinion=False, llm_deadline=None, consensus_policy="unanimous", consensus_weights=None):
+    """
+    Add analysis opinions to the DataFrame and the final action (see add_llm_opinions).
+    Without force_opinion, the opinions are combined with consensus_policy (see general.resolve_consensus)
+    and their columns are dropped.
+    """
+    df = add_llm_opinions(df, analysis, llm_batch_size=llm_batch_size, llm_mode=llm_mode,
+                          confidence_band=confidence_band, second_opinion=second_opinion, llm_deadline=llm_deadline)
+    return general.generate_action_column(df, force_opinion, policy=consensus_policy, weights=consensus_weights)
+
+def add_llm_opinions(df, analysis, llm_batch_size=1, llm_mode="sync", confidence_band=None, second_opinion=False,
+                     llm_deadline=None):
+    """
+    Add the LLM opinions of the analyzed symbols to the DataFrame ('llm_opinion', and 'llm_2_opinion'
+    with second_opinion).
+
+    Only symbols whose confidence lies in confidence_band are sent to the LLM (all of them when None);
+    clear-cut ones keep the rule-based decision.
+    llm_mode 'batch_job' submits all prompts as one offline batch job (nightly runs);
+    otherwise symbols are queried synchronously, several per request when llm_batch_size > 1.
+    With second_opinion, DeepSeek answers go to 'llm_2_opinion'; every symbol's per-symbol calls run
+    concurrently and an answer missing the run's llm_deadline is left out.
+    """
+    opinions = {}
+    second_opinions = {}
+    llm_items = []
     for item in analysis:
-        symbol = item["symbol"]
         metrics = item["metrics"]
-
-        if "failed" not in metrics["evaluation"]:
-            llm_opinion = llms.get_gpt_signals_analysis(metrics["signals"], symbol, item["current_price"])
+        if is_evaluation_failed(metrics):
+            opinions[item["symbol"]] = "error: metrics not provided"
         else:
-            llm_opinion = "error: metrics not provided"
+            llm_items.append({
+                "symbol": item["symbol"],
+                "signals": metrics["signals"],
+                "current_price": item["current_price"],
+                "evaluation": metrics["evaluation"],
+                "confidence": metrics["confidence"],
+            })
+
+    llm_items, gated_opinions = llms.apply_confidence_gate(llm_items, confidence_band)
+    opinions.update(gated_opinions)
+    second_opinions.update(opinions)
 
-        general.add_opinion(symbol, df, "llm_opinion", llm_opinion)
+    batched = llm_mode == "batch_job" or llm_batch_size > 1
+    if second_opinion and llm_items:
+        # Every call of the run is submitted now and collected once, so llm_deadline bounds the whole run;
+        # with batched GPT answers only DeepSeek is asked per symbol, alongside the batches
+        pending = llms.submit_signals_analyses(llm_items, ("deepseek",) if batched else ("openai", "deepseek"),
+                                               deadline=llm_deadline)
 
-        # TODO: enhance manual calculations
-        #general.add_opinion(symbol, df, "manual_financial_analysis", metrics["evaluation"])
+    if llm_items and llm_mode == "batch_job":
+        opinions.update(llms.run_batch_job(llm_items))
+    elif llm_items and llm_batch_size > 1:
+        opinions.update(llms.get_gpt_batch_signals_analysis(llm_items, batch_size=llm_batch_size))
+    elif not second_opinion:
+        for item in llm_items:
+            opinions[item["symbol"]] = llms.get_gpt_signals_analysis(item["signals"], item["symbol"], item["current_price"])
 
-        # TODO: implement second LLM optinion
-        #general.add_opinion(symbol, df, "llm_2_opinion", llm_opinion)
+    if second_opinion:
+        if llm_items:
+            answers = llms.collect_signals_analyses(pending)
+            opinions.update(answers.get("openai", {}))
+            second_opinions.update(answers["deepseek"])
+        logging.getLogger(__name__).info(f"LLM latency report: {llms.get_latency_report()}")
 
-    return general.generate_action_column(df, force_opinion)
+        # Errors count as missing answers so decide_final_action keeps the other model's decision
+        opinions = {symbol: opinion if llms.is_valid_opinion(opinion) else None for symbol, opinion in opinions.items()}
+        second_opinions = {symbol: opinion if llms.is_valid_opinion(opinion) else None
+                           for symbol, opinion in second_opinions.items()}
 
-def update_and_save_transactions(config, analysis_df, buy_df, now_madrid):
-    transactions_df = google_handler.load_data(config["transactions_file_id"])
+    # All opinions are set at once (one indexed lookup per column)
+    symbols = [item["symbol"] for item in analysis]
+    opinion_columns = {"llm_opinion": {symbol: opinions[symbol] for symbol in symbols}}
+
+    # TODO: enhance manual calculations
+    #opinion_columns["manual_financial_analysis"] = {item["symbol"]: item["metrics"]["evaluation"] for item in analysis}
+
+    if second_opinion:
+        opinion_columns["llm_2_opinion"] = {symbol: second_opinions[symbol] for symbol in symbols}
+    return general.add_opinions(df, opinion_columns)
+
+def load_ledger(config):
+    """
+    Load the transactions ledger.
+
+    Returns:
+        (snapshot_df, log_df, current_df): the snapshot file, the delta log (None when
+        GDRIVE_TRANSACTIONS_DELTA_ID is not set) and the current ledger (snapshot + log)
+    """
+    storage_backend = config["storage"]
+    transactions_df = storage_backend.load_frame(config["transactions_file_id"])
+    if transactions_df is None:
+        # First run of a new storage (e.g. STORAGE_BACKEND=local on an empty directory): start an empty
+        # ledger. A ledger that exists but can't be read must never be replaced by an empty one.
+        if storage_backend.exists(config["transactions_file_id"]):
+            raise Exception("❌ Transactions file could not be loaded")
+        logging.getLogger(__name__).info("No transactions file yet, starting an empty ledger")
+        transactions_df = transactions_ledger.empty_ledger()
+    if not config.get("transactions_delta_file_id"):
+        return transactions_df, None, transactions_df
+
+    log_df = storage_backend.load_frame(config["transactions_delta_file_id"])
+    if log_df is None:
+        # Never start a new log over an unreadable one: its entries would be lost
+        raise Exception("❌ Transactions delta log could not be loaded (it needs at least the header row "
+                        f"{','.join(transactions_ledger.DELTA_COLUMNS)})")
+    return transactions_df, log_df, transactions_ledger.apply_log(transactions_df, log_df)
+
+def update_transactions_df(config, analysis_df, buy_df):
+    """
+    Update the transactions ledger with the run's prices and BUY recommendations.
+
+    Returns:
+        (frames, followup_frames): ledger files to save with the other outputs, and files that may
+        only be saved once those succeeded (name -> (DataFrame, file_id))
+    """
+    transactions_df, log_df, current_df = load_ledger(config)
     update_df = pd.DataFrame(analysis_df)
 
-    trans_updated_df = google_handler.update_transactions(update_df, transactions_df, config["revenue_percentage"])
+    if log_df is None:
+        # Full snapshot rewrite
+        trans_updated_df = google_handler.update_transactions(update_df, transactions_df, config["revenue_percentage"])
+        final_df = pd.concat([trans_updated_df, buy_df], ignore_index=True)\
+                     .sort_values(by='buy_date', ascending=False).head(config["max_records"])
+        return {"transactions": (final_df, config["transactions_file_id"])}, {}
+
+    # Delta log: the snapshot only changes on compaction, normal runs upload the (small) log
+    trans_updated_df = google_handler.update_transactions(update_df, current_df, config["revenue_percentage"])
+
+    entries = transactions_ledger.close_entries(current_df, trans_updated_df) + transactions_ledger.insert_entries(buy_df)
+    log_df = transactions_ledger.append_entries(log_df, entries)
+    run_metrics.set_value("transactions.delta_entries", len(entries))
+
+    if transactions_ledger.needs_compaction(log_df):
+        snapshot_df, log_df = transactions_ledger.compact(transactions_df, log_df)
+        # The log is cleared only after the new snapshot is saved (replaying it is harmless, losing it is not)
+        return {"transactions": (snapshot_df, config["transactions_file_id"])}, \
+               {"transactions_delta": (log_df, config["transactions_delta_file_id"])}
+    return {"transactions_delta": (log_df, config["transactions_delta_file_id"])}, {}
 
-    final_df = pd.concat([trans_updated_df, buy_df], ignore_index=True)\
-                 .sort_values(by='buy_date', ascending=False).head(config["max_records"])
+def monitor_take_profit(config, duration=None):
+    """Streaming mode: sell open transactions as soon as a trade reaches the revenue target."""
+    _, log, transactions_df = load_ledger(config)
 
-    google_handler.save_dataframe_file_id(final_df, config["transactions_file_id"])
+    def save_ledger(df, sold):
+        nonlocal log
+        config.get("logger").info(f"Saving {len(sold)} new sales...")
+        if log is None:
+            config["storage"].save_frame(df, config["transactions_file_id"])
+        else:
+            log = transactions_ledger.append_entries(log, transactions_ledger.close_entries_for_rows(df.loc[sold]))
+            config["storage"].save_frame(log, config["transactions_delta_file_id"])
+
+    monitor = finnhub_client.TakeProfitMonitor(transactions_df, config["revenue_percentage"], save_ledger)
+    return finnhub_client.stream_take_profit(monitor, duration=duration)
+
+def save_outputs(ledger_frames, buy_df, analysis_df, config, followup_frames=None):
+    """Upload the output files concurrently; fail the run if any of them could not be saved."""
+    results = _save_frames(config["storage"], {
+        **ledger_frames,
+        "buy_recommendations": (buy_df, config["buy_file_id"]),
+        "analysis": (analysis_df, config["analysis_file_id"]),
+    })
+    if followup_frames:
+        results.update(_save_frames(config["storage"], followup_frames))
+    return results
+
+def _save_frames(storage_backend, frames):
+    results = storage_backend.save_frames(frames)
+    for name, result in results.items():
+        if result["upload_ms"] is not None:
+            run_metrics.set_value(f"storage.save.{name}_ms", result["upload_ms"])
+
+    failed = [name for name, result in results.items() if result["status"] != "ok"]
+    if failed:
+        raise Exception(f"❌ Error saving outputs: {', '.join(failed)}")
+    return results
 
-def save_outputs(buy_df, analysis_df, config):
-    google_handler.save_dataframe_file_id(buy_df, config["buy_file_id"])
-    google_handler.save_dataframe_file_id(analysis_df, config["analysis_file_id"])
+def restore_history(config):
+    """
+    Bring the local analysis history up to date with its stored copy (ANALYSIS_HISTORY_FILE_ID).
+
+    Returns:
+        True when the stored copy can be saved over afterwards
+    """
+    file_id = config["analysis_history_file_id"]
+    if not file_id:
+        config.get("logger").warning(f"ANALYSIS_HISTORY_FILE_ID not set: the analysis history only lives in {config['analysis_history_dir']}")
+        return False
+    return analysis_history.restore_missing_runs(config["storage"], file_id, root=config["analysis_history_dir"])
+
+def record_history(config, analysis_df, analysis_results):
+    """
+    Append the run to the analysis history and save the history back to its stored copy, so the local
+    directory (cached between CI runs) is only an accelerator.
+    """
+    can_save = restore_history(config)
+    analysis_history.record_run(analysis_df, analysis_results, llm_telemetry.get_records(),
+                                root=config["analysis_history_dir"])
+    if can_save:
+        analysis_history.save_to_storage(config["storage"], config["analysis_history_file_id"],
+                                         root=config["analysis_history_dir"])
+
+def report_accuracy(config, start=None):
+    """
+    Walk-forward accuracy of the BUY recommendations kept in the analysis history, per decision source
+    (LLM1, LLM2, CUSTOM and the FINAL action): revenue target hit rate, days to target, forward returns
+    and drawdowns, against the daily prices that followed each recommendation.
+    """
+    logger = config.get("logger")
+    restore_history(config)
+    history_df = analysis_history.query_history(start=start, root=config["analysis_history_dir"])
+    recommendations = recommendation_accuracy.build_recommendations(history_df)
+    if recommendations.empty:
+        logger.warning("No BUY recommendations in the analysis history yet")
+        return None
+
+    prices = recommendation_accuracy.load_price_history(recommendations["symbol"].unique())
+    results = recommendation_accuracy.evaluate_recommendations(recommendations, prices, config["revenue_percentage"] or 0)
+    summary = recommendation_accuracy.summarize_by_source(results)
+    logger.info(f"✅ Accuracy of {len(recommendations)} recommendations:\n{summary.to_string()}")
+    return summary
 
 def main(show_dataframes=False):
 
     config = load_config()
     now_madrid = general.get_current_time_madrid()
 
-    symbols_info_list = finnhub_client.get_symbols_info(config["symbols_interest_list"])
-    analysis_df = pd.DataFrame(symbols_info_list)
+    symbols_info_list, candidates = get_candidates(config)
+    analysis_df = pd.DataFrame(candidates)
 
     # Analyze each symbol and collect analysis results
-    analysis_results = [analyze_symbol(data) for data in symbols_info_list]
+    stage2_started = time.perf_counter()
+    analysis_results = [analyze_symbol(data) for data in candidates]
+    if config["screen_top_k"]:
+        screening.update_indicator_cache(analysis_results)
 
     # Enrich analysis_df with opinions
-    analysis_df = enrich_analysis_df(analysis_df, analysis_results, config["force_opinion"])
+    opinions_df = add_llm_opinions(analysis_df, analysis_results, llm_batch_size=config["llm_batch_size"],
+                                   llm_mode=config["llm_mode"], confidence_band=config["llm_confidence_band"],
+                                   second_opinion=config["llm_second_opinion"],
+                                   llm_deadline=config["llm_deadline_seconds"])
+    # The default decision logic drops the opinion columns, which the analysis history keeps
+    analysis_df = general.generate_action_column(opinions_df.copy(), config["force_opinion"],
+                                                 policy=config["consensus_policy"], weights=config["consensus_weights"])
+    if config["screen_top_k"]:
+        run_metrics.set_value("screening.stage2_ms", round((time.perf_counter() - stage2_started) * 1000, 1))
 
     # Filter to only BUY recommendations
     buy_df = analysis_df[analysis_df['action'] == 'BUY'].copy()
@@ -106,9 +350,18 @@ def main(show_dataframes=False):
     buy_df = general.add_urls_column(buy_df)
 
     # Update and save all outputs
-    update_and_save_transactions(config, symbols_info_list, buy_df, now_madrid)
-    save_outputs(buy_df, analysis_df, config)
+    ledger_frames, followup_frames = update_transactions_df(config, symbols_info_list, buy_df)
+    save_outputs(ledger_frames, buy_df, analysis_df, config, followup_frames)
+
+    # Keep every run in the analysis history (the Drive files only hold the latest one)
+    if config["analysis_history_dir"]:
+        try:
+            record_history(config, opinions_df.assign(action=analysis_df["action"]), analysis_results)
+        except Exception as e:
+            config.get("logger").error(f"❌ Error recording the analysis history: {e}")
 
+    llm_telemetry.save_summary(config["llm_telemetry_file"])
+    run_metrics.log_summary()
     config.get("logger").info("✅ successfully run main")
     if show_dataframes:
         print("\n--- DataFrame Analysis ---")
@@ -121,5 +374,32 @@ if __name__ == "__main__":
         action="store_true",
         help="show final DFs for testing/debug"
     )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="monitor open transactions with streamed trades and sell at the revenue target"
+    )
+    parser.add_argument(
+        "--stream-minutes",
+        type=float,
+        default=None,
+        help="stop streaming after this many minutes (default: until every position is sold)"
+    )
+    parser.add_argument(
+        "--accuracy",
+        action="store_true",
+        help="report the walk-forward accuracy of the recommendations in the analysis history"
+    )
+    parser.add_argument(
+        "--since",
+        default=None,
+        help="only evaluate recommendations from this date on (YYYY-MM-DD, with --accuracy)"
+    )
     args = parser.parse_args()
-    main(show_dataframes=args.test)
\ No newline at end of file
+    if args.accuracy:
+        report_accuracy(load_config(), start=args.since)
+    elif args.stream:
+        config = load_config()
+        monitor_take_profit(config, duration=args.stream_minutes * 60 if args.stream_minutes else None)
+    else:
+        main(show_dataframes=args.test)
\ No newline at end of file
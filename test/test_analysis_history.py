@@ -0,0 +1,129 @@
+from datetime import datetime, timezone
+import pandas as pd
+import main
+from tools import finnhub_client, llms, storage
+from tools import analysis_history as history
+
+
+def make_run(day, actions, month=9):
+    analysis_df = pd.DataFrame({
+        "symbol": ["AMD", "AAPL", "NVDA"],
+        "current_price": [140.0 + day, 150.0 + day, 100.0 + day],
+        "change_percent": [-1.0, -2.0, -3.0],
+        "llm_opinion": ["BUY - oversold", None, "HOLD"],
+        "action": actions,
+    })
+    analysis_results = [
+        {"symbol": "AMD", "metrics": {"evaluation": "BUY", "confidence": 0.5, "signals": {"RSI": "BUY"}}},
+        {"symbol": "AAPL", "metrics": {"evaluation": "HOLD", "confidence": 0.0, "signals": {"RSI": "NEUTRAL"}}},
+    ]
+    llm_records = [{"model": "gpt-4o", "symbols": ["AMD", "NVDA"], "latency_ms": 400.0}]
+    run_at = datetime(2025, month, day, 17, 0, tzinfo=timezone.utc)
+    return history.build_run_frame(analysis_df, analysis_results, llm_records, run_at=run_at)
+
+
+def test_build_run_frame():
+    run_df = make_run(1, ["BUY", "HOLD", "HOLD"])
+    assert list(run_df.columns) == history.HISTORY_SCHEMA.names
+    amd = run_df.set_index("symbol").loc["AMD"]
+    assert amd["confidence"] == 0.5 and amd["signals"] == '{"RSI": "BUY"}'
+    assert amd["llm_model"] == "gpt-4o" and amd["llm_latency_ms"] == 200.0
+    nvda = run_df.set_index("symbol").loc["NVDA"]
+    assert pd.isna(nvda["confidence"]) and pd.isna(nvda["signals"])
+
+
+def test_append_and_query(tmp_path):
+    for day, actions in ((1, ["BUY", "HOLD", "HOLD"]), (2, ["HOLD", "BUY", "SELL"]), (3, ["BUY", "HOLD", "BUY"])):
+        history.append_run(make_run(day, actions), tmp_path)
+    history.append_run(make_run(1, ["HOLD", "HOLD", "BUY"], month=10), tmp_path)
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["run_month=2025-09", "run_month=2025-10"]
+
+    amd = history.get_symbol_history("AMD", root=tmp_path, columns=["run_date", "current_price", "action"])
+    assert list(amd.columns) == ["run_date", "current_price", "action"]
+    assert amd["current_price"].tolist() == [141.0, 142.0, 143.0, 141.0]
+
+    buys = history.get_buys(start="2025-09-02", end="2025-09-30", root=tmp_path)
+    assert list(zip(buys["run_date"].astype(str), buys["symbol"])) == [
+        ("2025-09-02", "AAPL"), ("2025-09-03", "AMD"), ("2025-09-03", "NVDA")]
+
+    assert history.query_history(start="2026-01-01", root=tmp_path).empty
+    assert history.query_history(root=tmp_path / "missing").empty
+
+
+def test_compaction_keeps_rows_and_current_month(tmp_path):
+    for day in (1, 2, 3):
+        history.append_run(make_run(day, ["BUY", "HOLD", "HOLD"]), tmp_path)
+    history.append_run(make_run(1, ["BUY", "HOLD", "HOLD"], month=10), tmp_path)
+    history.append_run(make_run(2, ["BUY", "HOLD", "HOLD"], month=10), tmp_path)
+    before = history.query_history(root=tmp_path)
+
+    assert history.compact(tmp_path, keep_month="2025-10-15") == 1
+    assert len(list((tmp_path / "run_month=2025-09").iterdir())) == 1
+    assert len(list((tmp_path / "run_month=2025-10").iterdir())) == 2
+    pd.testing.assert_frame_equal(history.query_history(root=tmp_path), before)
+
+
+def test_main_records_opinions_with_default_decision_logic(monkeypatch, tmp_path):
+    # FORCE_OPINION unset: the consensus drops the opinion columns from the analysis output
+    monkeypatch.delenv("FORCE_OPINION", raising=False)
+    for name, value in {"STORAGE_BACKEND": "local", "STORAGE_LOCAL_DIR": str(tmp_path / "data"),
+                        "SYMBOLS_INTEREST_LIST": "['AMD', 'AAPL']", "REVENUE_PERCENTAGE": "10",
+                        "LLM_SECOND_OPINION": "true", "ANALYSIS_HISTORY_DIR": str(tmp_path / "history"),
+                        "LLM_TELEMETRY_FILE": str(tmp_path / "telemetry.json")}.items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.setattr(finnhub_client, "get_symbols_info", lambda symbols: [
+        {"symbol": symbol, "current_price": 100.0, "change_percent": -3.0} for symbol in symbols])
+    monkeypatch.setattr(main, "analyze_symbol", lambda data: dict(
+        data, metrics={"evaluation": "BUY", "confidence": 0.5, "signals": {"RSI": 30}}))
+    monkeypatch.setattr(llms, "get_gpt_signals_analysis", lambda signals, symbol, price: "BUY - oversold")
+    monkeypatch.setattr(llms, "get_deepseek_signals_analysis", lambda signals, symbol, price: (
+        "BUY - rebound" if symbol == "AMD" else "SELL - breakdown"))
+
+    main.main()
+
+    analysis = main.storage.get_storage().load_frame("analysis")
+    assert "llm_opinion" not in analysis.columns
+    runs = history.query_history(root=str(tmp_path / "history")).set_index("symbol")
+    assert runs.loc["AMD", "llm_opinion"] == "BUY - oversold" and runs.loc["AMD", "llm_2_opinion"] == "BUY - rebound"
+    assert runs.loc["AAPL", "llm_2_opinion"] == "SELL - breakdown"
+    assert runs["action"].to_dict() == {"AMD": "BUY", "AAPL": "EMPTY_DECISION"}
+
+
+def test_restore_missing_runs_from_storage(tmp_path):
+    local_root, fresh_root = tmp_path / "history", tmp_path / "fresh"
+    for day, actions in ((1, ["BUY", "HOLD", "HOLD"]), (2, ["HOLD", "BUY", "SELL"])):
+        history.append_run(make_run(day, actions), local_root)
+    history.append_run(make_run(1, ["HOLD", "HOLD", "BUY"], month=10), local_root)
+    expected = history.query_history(root=str(local_root))
+
+    for file_format in ("csv", "parquet"):
+        backend = storage.LocalStorage(root=tmp_path / file_format, file_format=file_format, keep_versions=0)
+        # Nothing stored yet: nothing to restore, and the copy can be created
+        assert history.restore_missing_runs(backend, "analysis_history", root=str(fresh_root))
+        history.save_to_storage(backend, "analysis_history", root=str(local_root))
+
+        # Cache miss: the whole history comes back from the stored copy, with its types
+        restored_root = tmp_path / f"restored_{file_format}"
+        assert history.restore_missing_runs(backend, "analysis_history", root=str(restored_root))
+        pd.testing.assert_frame_equal(history.query_history(root=str(restored_root)), expected)
+        assert sorted(path.name for path in restored_root.iterdir()) == ["run_month=2025-09", "run_month=2025-10"]
+
+        # Already up to date: nothing is written again
+        assert history.restore_missing_runs(backend, "analysis_history", root=str(restored_root))
+        assert len(list(restored_root.rglob("*.parquet"))) == 2
+
+
+def test_unreadable_stored_history_is_not_overwritten(tmp_path):
+    backend = storage.LocalStorage(root=tmp_path, file_format="csv", keep_versions=0)
+    (tmp_path / "analysis_history.csv").write_text("")
+    assert not history.restore_missing_runs(backend, "analysis_history", root=str(tmp_path / "history"))
+
+
+def test_empty_run_writes_nothing(tmp_path):
+    # e.g. no candidates after screening: the run frame has no rows (or no columns at all)
+    for analysis_df in (pd.DataFrame(), pd.DataFrame(columns=["symbol", "current_price", "action"])):
+        run_df = history.build_run_frame(analysis_df, [])
+        assert run_df.empty and list(run_df.columns) == history.HISTORY_SCHEMA.names
+        assert history.append_run(run_df, tmp_path) is None
+        assert history.record_run(analysis_df, [], root=str(tmp_path)) is None
+    assert list(tmp_path.iterdir()) == []
@@ -1,6 +1,18 @@
 # test_finnhub_client.py
 import os
 import pytest
+import json
+import itertools
+import time
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from tools import finnhub_client, run_metrics
+from tools.google_handler import update_transactions
+from tools.finnhub_ws_stub import start_stub_stream_server, stop_stub_stream_server
 from tools.finnhub_client import analyze_market_losers_from_interest_list, SYMBOLS_INTEREST_LIST
 from dotenv import load_dotenv
 
@@ -39,3 +51,231 @@ def test_limit_applied():
     top_n = 1
     losers = analyze_market_losers_from_interest_list(SYMBOLS_INTEREST_LIST, top_n=top_n)
     assert len(losers) <= top_n, f"Should return no more than {top_n} items"
+
+
+class QuoteHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        symbol = parse_qs(urlparse(self.path).query)["symbol"][0]
+        with self.server.lock:
+            self.server.requests[symbol] = self.server.requests.get(symbol, 0) + 1
+            self.server.active += 1
+            self.server.max_active = max(self.server.max_active, self.server.active)
+        if symbol == "SLOW":
+            time.sleep(0.2)
+        if symbol == "BROKEN":
+            status, payload = 500, {"error": "boom"}
+        else:
+            # Later symbols answer faster, so completion order differs from input order
+            time.sleep(0.05 if symbol.endswith("0") else 0.0)
+            status, payload = 200, {"c": float(len(symbol)), "dp": -1.5}
+        with self.server.lock:
+            self.server.active -= 1
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def quote_server(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), QuoteHandler)
+    server.daemon_threads = True
+    server.requests = {}
+    server.active = server.max_active = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(finnhub_client, "API_URL", f"http://127.0.0.1:{server.server_address[1]}")
+    monkeypatch.setattr(finnhub_client, "_rate_limiter", finnhub_client.TokenBucket(60000, 1000))
+    monkeypatch.setattr(finnhub_client, "quote_cache", finnhub_client.QuoteCache(ttl=60, path=""))
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_get_symbols_info_preserves_order_and_shape(quote_server):
+    symbols = [f"SYM{i}" for i in range(20)]
+    info = finnhub_client.get_symbols_info(symbols)
+    assert [item["symbol"] for item in info] == symbols
+    assert info[0] == {"symbol": "SYM0", "current_price": 4.0, "change_percent": -1.5}
+
+
+def test_get_symbols_info_skips_failed_symbols(quote_server):
+    info = finnhub_client.get_symbols_info(["AAA", "BROKEN", "BBB"])
+    assert [item["symbol"] for item in info] == ["AAA", "BBB"]
+
+
+def test_get_quotes_runs_concurrently(quote_server):
+    symbols = [f"S{i}0" for i in range(8)]
+    finnhub_client.get_quotes(symbols, max_workers=8)
+    assert quote_server.max_active > 1
+
+
+def test_token_bucket_limits_rate():
+    bucket = finnhub_client.TokenBucket(rate_per_minute=600, capacity=2)  # 10 tokens per second
+    started = time.perf_counter()
+    for _ in range(4):
+        bucket.acquire()
+    # 2 tokens of burst, then 2 more at 0.1s each
+    assert time.perf_counter() - started >= 0.18
+
+
+def test_quote_cache_reuses_fresh_quotes(quote_server):
+    run_metrics.reset()
+    first = finnhub_client.get_symbols_info(["AAA", "BBB"])
+    second = finnhub_client.get_symbols_info(["AAA", "BBB", "CCC"])
+    assert second[:2] == first
+    assert quote_server.requests == {"AAA": 1, "BBB": 1, "CCC": 1}
+    assert run_metrics.get_counter("finnhub.quote_cache.memory_hits") == 2
+    assert run_metrics.get_counter("finnhub.quote_cache.hit_ratio") == 0.4
+    finnhub_client.get_quote("AAA", use_cache=False)
+    assert quote_server.requests["AAA"] == 2
+
+
+def test_quote_cache_single_flight(quote_server):
+    run_metrics.reset()
+    results = finnhub_client.get_quotes(["SLOW"] * 6, max_workers=6)
+    assert quote_server.requests == {"SLOW": 1}
+    assert all(quote == results[0][1] for _, quote, _ in results)
+    assert run_metrics.get_counter("finnhub.quote_cache.shared") == 5
+
+
+def test_quote_cache_failures_are_not_cached(quote_server):
+    finnhub_client.get_symbols_info(["BROKEN"])
+    finnhub_client.get_symbols_info(["BROKEN"])
+    assert quote_server.requests == {"BROKEN": 2}
+
+
+def test_quote_cache_ttl_and_disk_tier(tmp_path):
+    path = str(tmp_path / "quotes.json")
+    calls = []
+
+    def fetch(symbol):
+        calls.append(symbol)
+        return {"c": 1.0, "dp": -1.0}
+
+    cache = finnhub_client.QuoteCache(ttl=60, path=path)
+    cache.get("AAA", fetch)
+    cache.save()
+
+    # A new run reads the file tier instead of fetching again
+    run_metrics.reset()
+    assert finnhub_client.QuoteCache(ttl=60, path=path).get("AAA", fetch) == {"c": 1.0, "dp": -1.0}
+    assert calls == ["AAA"]
+    assert run_metrics.get_counter("finnhub.quote_cache.disk_hits") == 1
+
+    # Expired entries (and a disabled cache) fetch again
+    finnhub_client.QuoteCache(ttl=0.0001, path=path).get("AAA", fetch)
+    finnhub_client.QuoteCache(ttl=0, path="").get("AAA", fetch)
+    assert calls == ["AAA", "AAA", "AAA"]
+
+
+def make_open_transactions():
+    buy_date = (datetime.today() - timedelta(days=5)).date()
+    return pd.DataFrame({
+        'symbol': ['AAPL', 'AMD', 'MSFT'],
+        'buy_value': [100.0, 200.0, 50.0],
+        'buy_date': [buy_date, buy_date, buy_date],
+        'sell_value': [None, None, 55.0],
+        'sell_date': [None, None, buy_date],
+        'buy_sell_days_diff': [None, None, 0],
+        'percentage_benefit': [None, None, 10.0],
+    })
+
+
+def test_monitor_matches_update_transactions():
+    transactions = make_open_transactions()
+    monitor = finnhub_client.TakeProfitMonitor(transactions, 10, on_flush=lambda df, sold: None)
+    assert sorted(monitor.symbols) == ['AAPL', 'AMD']  # MSFT is already sold
+
+    assert monitor.on_trade('AAPL', 109.0) is False
+    assert monitor.on_trade('AAPL', 112.0) is True
+    assert monitor.on_trade('AMD', 210.0) is False
+
+    analysis = pd.DataFrame({'symbol': ['AAPL', 'AMD'], 'current_price': [112.0, 210.0]})
+    expected = update_transactions(analysis, transactions, 10)
+    pd.testing.assert_frame_equal(monitor.transactions, expected)
+    assert monitor.symbols == ['AMD']
+
+
+def test_monitor_flushes_in_batches():
+    flushed = []
+    transactions = pd.DataFrame({
+        'symbol': [f'S{i}' for i in range(5)],
+        'buy_value': [10.0] * 5,
+        'buy_date': [datetime.today().date()] * 5,
+        'sell_value': [None] * 5,
+    })
+    monitor = finnhub_client.TakeProfitMonitor(transactions, 10, lambda df, sold: flushed.append(sold),
+                                               flush_size=2, flush_interval=3600)
+    for i in range(5):
+        monitor.on_trade(f'S{i}', 11.0)
+        if monitor.should_flush():
+            monitor.flush()
+    monitor.flush()
+    assert flushed == [[0, 1], [2, 3], [4]]
+
+
+def test_stream_take_profit_sells_and_stops():
+    # AAPL rises 1 per trade and passes its 10% target (110) at 111, AMD never reaches 220
+    aapl_trades = itertools.count(101)
+
+    def rising(symbol, n):
+        return float(next(aapl_trades)) if symbol == 'AAPL' else 200.0
+
+    server = start_stub_stream_server(price_fn=rising, max_messages=200)
+    flushed = []
+    try:
+        monitor = finnhub_client.TakeProfitMonitor(make_open_transactions(), 10,
+                                                   lambda df, sold: flushed.append((df, sold)), flush_size=1)
+        stats = finnhub_client.stream_take_profit(monitor, url=server.url, duration=10)
+    finally:
+        stop_stub_stream_server(server)
+
+    assert stats['sales'] == 1
+    assert stats['ticks'] > 0 and stats['ticks_per_second'] > 0
+    df, sold = flushed[0]
+    assert sold == [0]
+    assert df.at[0, 'sell_value'] == 111.0
+    assert server.stats['subscriptions'] == 2
+    assert server.stats['unsubscriptions'] == 1
+
+
+def test_stream_take_profit_without_open_positions():
+    transactions = make_open_transactions().iloc[[2]]
+    monitor = finnhub_client.TakeProfitMonitor(transactions, 10, lambda df, sold: None)
+    assert finnhub_client.stream_take_profit(monitor, url="ws://127.0.0.1:9")["ticks"] == 0
+
+
+def reference_losers(symbols, top_n=None):
+    # Previous implementation: full stable sort of the losers
+    losers = sorted((s for s in symbols if s["change_percent"] is not None and s["change_percent"] < 0),
+                    key=lambda s: s["change_percent"])
+    return losers if top_n is None else losers[:top_n]
+
+
+def test_top_losers_match_full_sort():
+    rng = np.random.default_rng(7)
+    changes = np.round(rng.normal(0, 2, 2000), 1)  # rounding creates many ties
+    symbols = [{"symbol": f"S{i}", "current_price": 10.0, "change_percent": float(c)} for i, c in enumerate(changes)]
+    symbols[5]["change_percent"] = None
+
+    for top_n in (None, 0, 1, 10, 500, 5000):
+        assert analyze_market_losers_from_interest_list(symbols, top_n) == reference_losers(symbols, top_n)
+
+
+def test_top_losers_skip_invalid_items():
+    symbols = [
+        {"symbol": "A", "current_price": 1.0, "change_percent": -1.0},
+        {"symbol": "B", "current_price": 1.0},
+        {"symbol": "C", "current_price": 1.0, "change_percent": "n/a"},
+        {"symbol": "D", "current_price": 1.0, "change_percent": -2.0},
+    ]
+    assert [s["symbol"] for s in analyze_market_losers_from_interest_list(symbols)] == ["D", "A"]
+    assert list(finnhub_client.select_top_losers([0.5, -1.0, np.nan, -3.0], top_n=1)) == [3]
@@ -1,4 +1,5 @@
 import pandas as pd
+import pytest
 import numpy as np
 import re
 import sys
@@ -12,7 +13,9 @@ from general import (
     extract_custom_decision,
     decide_final_action,
     generate_action_column,
-    add_urls_column
+    add_urls_column,
+    add_opinion,
+    add_opinions
 )
 
 # Sample test data
@@ -54,6 +57,7 @@ def test_extract_llm_decision():
     assert extract_llm_decision('   buy -  Extra spaces   ') == 'BUY'
     assert extract_llm_decision(None) is None
     assert extract_llm_decision('') == ''
+    assert extract_llm_decision('**BUY** - Markdown answer') == 'BUY'
 
 
 # Test: decide_final_action
@@ -81,6 +85,10 @@ def test_decide_final_action():
     assert decide_final_action('error', 'error') == 'EMPTY_DECISION'
     assert decide_final_action(None, 'error') == 'EMPTY_DECISION'
 
+    # Missing opinions stored as NaN behave like None
+    assert decide_final_action(np.nan, 'BUY') == 'BUY'
+    assert decide_final_action(None, np.nan) == 'EMPTY_DECISION'
+
 
 
 
@@ -153,3 +161,67 @@ def test_add_urls_column_builds_tradingview_urls_correctly():
     # Assert: unknown or invalid symbols return "NOT FOUND"
     assert result_df.loc[3, "tradingview_url"] == "NOT FOUND"
     assert result_df.loc[4, "tradingview_url"] == "NOT FOUND"
+
+
+def test_resolve_consensus_policies():
+    from general import resolve_consensus
+    decisions = pd.DataFrame({
+        "llm_opinion":   ["BUY", "BUY", "BUY", None, "error", "SELL"],
+        "llm_2_opinion": ["BUY", "SELL", "BUY", None, None, "HOLD"],
+        "custom":        ["BUY", "BUY", None, None, "HOLD", "BUY"],
+    })
+    assert resolve_consensus(decisions, "unanimous").tolist() == [
+        "BUY", "EMPTY_DECISION", "BUY", "EMPTY_DECISION", "HOLD", "EMPTY_DECISION"]
+    assert resolve_consensus(decisions, "majority").tolist() == [
+        "BUY", "BUY", "BUY", "EMPTY_DECISION", "HOLD", "EMPTY_DECISION"]
+    weighted = resolve_consensus(decisions, "weighted", weights={"llm_2_opinion": 3})
+    assert weighted.tolist() == ["BUY", "SELL", "BUY", "EMPTY_DECISION", "HOLD", "HOLD"]
+
+    with pytest.raises(ValueError):
+        resolve_consensus(decisions, "dictator")
+
+
+def test_generate_action_column_more_sources():
+    df = pd.DataFrame({
+        "llm_opinion": ["BUY - a", "SELL - b"],
+        "llm_2_opinion": ["SELL - c", None],
+        "manual_financial_analysis": ["✅ BUY", "✋ HOLD"],
+    })
+    sources = ["llm_opinion", "llm_2_opinion", "manual_financial_analysis"]
+    result = generate_action_column(df.copy(), "DEFAULT", sources=sources, policy="majority")
+    assert result["action"].tolist() == ["BUY", "EMPTY_DECISION"]
+    assert list(result.columns) == ["action"]
+
+
+def test_generate_action_column_markdown_opinions():
+    # Answers validated by llms.is_valid_opinion may wrap the decision in markdown emphasis
+    df = pd.DataFrame({"llm_opinion": ["**BUY** - oversold", "** SELL ** - weak"],
+                       "llm_2_opinion": ["BUY - rebound", "*SELL* - breakdown"]})
+    result = generate_action_column(df.copy(), "DEFAULT")
+    assert result["action"].tolist() == ["BUY", "SELL"]
+
+
+def test_add_opinions_matches_add_opinion():
+    df = pd.DataFrame({"symbol": ["AAPL", "AMD", "NVDA", "AAPL"], "llm_opinion": ["old", None, "keep", "old"]})
+    opinions = {
+        "llm_opinion": {"AAPL": "BUY - oversold", "AMD": None, "UNKNOWN": "SELL"},
+        "llm_2_opinion": {"AMD": "SELL - weak"},
+    }
+    expected = df.copy()
+    for column, by_symbol in opinions.items():
+        for symbol, opinion in by_symbol.items():
+            add_opinion(symbol, expected, column, opinion)
+
+    result = add_opinions(df, opinions)
+    assert result is df
+    pd.testing.assert_frame_equal(result, expected)
+
+    # Frame input, one column per opinion
+    frame = pd.DataFrame({"symbol": ["NVDA"], "llm_opinion": ["HOLD - flat"]})
+    result = add_opinions(df, frame)
+    assert result.loc[[0, 2, 3], "llm_opinion"].tolist() == ["BUY - oversold", "HOLD - flat", "BUY - oversold"]
+    assert pd.isna(result.at[1, "llm_opinion"])
+
+    # No opinions (a run without candidates): nothing is set, like add_opinion never being called
+    empty = pd.DataFrame()
+    assert add_opinions(empty, {"llm_opinion": {}}) is empty and empty.empty
@@ -4,9 +4,15 @@ import pandas as pd
 from dotenv import dotenv_values
 import pytest
 import sys
+import time
+import threading
+import httplib2
 from datetime import datetime, timedelta
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'tools')))
+import google_handler
 from google_handler import get_drive_service, load_data, update_transactions
 
 # Get absolute path to the env path
@@ -106,3 +112,204 @@ def test_update_transactions():
     assert pd.isna(amd_row['buy_sell_days_diff']), "AMD days diff should not be updated"
     assert pd.isna(amd_row['percentage_benefit']), "AMD percentage_benefit should not be updated"
 
+
+@pytest.fixture
+def fake_credentials(monkeypatch):
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                            serialization.NoEncryption()).decode("ascii")
+    info = {
+        "type": "service_account", "project_id": "test", "private_key_id": "1", "private_key": pem,
+        "client_email": "bot@test.iam.gserviceaccount.com", "client_id": "1",
+        "token_uri": "https://oauth2.googleapis.com/token",
+    }
+    monkeypatch.setenv("GDRIVE_CREDENTIALS_JSON", json.dumps(info))
+    google_handler.reset_drive_service()
+    yield info
+    google_handler.reset_drive_service()
+
+
+def test_drive_service_is_cached(fake_credentials, monkeypatch):
+    builds = []
+    original_build = google_handler.build
+    monkeypatch.setattr(google_handler, "build", lambda *args, **kwargs: builds.append(kwargs) or original_build(*args, **kwargs))
+
+    service = google_handler.get_drive_service()
+    assert google_handler.get_drive_service() is service
+    assert len(builds) == 1 and builds[0]["static_discovery"] is True
+
+    # Rotated credentials build a new service
+    monkeypatch.setenv("GDRIVE_CREDENTIALS_JSON", json.dumps(dict(fake_credentials, private_key_id="2")))
+    assert google_handler.get_drive_service() is not service
+    assert len(builds) == 2
+
+
+def test_authorized_http_per_thread(fake_credentials):
+    google_handler.get_drive_service()
+    credentials = google_handler._service_state["credentials"]
+    credentials.token = "token"
+    credentials.expiry = datetime.utcnow() + timedelta(hours=1)
+
+    http = google_handler.get_authorized_http()
+    assert google_handler.get_authorized_http() is http
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(google_handler.get_authorized_http()))
+    thread.start()
+    thread.join()
+    assert other[0] is not http
+    assert other[0].credentials is http.credentials is credentials
+
+
+def test_save_dataframes_concurrently_with_status(monkeypatch):
+    uploads = []
+
+    def fake_upload(fh, file_id):
+        time.sleep(0.2)
+        if file_id == "broken":
+            raise Exception("quota exceeded")
+        uploads.append((file_id, fh.read()))
+
+    monkeypatch.setattr(google_handler, "upload_csv_file", fake_upload)
+    df = pd.DataFrame({"symbol": ["AAPL", "AMD"], "current_price": [1.0, 2.0]})
+
+    started = time.perf_counter()
+    results = google_handler.save_dataframes({
+        "transactions": (df, "tx"),
+        "buy": (df.head(1), "buy"),
+        "analysis": (df, "broken"),
+        "missing": (df, None),
+    })
+    assert time.perf_counter() - started < 0.6  # not 4 x 0.2s
+    assert sorted(file_id for file_id, _ in uploads) == ["buy", "tx"]
+    assert dict(uploads)["tx"] == df.to_csv(index=False).encode("utf-8")
+
+    assert results["transactions"]["status"] == "ok"
+    assert results["transactions"]["rows"] == 2 and results["transactions"]["upload_ms"] >= 200
+    assert results["analysis"]["status"] == "error" and "quota" in results["analysis"]["error"]
+    assert results["missing"]["status"] == "error"
+
+
+class FakeDriveHttp:
+    """
+    Drive endpoints used by google_handler: Sheets export (whole body, Range ignored), binary download
+    (alt=media, Range requests) and media updates (simple or resumable).
+    """
+
+    def __init__(self, drive):
+        self.drive = drive
+        self.requests = []
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        headers = {key.lower(): value for key, value in (headers or {}).items()}
+        if hasattr(body, "read"):  # chunks of resumable uploads are streamed from the file
+            body = body.read()
+        self.requests.append((method, uri.split("?")[0], len(body or b"")))
+
+        if "/export" in uri:
+            self.drive["downloads"] += 1
+            return httplib2.Response({"status": 200, "content-length": str(len(self.drive["content"]))}), \
+                self.drive["content"]
+
+        if "alt=media" in uri:
+            content = self.drive["content"]
+            start, end = map(int, headers["range"].split("=")[1].split("-"))
+            if start == 0:
+                self.drive["downloads"] += 1
+            chunk = content[start:end + 1]
+            return httplib2.Response({"status": 206, "content-range": f"bytes {start}-{start + len(chunk) - 1}/{len(content)}"}), chunk
+
+        if "uploadType=resumable" in uri:  # start of a resumable session
+            self.drive["upload"] = b""
+            return httplib2.Response({"status": 200, "location": "https://upload.test/session"}), b""
+        if uri == "https://upload.test/session":
+            self.drive["upload"] += body
+            total = headers["content-range"].rsplit("/", 1)[1]
+            if total == "*" or len(self.drive["upload"]) < int(total):
+                return httplib2.Response({"status": 308, "range": f"bytes=0-{len(self.drive['upload']) - 1}"}), b""
+            return self._updated(self.drive.pop("upload"))
+
+        return self._updated(body)  # uploadType=media: the body is the file content
+
+    def _updated(self, content):
+        self.drive["content"] = content
+        self.drive["version"] += 1
+        return httplib2.Response({"status": 200}), json.dumps(
+            {"id": "tx", "version": str(self.drive["version"]), "modifiedTime": "t2"}).encode()
+
+
+@pytest.fixture
+def fake_drive(monkeypatch, tmp_path):
+    drive = {"version": 1, "content": b"symbol,buy_value\nAAPL,150.0\n", "downloads": 0,
+             "mime_type": "application/vnd.google-apps.spreadsheet"}
+    http = FakeDriveHttp(drive)
+    service = google_handler.build("drive", "v3", http=http, static_discovery=True)
+
+    monkeypatch.setattr(google_handler, "CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(google_handler, "get_drive_service", lambda: service)
+    monkeypatch.setattr(google_handler, "get_authorized_http", lambda: http)
+    monkeypatch.setattr(google_handler, "get_file_metadata", lambda file_id: {
+        "version": str(drive["version"]), "modifiedTime": "t1", "mimeType": drive["mime_type"]})
+    drive["http"] = http
+    return drive
+
+
+def test_load_data_reuses_unchanged_file(fake_drive):
+    first = load_data("tx")
+    second = load_data("tx")
+    assert fake_drive["downloads"] == 1
+    pd.testing.assert_frame_equal(first, second)
+
+    # A new version on Drive is downloaded again
+    fake_drive["version"] = 2
+    fake_drive["content"] = b"symbol,buy_value\nAMD,140.0\n"
+    assert load_data("tx")["symbol"].tolist() == ["AMD"]
+    assert fake_drive["downloads"] == 2
+
+
+def test_load_data_reuses_uploaded_file(fake_drive, monkeypatch):
+    df = pd.DataFrame({"symbol": ["NVDA"], "buy_value": [100.0]})
+    google_handler.save_dataframe_file_id(df, "tx")
+    monkeypatch.setattr(google_handler, "get_file_metadata",
+                        lambda file_id: {"version": str(fake_drive["version"]), "modifiedTime": "t2"})
+
+    pd.testing.assert_frame_equal(load_data("tx"), df)
+    assert fake_drive["downloads"] == 0
+
+
+def test_load_data_without_metadata_downloads(fake_drive, monkeypatch):
+    monkeypatch.setattr(google_handler, "get_file_metadata", lambda file_id: None)
+    load_data("tx")
+    load_data("tx")
+    assert fake_drive["downloads"] == 2
+
+
+def test_large_files_are_transferred_in_chunks(fake_drive, monkeypatch):
+    monkeypatch.setattr(google_handler, "CHUNK_SIZE_BYTES", 256)
+    df = pd.DataFrame({"symbol": [f"SYM{i}" for i in range(200)], "buy_value": [float(i) for i in range(200)]})
+    csv = df.to_csv(index=False).encode("utf-8")
+
+    google_handler.save_dataframe_file_id(df, "tx")
+    uploads = [size for method, uri, size in fake_drive["http"].requests if uri == "https://upload.test/session"]
+    assert fake_drive["content"] == csv
+    assert len(uploads) == -(-len(csv) // 256) and max(uploads) <= 256
+
+    # A binary file is parsed while downloading, one Range request per chunk
+    fake_drive["mime_type"] = "text/csv"
+    fake_drive["http"].requests.clear()
+    monkeypatch.setattr(google_handler, "CACHE_DIR", "")
+    pd.testing.assert_frame_equal(load_data("tx"), df)
+    assert len(fake_drive["http"].requests) == -(-len(csv) // 256)
+    assert {uri.rsplit("/", 1)[1] for _, uri, _ in fake_drive["http"].requests} == {"tx"}  # files/tx?alt=media
+
+    # A Google Sheet is exported whole, in a single request
+    fake_drive["mime_type"] = "application/vnd.google-apps.spreadsheet"
+    fake_drive["http"].requests.clear()
+    pd.testing.assert_frame_equal(load_data("tx"), df)
+    assert [uri.rsplit("/", 1)[1] for _, uri, _ in fake_drive["http"].requests] == ["export"]
+
+
+def test_failed_download_is_not_cached(fake_drive, monkeypatch):
+    fake_drive["content"] = b"symbol,buy_value\n\"AAPL,150.0\n"  # unterminated quote
+    assert load_data("tx") is None
+    assert os.listdir(google_handler.CACHE_DIR) == []
@@ -0,0 +1,59 @@
+import time
+import pytest
+import requests
+from tools.llm_stub_server import start_stub_server, stop_stub_server, latency_sampler, hashed_responder
+
+BODY = {"model": "stub-model", "messages": [{"role": "user", "content": "rsi14=45"}]}
+
+
+@pytest.fixture
+def make_server():
+    servers = []
+
+    def make(**kwargs):
+        server = start_stub_server(**kwargs)
+        servers.append(server)
+        return server
+
+    yield make
+    for server in servers:
+        stop_stub_server(server)
+
+def test_latency_sampler_distributions():
+    assert latency_sampler("fixed:200")() == 0.2
+    uniform = latency_sampler("uniform:100:300", seed=1)
+    assert all(0.1 <= uniform() <= 0.3 for _ in range(100))
+    assert latency_sampler("lognormal:100:0.5", seed=1)() > 0
+    assert latency_sampler("normal:10:50", seed=1)() >= 0
+    # Same seed, same sequence
+    assert [latency_sampler("lognormal:100:0.5", seed=7)() for _ in range(3)] == \
+           [latency_sampler("lognormal:100:0.5", seed=7)() for _ in range(3)]
+    with pytest.raises(ValueError):
+        latency_sampler("pareto:1")
+
+def test_hashed_responder_is_deterministic():
+    first = hashed_responder(BODY)
+    assert first == hashed_responder(BODY)
+    assert first.split(" - ")[0] in {"BUY", "HOLD", "SELL", "EMPTY_DECISION"}
+    other = {"model": "stub-model", "messages": [{"role": "user", "content": "rsi14=80"}]}
+    assert hashed_responder(other) != first
+
+def test_injected_latency(make_server):
+    server = make_server(latency="fixed:100")
+    started = time.perf_counter()
+    response = requests.post(f"{server.base_url}/v1/chat/completions", json=BODY)
+    assert response.status_code == 200
+    assert time.perf_counter() - started >= 0.1
+
+def test_injected_errors(make_server):
+    server = make_server(error_rate=1.0)
+    response = requests.post(f"{server.base_url}/v1/chat/completions", json=BODY)
+    assert response.status_code == 500
+    assert server.stats["errors"] == 1
+
+def test_rate_limit(make_server):
+    server = make_server(max_rps=2)
+    codes = [requests.post(f"{server.base_url}/v1/chat/completions", json=BODY).status_code for _ in range(4)]
+
+    assert codes == [200, 200, 429, 429]
+    assert server.stats["rate_limited"] == 2
@@ -0,0 +1,71 @@
+import json
+import time
+import pytest
+from tools import llm_telemetry, run_metrics
+
+
+@pytest.fixture(autouse=True)
+def clean_telemetry():
+    llm_telemetry.reset()
+    run_metrics.reset()
+    yield
+    llm_telemetry.reset()
+    run_metrics.reset()
+
+def test_estimate_cost_uses_longest_model_prefix(monkeypatch):
+    monkeypatch.delenv("LLM_PRICES_JSON", raising=False)
+    # gpt-4o-mini must not be priced as gpt-4o
+    assert llm_telemetry.estimate_cost("gpt-4o-mini-2024-07-18", 1_000_000, 0) == 0.15
+    assert llm_telemetry.estimate_cost("gpt-4o", 1_000_000, 1_000_000) == 12.5
+    assert llm_telemetry.estimate_cost("gpt-4o", 1_000_000, 0, discount=0.5) == 1.25
+    assert llm_telemetry.estimate_cost("unknown-model", 1000, 1000) is None
+
+def test_estimate_cost_price_override(monkeypatch):
+    monkeypatch.setenv("LLM_PRICES_JSON", '{"my-model": [1, 2]}')
+    assert llm_telemetry.estimate_cost("my-model", 1_000_000, 1_000_000) == 3
+
+def test_llm_call_records_latency_ttfb_queue_wait_and_retries():
+    def call():
+        with llm_telemetry.LLMCall("openai", "gpt-4o", ["AAPL"]) as tracked:
+            llm_telemetry.on_http_request()
+            llm_telemetry.on_http_request()  # retried once
+            time.sleep(0.01)
+            llm_telemetry.on_http_response()
+            tracked.set_usage(100, 20)
+
+    llm_telemetry.run_queued(call, time.perf_counter() - 0.05)
+    record = llm_telemetry.get_records()[0]
+
+    assert record["status"] == "ok"
+    assert record["retries"] == 1
+    assert record["queue_wait_ms"] >= 50
+    assert 10 <= record["ttfb_ms"] <= record["latency_ms"]
+    assert record["cost_usd"] == llm_telemetry.estimate_cost("gpt-4o", 100, 20)
+    assert run_metrics.get_counter("llm.calls") == 1
+
+def test_llm_call_marks_errors():
+    with pytest.raises(ValueError):
+        with llm_telemetry.LLMCall("deepseek", "deepseek-reasoner", ["AAPL"]):
+            raise ValueError("boom")
+
+    record = llm_telemetry.get_records()[0]
+    assert record["status"] == "error"
+    assert record["error"] == "boom"
+
+def test_summary_per_model_and_symbol(tmp_path):
+    llm_telemetry.record_call("openai", "gpt-4o", ["AAPL", "MSFT"], latency_ms=100, prompt_tokens=200, completion_tokens=40)
+    llm_telemetry.record_call("deepseek", "deepseek-reasoner", ["AAPL"], latency_ms=300, prompt_tokens=100,
+                              completion_tokens=20, status="error", error="timeout")
+
+    summary = llm_telemetry.get_summary()
+
+    assert summary["totals"]["calls"] == 2
+    assert summary["totals"]["errors"] == 1
+    assert summary["by_model"]["openai/gpt-4o"]["latency_ms"]["p50"] == 100
+    assert summary["by_symbol"]["AAPL"]["calls"] == 2
+    assert summary["by_symbol"]["AAPL"]["latency_ms"] == 350  # half of the shared batch call + 300
+    assert summary["by_symbol"]["MSFT"]["tokens"] == 120
+    assert list(summary["by_symbol"]) == ["AAPL", "MSFT"]  # slowest first
+
+    path = llm_telemetry.save_summary(tmp_path / "telemetry.json")
+    assert json.loads(path.read_text())["totals"]["calls"] == 2
@@ -4,9 +4,38 @@ import pytest
 import warnings
 from unittest.mock import patch, Mock
 import requests
+import time
+import concurrent.futures
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'tools')))
-from llms import get_gpt_signals_analysis
+import re
+import json
+from llms import (
+    get_gpt_signals_analysis,
+    get_deepseek_signals_analysis,
+    get_gpt_batch_signals_analysis,
+    parse_batch_answer,
+    compute_batch_size,
+    encode_signals,
+    format_metrics,
+    generate_prompt,
+    estimate_tokens,
+    run_batch_job,
+    apply_confidence_gate,
+    get_confidence_band,
+    DecisionStreamParser,
+    get_dual_signals_analysis,
+    submit_signals_analyses,
+    collect_signals_analyses,
+    get_latency_report,
+    is_valid_opinion,
+    write_batch_job,
+    LocalFileBatchBackend,
+    client_manager
+)
+from llm_stub_server import start_stub_server, stop_stub_server
+from general import extract_llm_decision
+from tools import run_metrics, llm_telemetry
 
 symbol = "AAPL"
 current_price = 155.0
@@ -25,6 +54,325 @@ signals = {
     "Current_Price": 150.0
 }
 
+@pytest.fixture
+def stub_server(monkeypatch):
+    """Local chat-completions server so the LLM clients can be tested offline."""
+    server = start_stub_server()
+    monkeypatch.setenv("OPENAI_API_KEY", "stub-key")
+    monkeypatch.setenv("GPT_MODEL_NAME", "stub-model")
+    monkeypatch.setenv("REVENUE_PERCENTAGE", "10")
+    monkeypatch.setenv("OPENAI_BASE_URL", f"{server.base_url}/v1")
+    monkeypatch.setenv("DEEPKSEEK_API_KEY", "stub-key")
+    monkeypatch.setenv("DEEPSEEK_API_URL", f"{server.base_url}/chat/completions")
+    client_manager.close()
+    yield server
+    client_manager.close()
+    stop_stub_server(server)
+
+def test_gpt_client_is_pooled_across_calls(stub_server):
+    first = get_gpt_signals_analysis(signals, "AAPL", current_price)
+    second = get_gpt_signals_analysis(signals, "MSFT", current_price)
+
+    assert first.startswith("HOLD - ")
+    assert second.startswith("HOLD - ")
+    assert stub_server.stats["requests"] == 2
+    assert stub_server.stats["connections"] == 1, "Both calls should reuse one keep-alive connection"
+
+def test_deepseek_session_is_pooled_across_calls(stub_server):
+    first = get_deepseek_signals_analysis(signals, "AAPL", current_price)
+    second = get_deepseek_signals_analysis(signals, "MSFT", current_price)
+
+    assert first.startswith("HOLD - ")
+    assert second.startswith("HOLD - ")
+    assert stub_server.stats["connections"] == 1
+
+def test_gpt_call_telemetry(stub_server):
+    llm_telemetry.reset()
+    get_gpt_signals_analysis(signals, "AAPL", current_price, stream=False)
+
+    record = llm_telemetry.get_records()[-1]
+    assert record["provider"] == "openai"
+    assert record["model"] == "stub-model"
+    assert record["symbols"] == ["AAPL"]
+    assert record["ttfb_ms"] is not None and record["ttfb_ms"] <= record["latency_ms"]
+    assert record["prompt_tokens"] > 0
+    assert record["retries"] == 0
+    llm_telemetry.reset()
+
+def test_client_manager_close_is_idempotent(stub_server):
+    client = client_manager.get_openai_client()
+    assert client_manager.get_openai_client() is client
+
+    client_manager.close()
+    client_manager.close()
+    assert client_manager.get_openai_client() is not client
+
+def batch_responder(skip_first=None):
+    """Answer every [SYMBOL] block of a batch prompt, optionally dropping one symbol the first time."""
+    skipped = []
+
+    def respond(body):
+        prompt = body["messages"][-1]["content"]
+        symbols = re.findall(r"^\[(\S+)\]$", prompt, re.MULTILINE)
+        if skip_first in symbols and not skipped:
+            skipped.append(skip_first)
+            symbols.remove(skip_first)
+        answer = [{"symbol": s, "decision": "BUY", "explanation": "stub (RSI 45)"} for s in symbols]
+        return f"```json\n{json.dumps(answer)}\n```"
+
+    return respond
+
+def test_parse_batch_answer_maps_and_validates():
+    answer = json.dumps([
+        {"symbol": "AAPL", "decision": "buy", "explanation": "Uptrend (MA50 > MA200)"},
+        {"symbol": "MSFT", "decision": "MAYBE", "explanation": "invalid decision"},
+        {"symbol": "OTHER", "decision": "SELL", "explanation": "not requested"},
+    ])
+    opinions, failed = parse_batch_answer(answer, ["AAPL", "MSFT", "TSLA"])
+
+    assert opinions == {"AAPL": "BUY - Uptrend (MA50 > MA200)"}
+    assert failed == ["MSFT", "TSLA"]
+
+def test_parse_batch_answer_invalid_json():
+    opinions, failed = parse_batch_answer("BUY - not json at all", ["AAPL"])
+    assert opinions == {}
+    assert failed == ["AAPL"]
+
+def test_compute_batch_size_respects_context_window():
+    items = [{"symbol": f"S{i}", "signals": signals, "current_price": current_price} for i in range(50)]
+
+    assert compute_batch_size(items, context_window=128000, max_batch_size=20) == 20
+    small = compute_batch_size(items, context_window=2000, max_batch_size=20)
+    assert 1 <= small < 20
+    assert compute_batch_size(items, context_window=10, max_batch_size=20) == 1
+
+def test_gpt_batch_retries_only_failed_symbols(stub_server):
+    stub_server.responder = batch_responder(skip_first="MSFT")
+    items = [{"symbol": s, "signals": signals, "current_price": current_price} for s in ["AAPL", "MSFT", "TSLA"]]
+
+    opinions = get_gpt_batch_signals_analysis(items, batch_size=10)
+
+    assert set(opinions) == {"AAPL", "MSFT", "TSLA"}
+    assert all(opinion.startswith("BUY - ") for opinion in opinions.values())
+    # One request for the batch plus one retry for the dropped symbol
+    assert stub_server.stats["requests"] == 2
+
+def test_gpt_batch_reports_error_after_retries(stub_server):
+    stub_server.responder = lambda body: "not a json answer"
+    items = [{"symbol": "AAPL", "signals": signals, "current_price": current_price}]
+
+    opinions = get_gpt_batch_signals_analysis(items, batch_size=10, max_retries=1)
+
+    assert opinions["AAPL"].startswith("Error getting GPT analysis for AAPL")
+    assert stub_server.stats["requests"] == 2
+
+def test_encode_signals_compact():
+    encoded = encode_signals(
+        {"RSI": 45.123456, "Breakout_20": True, "ROC_10": float("nan"), "Current_Price": 150.0, "Custom": 1},
+        current_price=150.0,
+        precision=4
+    )
+    assert encoded == "price=150.00, rsi14=45.12, breakout20=1, Custom=1"
+
+def test_encode_signals_keeps_different_current_price():
+    encoded = encode_signals({"Current_Price": 150.0}, current_price=155.0, omit_redundant=True)
+    assert encoded == "price=155.00, Current_Price=150.00"
+
+def test_encode_signals_keeps_decimals_of_large_prices():
+    encoded = encode_signals(
+        {"SMA_50": 12351.2, "SMA_200": 12349.8, "RSI": 61.23456, "MACD_Hist": 0.000123456},
+        current_price=12345.67,
+        precision=4
+    )
+    assert encoded == "price=12345.67, sma50=12351.20, sma200=12349.80, rsi14=61.23, macd_hist=0.0001235"
+
+def test_compact_prompt_uses_fewer_tokens(monkeypatch):
+    monkeypatch.setenv("REVENUE_PERCENTAGE", "10")
+    monkeypatch.setenv("LLM_COMPACT_PROMPT", "false")
+    verbose = generate_prompt(format_metrics(signals, current_price), current_price)
+    monkeypatch.setenv("LLM_COMPACT_PROMPT", "true")
+    compact = generate_prompt(format_metrics(signals, current_price), current_price)
+
+    assert estimate_tokens(compact) < estimate_tokens(verbose)
+    # The answer format parsed by general.extract_llm_decision is unchanged
+    assert "Output format: DECISION - brief explanation" in compact
+
+def test_get_confidence_band():
+    assert get_confidence_band("") is None
+    assert get_confidence_band("-0.5, 0.5") == (-0.5, 0.5)
+    with pytest.raises(ValueError):
+        get_confidence_band("0.5,-0.5")
+
+def test_confidence_gate_sends_only_ambiguous_symbols():
+    run_metrics.reset()
+    items = [
+        {"symbol": "AAPL", "evaluation": "BUY", "confidence": 0.9},
+        {"symbol": "MSFT", "evaluation": "HOLD", "confidence": 0.1},
+        {"symbol": "TSLA", "evaluation": "SELL", "confidence": -1.0},
+        {"symbol": "AMZN", "evaluation": "BUY", "confidence": 0.5},
+    ]
+
+    to_query, gated = apply_confidence_gate(items, (-0.5, 0.5))
+
+    assert [item["symbol"] for item in to_query] == ["MSFT", "AMZN"]
+    assert extract_llm_decision(gated["AAPL"]) == "BUY"
+    assert extract_llm_decision(gated["TSLA"]) == "SELL"
+    summary = run_metrics.get_summary()
+    assert summary["llm.gate.saved_calls"] == 2
+    assert summary["llm.gate.pass_rate"] == 0.5
+    run_metrics.reset()
+
+def test_confidence_gate_disabled():
+    items = [{"symbol": "AAPL", "evaluation": "BUY", "confidence": 1.0}]
+    assert apply_confidence_gate(items, None) == (items, {})
+
+LONG_ANSWER = "BUY - " + " ".join(f"word{i}" for i in range(40))
+
+def test_decision_stream_parser():
+    parser = DecisionStreamParser(max_words=3)
+    for delta in ["**B", "UY** ", "- strong ", "trend (RSI ", "45) and ", "more"]:
+        parser.feed(delta)
+        if parser.decision:
+            assert parser.decision == "BUY"
+
+    assert parser.time_to_decision is not None
+    assert parser.limit_reached
+    assert parser.answer() == "**BUY** - strong trend (RSI"
+    # The early decision is the one the stored answer will be read as
+    assert extract_llm_decision(parser.answer()) == parser.decision
+
+def test_decision_stream_parser_ignores_text_without_decision():
+    parser = DecisionStreamParser(max_words=3)
+    for delta in ["Sure, here is", " my view - the ", "trend is up and more"]:
+        parser.feed(delta)
+    assert parser.decision is None and not parser.limit_reached
+    assert parser.answer() == "Sure, here is my view - the trend is up and more"
+
+@pytest.mark.parametrize("provider", ["openai", "deepseek"])
+def test_streaming_parses_decision_and_stops_early(stub_server, monkeypatch, provider):
+    run_metrics.reset()
+    monkeypatch.setenv("LLM_STREAM_STOP_EARLY", "true")
+    monkeypatch.setenv("LLM_STREAM_MAX_WORDS", "30")
+    stub_server.responder = lambda body: LONG_ANSWER
+    stub_server.stream_delay = 0.002
+
+    call = get_gpt_signals_analysis if provider == "openai" else get_deepseek_signals_analysis
+    result = call(signals, "AAPL", current_price, stream=True)
+
+    assert extract_llm_decision(result) == "BUY"
+    assert len(result.split(" - ", 1)[1].split()) == 30
+    summary = run_metrics.get_summary()
+    assert summary[f"llm.{provider}.streams_stopped_early"] == 1
+    assert summary[f"llm.{provider}.time_to_decision_ms"]["max"] < summary[f"llm.{provider}.total_latency_ms"]["max"]
+    run_metrics.reset()
+
+def test_streaming_full_answer_without_early_stop(stub_server, monkeypatch):
+    monkeypatch.setenv("LLM_STREAM_STOP_EARLY", "false")
+    stub_server.responder = lambda body: LONG_ANSWER
+
+    assert get_gpt_signals_analysis(signals, "AAPL", current_price, stream=True) == LONG_ANSWER
+
+def test_deepseek_malformed_stream_event_is_an_error(monkeypatch):
+    monkeypatch.setenv("DEEPKSEEK_API_KEY", "stub-key")
+    monkeypatch.setenv("REVENUE_PERCENTAGE", "10")
+    response = Mock(status_code=200)
+    response.iter_lines.return_value = iter(['data: {"choices": [{"delta": {"content": "BUY"}}]}', "data: {broken"])
+    monkeypatch.setattr(client_manager, "get_deepseek_session", lambda: Mock(post=Mock(return_value=response)))
+    llm_telemetry.reset()
+
+    answer = get_deepseek_signals_analysis(signals, "AAPL", current_price, stream=True)
+
+    assert answer.startswith("error ")
+    assert response.close.called
+    assert [record["status"] for record in llm_telemetry.get_records()] == ["error"]
+
+def test_is_valid_opinion():
+    assert is_valid_opinion("BUY - uptrend")
+    assert is_valid_opinion("**HOLD** - sideways")
+    assert not is_valid_opinion("Error getting GPT analysis for AAPL: timeout")
+    assert not is_valid_opinion(None)
+
+def test_dual_opinions_respect_deadline(stub_server, monkeypatch):
+    run_metrics.reset()
+    # DeepSeek streams slowly and misses the deadline, GPT answers at once
+    stub_server.responder = lambda body: "SELL - slow model" if body["model"] == "deepseek-reasoner" else "BUY - fast model"
+    stub_server.stream_delay = 0.5
+    monkeypatch.setenv("LLM_STREAM", "false")
+
+    def slow_deepseek(*args, **kwargs):
+        return get_deepseek_signals_analysis(*args, stream=True)
+
+    monkeypatch.setattr(sys.modules["llms"], "get_deepseek_signals_analysis", slow_deepseek)
+    gpt, deepseek = get_dual_signals_analysis(signals, "AAPL", current_price, deadline=0.3)
+
+    assert gpt == "BUY - fast model"
+    assert deepseek is None
+    report = get_latency_report()
+    assert report["deepseek"]["timeouts"] == 1
+    assert report["openai"]["calls"] == 1
+    assert report["openai"]["p95_ms"] is not None
+    run_metrics.reset()
+
+def test_deadline_covers_the_whole_run(stub_server, monkeypatch):
+    run_metrics.reset()
+    # Every DeepSeek stream is slow: all symbols share one deadline and the abandoned streams are closed
+    stub_server.responder = lambda body: ("SELL - " + "slow " * 20) if body["model"] == "deepseek-reasoner" else "BUY - fast model"
+    stub_server.stream_delay = 0.2
+    monkeypatch.setenv("LLM_STREAM", "false")
+    monkeypatch.setenv("LLM_STREAM_STOP_EARLY", "false")
+
+    def slow_deepseek(*args, **kwargs):
+        return get_deepseek_signals_analysis(*args, stream=True)
+
+    monkeypatch.setattr(sys.modules["llms"], "get_deepseek_signals_analysis", slow_deepseek)
+    items = [{"symbol": symbol, "signals": signals, "current_price": current_price} for symbol in ("AAPL", "MSFT", "AMD")]
+    llm_telemetry.reset()
+
+    started = time.monotonic()
+    pending = submit_signals_analyses(items, deadline=0.5)
+    opinions = collect_signals_analyses(pending)
+
+    assert time.monotonic() - started < 1.0
+    assert opinions["openai"] == {"AAPL": "BUY - fast model", "MSFT": "BUY - fast model", "AMD": "BUY - fast model"}
+    assert opinions["deepseek"] == {"AAPL": None, "MSFT": None, "AMD": None}
+    assert get_latency_report()["deepseek"]["timeouts"] == 3
+    # Streams of 20+ slow chunks would hold their workers for seconds
+    _, not_done = concurrent.futures.wait(pending.futures, timeout=1.0)
+    assert not not_done
+    assert [record["status"] for record in llm_telemetry.get_records() if record["provider"] == "deepseek"] == ["error"] * 3
+    run_metrics.reset()
+
+def test_write_batch_job_jsonl(tmp_path, monkeypatch):
+    monkeypatch.setenv("REVENUE_PERCENTAGE", "10")
+    items = [{"symbol": s, "signals": signals, "current_price": current_price} for s in ["AAPL", "MSFT"]]
+
+    path = write_batch_job(items, tmp_path / "job.jsonl", model_name="gpt-4o")
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+
+    assert [line["custom_id"] for line in lines] == ["AAPL", "MSFT"]
+    assert lines[0]["url"] == "/v1/chat/completions"
+    assert lines[0]["body"]["model"] == "gpt-4o"
+    assert "rsi14=45" in lines[0]["body"]["messages"][-1]["content"]
+
+def test_run_batch_job_with_local_backend(tmp_path, monkeypatch):
+    monkeypatch.setenv("REVENUE_PERCENTAGE", "10")
+
+    def responder(body):
+        if "rsi14=99" in body["messages"][-1]["content"]:
+            raise ValueError("stub failure")
+        return "BUY - local answer (RSI 45)"
+
+    items = [
+        {"symbol": "AAPL", "signals": signals, "current_price": current_price},
+        {"symbol": "MSFT", "signals": {**signals, "RSI": 99}, "current_price": current_price},
+    ]
+    backend = LocalFileBatchBackend(tmp_path / "jobs", responder=responder)
+
+    opinions = run_batch_job(items, backend=backend, job_dir=tmp_path, poll_interval=0, timeout=5)
+
+    assert opinions["AAPL"] == "BUY - local answer (RSI 45)"
+    assert opinions["MSFT"].startswith("Error getting GPT analysis for MSFT")
+
 def test_get_gpt_analysis_basic():
 
     symbol = "AAPL"
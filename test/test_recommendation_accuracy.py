@@ -0,0 +1,96 @@
+import logging
+import numpy as np
+import pandas as pd
+import pytest
+import main
+from tools import analysis_history
+from tools import recommendation_accuracy as accuracy
+
+
+def make_prices():
+    dates = pd.bdate_range("2025-09-01", periods=10)
+    return pd.concat([
+        # AAPL: dips to 95 then reaches +10% (110) on the 4th bar after the buy
+        pd.DataFrame({"symbol": "AAPL", "date": dates, "close": [100, 100, 97, 99, 105, 109, 111, 112, 113, 114],
+                      "high": [100, 101, 98, 100, 106, 110.5, 112, 113, 114, 115],
+                      "low": [99, 99, 95, 97, 104, 108, 110, 111, 112, 113]}),
+        # AMD: only closes, never reaches the target
+        pd.DataFrame({"symbol": "AMD", "date": dates, "close": [50, 49, 48, 47, 46, 45, 46, 47, 48, 49]}),
+    ], ignore_index=True).sample(frac=1, random_state=0)  # order must not matter
+
+
+def test_evaluate_recommendations():
+    recommendations = pd.DataFrame({
+        "symbol": ["AAPL", "AMD", "AAPL", "MISSING"],
+        "buy_date": ["2025-09-02 10:00", "2025-09-01 10:00", "2025-09-12 10:00", "2025-09-02 10:00"],
+        "buy_value": [100.0, 50.0, 114.0, 10.0],
+    })
+    results = accuracy.evaluate_recommendations(recommendations, make_prices(), 10, horizons=(1, 5), max_days=20)
+
+    aapl = results.iloc[0]
+    assert aapl["return_1d"] == pytest.approx(-0.03) and aapl["return_5d"] == pytest.approx(0.11)
+    assert aapl["reached_target"] and aapl["bars_to_target"] == 4
+    assert aapl["days_to_target"] == 6  # 2025-09-02 -> 2025-09-08 (weekend in between)
+    assert aapl["max_drawdown"] == pytest.approx(-0.05)
+    assert aapl["bars_available"] == 8
+
+    amd = results.iloc[1]
+    assert not amd["reached_target"] and np.isnan(amd["days_to_target"])
+    assert amd["max_drawdown"] == pytest.approx(-0.1) and amd["return_5d"] == pytest.approx(-0.1)
+
+    # Bought on the last day / unknown symbol: nothing to evaluate yet
+    for row in (results.iloc[2], results.iloc[3]):
+        assert row["bars_available"] == 0 and np.isnan(row["return_1d"]) and np.isnan(row["max_drawdown"])
+
+
+def test_build_recommendations_and_summary():
+    history_df = pd.DataFrame({
+        "symbol": ["AAPL", "AMD"],
+        "run_at": pd.to_datetime(["2025-09-02 17:00", "2025-09-01 17:00"], utc=True),
+        "current_price": [100.0, 50.0],
+        "llm_opinion": ["BUY - oversold", "HOLD - neutral"],
+        "evaluation": ["BUY", "BUY"],
+        "action": ["BUY", "HOLD"],
+    })
+    recommendations = accuracy.build_recommendations(history_df)
+    assert sorted(zip(recommendations["source"], recommendations["symbol"])) == [
+        ("CUSTOM", "AAPL"), ("CUSTOM", "AMD"), ("FINAL", "AAPL"), ("LLM1", "AAPL")]
+
+    results = accuracy.evaluate_recommendations(recommendations, make_prices(), 10, horizons=(1,))
+    summary = accuracy.summarize_by_source(results, horizons=(1,))
+    assert summary.loc["CUSTOM", "recommendations"] == 2 and summary.loc["CUSTOM", "hit_rate"] == 0.5
+    assert summary.loc["LLM1", "hit_rate"] == 1.0 and summary.loc["LLM1", "median_days_to_target"] == 6
+
+
+def test_load_price_history_skips_failures():
+    fetched = []
+
+    def fetch(ticker):
+        fetched.append(ticker)
+        if ticker == "BAD":
+            raise Exception("rate limited")
+        return pd.DataFrame({"date": pd.bdate_range("2025-09-01", periods=2), "close": [1.0, 2.0], "volume": [1, 2]})
+
+    prices = accuracy.load_price_history(["AAPL", "BAD", "AAPL", "RHM.DE"], fetch=fetch)
+    assert prices["symbol"].tolist() == ["AAPL", "AAPL", "RHM.DE", "RHM.DE"]
+    assert list(prices.columns) == ["date", "close", "symbol"]
+    # Prices of listed symbols are fetched with the ticker of the historicals provider
+    assert sorted(fetched) == ["AAPL", "BAD", "RHM"]
+
+
+def test_report_accuracy_from_history(tmp_path, monkeypatch):
+    analysis_df = pd.DataFrame({"symbol": ["AAPL", "AMD"], "current_price": [100.0, 50.0],
+                                "llm_opinion": ["BUY - oversold", "**BUY** - rebound"],
+                                "llm_2_opinion": ["BUY - uptrend", "SELL - weak"], "action": ["BUY", "BUY"]})
+    run_df = analysis_history.build_run_frame(analysis_df, [], run_at=pd.Timestamp("2025-09-02 17:00", tz="UTC"))
+    analysis_history.append_run(run_df, tmp_path)
+    monkeypatch.setattr(accuracy, "load_price_history", lambda symbols: make_prices())
+
+    config = {"logger": logging.getLogger(__name__), "analysis_history_dir": str(tmp_path),
+              "analysis_history_file_id": None, "revenue_percentage": "10"}
+    summary = main.report_accuracy(config)
+    assert summary.loc["FINAL", "recommendations"] == 2 and summary.loc["FINAL", "hit_rate"] == 0.5
+    # Every model that answered BUY has its own breakdown
+    assert summary.loc["LLM1", "recommendations"] == 2 and summary.loc["LLM1", "hit_rate"] == 0.5
+    assert summary.loc["LLM2", "recommendations"] == 1 and summary.loc["LLM2", "hit_rate"] == 1.0
+    assert main.report_accuracy(config, start="2026-01-01") is None
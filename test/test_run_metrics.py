@@ -0,0 +1,37 @@
+import json
+import pytest
+from tools import run_metrics
+
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    run_metrics.reset()
+    yield
+    run_metrics.reset()
+
+def test_counters_and_observations_summary():
+    run_metrics.increment("llm.requests")
+    run_metrics.increment("llm.requests", 2)
+    for value in [1, 2, 3, 4, 100]:
+        run_metrics.observe("llm.latency_ms", value)
+
+    summary = run_metrics.get_summary()
+
+    assert summary["llm.requests"] == 3
+    assert summary["llm.latency_ms"]["count"] == 5
+    assert summary["llm.latency_ms"]["p50"] == 3
+    assert summary["llm.latency_ms"]["p95"] == 100
+    assert summary["llm.latency_ms"]["max"] == 100
+
+def test_percentile_nearest_rank():
+    assert run_metrics.percentile([], 50) is None
+    assert run_metrics.percentile([5], 95) == 5
+    assert run_metrics.percentile(list(range(1, 101)), 95) == 95
+
+def test_save_summary(tmp_path):
+    run_metrics.set_value("gate.pass_rate", 0.25)
+    path = tmp_path / "metrics.json"
+
+    run_metrics.save_summary(path)
+
+    assert json.loads(path.read_text())["gate.pass_rate"] == 0.25
@@ -0,0 +1,89 @@
+import json
+import time
+import pytest
+import numpy as np
+import main
+from tools import screening, run_metrics
+
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    run_metrics.reset()
+    yield
+    run_metrics.reset()
+
+def quotes(changes, price=10.0):
+    return [{"symbol": f"S{i}", "current_price": price, "change_percent": change} for i, change in enumerate(changes)]
+
+def test_screen_ranks_by_drop_and_keeps_top_k():
+    info = quotes([-1.0, -5.0, 2.0, None, -3.0])
+    survivors, report = screening.screen_symbols(info, top_k=2, indicators={})
+    assert [item["symbol"] for item in survivors] == ["S1", "S4"]
+    assert survivors[0] is info[1]
+    assert report["universe"] == 5
+    assert report["passed_filters"] == 4  # S3 has no change
+    assert run_metrics.get_counter("screening.survivors") == 2
+
+def test_screen_filters_and_cached_confidence():
+    info = quotes([-1.0, -2.0, 3.0])
+    info[2]["current_price"] = 2.0
+    indicators = {"S0": {"confidence": 1.0}, "S1": {"confidence": -1.0}}
+    survivors, _ = screening.screen_symbols(info, top_k=3, indicators=indicators, confidence_weight=2.0)
+    # S0: 1 + 2 = 3, S1: 2 - 2 = 0, S2: -3
+    assert [item["symbol"] for item in survivors] == ["S0", "S1", "S2"]
+
+    survivors, report = screening.screen_symbols(info, top_k=3, max_change_percent=0, min_price=5)
+    assert [item["symbol"] for item in survivors] == ["S1", "S0"]
+    assert report["passed_filters"] == 2
+
+def test_screen_large_universe_is_cheap():
+    rng = np.random.default_rng(1)
+    info = quotes(rng.normal(0, 2, 5000).tolist())
+    survivors, report = screening.screen_symbols(info, top_k=20, indicators={})
+    assert len(survivors) == 20
+    assert survivors[0]["change_percent"] == min(item["change_percent"] for item in info)
+
+def test_indicator_cache_roundtrip_and_ttl(tmp_path):
+    path = str(tmp_path / "indicators.json")
+    analysis = [
+        {"symbol": "AAA", "metrics": {"evaluation": "BUY", "confidence": 0.5, "signals": {"RSI": 40.0, "MACD": 1.0}}},
+        {"symbol": "BBB", "metrics": {"evaluation": "EVALUATION_FAILED", "confidence": 0.0, "signals": {}}},
+    ]
+    screening.update_indicator_cache(analysis, path)
+    cache = screening.load_indicator_cache(path)
+    assert list(cache) == ["AAA"]
+    assert cache["AAA"]["confidence"] == 0.5
+    assert cache["AAA"]["signals"] == {"RSI": 40.0}
+
+    with open(path) as f:
+        entries = json.load(f)
+    entries["AAA"]["updated_at"] = time.time() - 3 * 3600
+    with open(path, "w") as f:
+        json.dump(entries, f)
+    assert screening.load_indicator_cache(path, ttl_hours=2) == {}
+
+def test_load_universe(tmp_path):
+    text_file = tmp_path / "universe.txt"
+    text_file.write_text("# large caps\nAAPL\n\nMSFT\n")
+    json_file = tmp_path / "universe.json"
+    json_file.write_text(json.dumps({"NVDA": {"market": "NASDAQ"}, "KO": {"market": "NYSE"}}))
+    assert screening.load_universe(str(text_file)) == ["AAPL", "MSFT"]
+    assert screening.load_universe(str(json_file)) == ["NVDA", "KO"]
+
+def test_get_candidates_screens_only_when_enabled(monkeypatch, tmp_path):
+    info = quotes([-1.0, -4.0, -2.0])
+    requested = []
+    monkeypatch.setattr(main.finnhub_client, "get_symbols_info", lambda symbols: requested.append(symbols) or info)
+    monkeypatch.setattr(screening, "INDICATOR_CACHE_FILE", str(tmp_path / "indicators.json"))
+    universe = tmp_path / "universe.txt"
+    universe.write_text("S0\nS1\nS2\n")
+
+    config = {"symbols_interest_list": ["S0"], "screen_top_k": 0, "screen_universe_file": str(universe)}
+    assert main.get_candidates(config) == (info, info)
+    assert requested[-1] == ["S0"]
+
+    config["screen_top_k"] = 1
+    all_quotes, candidates = main.get_candidates(config)
+    assert requested[-1] == ["S0", "S1", "S2"]
+    assert all_quotes is info
+    assert [item["symbol"] for item in candidates] == ["S1"]
@@ -0,0 +1,86 @@
+import datetime
+import pandas as pd
+import pytest
+import main
+from tools import storage
+
+
+def make_frame():
+    df = pd.DataFrame({
+        "symbol": ["AAPL", "AMD"],
+        "current_price": [165.0, 145.0],
+        "sell_value": [None, None],
+        "sell_date": [None, None],
+    })
+    # Like a ledger after google_handler.register_sale: object columns holding numbers and dates
+    df["sell_value"] = df["sell_value"].astype(object)
+    df["sell_date"] = df["sell_date"].astype(object)
+    df.at[0, "sell_value"] = 170.0
+    df.at[0, "sell_date"] = datetime.date(2025, 9, 10)
+    return df
+
+@pytest.mark.parametrize("file_format", ["parquet", "csv"])
+def test_local_storage_roundtrip(tmp_path, file_format):
+    backend = storage.LocalStorage(tmp_path, file_format)
+    backend.save_frame(make_frame(), "transactions")
+    loaded = backend.load_frame("transactions")
+
+    assert (tmp_path / f"transactions.{file_format}").exists()
+    assert loaded["symbol"].tolist() == ["AAPL", "AMD"]
+    assert loaded.at[0, "sell_value"] == 170.0 and pd.isna(loaded.at[1, "sell_value"])
+    assert str(loaded.at[0, "sell_date"]) == "2025-09-10"
+    assert backend.load_frame("missing") is None
+
+def test_local_storage_versions(tmp_path):
+    backend = storage.LocalStorage(tmp_path, "csv", keep_versions=2)
+    for rows in (1, 2, 3):
+        backend.save_frame(make_frame().head(rows), "analysis")
+
+    versions = backend.list_versions("analysis")
+    assert len(versions) == 2
+    assert versions[0]["version"] < versions[1]["version"]
+    assert all(version["size"] > 0 for version in versions)
+    assert backend.list_versions("unknown") == []
+
+def test_save_frames_reports_each_file(tmp_path):
+    backend = storage.LocalStorage(tmp_path, "parquet")
+    results = backend.save_frames({"analysis": (make_frame(), "analysis"), "buy": (make_frame(), None)})
+    assert results["analysis"]["status"] == "ok" and results["analysis"]["rows"] == 2
+    assert results["buy"]["status"] == "error"
+
+def test_get_storage(monkeypatch, tmp_path):
+    monkeypatch.delenv("STORAGE_BACKEND", raising=False)
+    assert isinstance(storage.get_storage(), storage.DriveStorage)
+    assert storage.get_storage().default_file_id("analysis") is None
+
+    monkeypatch.setenv("STORAGE_BACKEND", "local")
+    monkeypatch.setenv("STORAGE_LOCAL_DIR", str(tmp_path))
+    monkeypatch.setenv("STORAGE_LOCAL_FORMAT", "csv")
+    backend = storage.get_storage()
+    assert isinstance(backend, storage.LocalStorage) and backend.file_format == "csv"
+    assert backend.default_file_id("analysis") == "analysis"
+
+    with pytest.raises(ValueError):
+        storage.get_storage("s3")
+    with pytest.raises(ValueError):
+        storage.LocalStorage(tmp_path, "xlsx")
+
+def test_drive_storage_delegates_to_google_handler(monkeypatch):
+    calls = []
+    monkeypatch.setattr(storage.google_handler, "load_data", lambda file_id: calls.append(("load", file_id)))
+    monkeypatch.setattr(storage.google_handler, "save_dataframes", lambda frames: calls.append(("save", list(frames))))
+    backend = storage.DriveStorage()
+    backend.load_frame("abc")
+    backend.save_frames({"analysis": (make_frame(), "abc")})
+    assert calls == [("load", "abc"), ("save", ["analysis"])]
+
+def test_save_outputs_offline(tmp_path):
+    backend = storage.LocalStorage(tmp_path, "parquet")
+    config = {"storage": backend, "buy_file_id": "buy_recommendations", "analysis_file_id": "analysis"}
+    main.save_outputs({"transactions": (make_frame(), "transactions")}, make_frame().head(1), make_frame(), config)
+    assert len(backend.load_frame("buy_recommendations")) == 1
+    assert len(backend.load_frame("transactions")) == 2
+
+    config["analysis_file_id"] = None
+    with pytest.raises(Exception, match="analysis"):
+        main.save_outputs({}, make_frame(), make_frame(), config)
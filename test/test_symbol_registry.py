@@ -0,0 +1,61 @@
+import os
+import json
+import main
+from tools import symbol_registry
+
+
+def write_resources(tmp_path, markets, mapping_rows=(("AAPL", "apple-corp"),)):
+    mapping_path = tmp_path / "mapping.csv"
+    mapping_path.write_text("symbol,mapping_string\n" + "".join(f"{s},{m}\n" for s, m in mapping_rows), encoding="utf-8")
+    markets_path = tmp_path / "markets.json"
+    markets_path.write_text(json.dumps(markets), encoding="utf-8")
+    return mapping_path, markets_path
+
+
+def test_lookups(tmp_path):
+    mapping_path, markets_path = write_resources(tmp_path, {
+        "NVDA": {"market": "NASDAQ"},
+        "RHM.DE": {"market": "XETR", "symbol": "RHM", "tickers": {"finnhub": "RHM.DE", "alpha": "RHM.DEX"}},
+    }, [("AAPL", "apple-corp"), ("AAPL", "duplicate")])
+    registry = symbol_registry.SymbolRegistry(mapping_path, markets_path)
+
+    assert registry.mapping_string("AAPL") == "apple-corp"
+    assert registry.mapping_string("MSFT") is None
+    assert registry.market("RHM.DE") == "XETR" and registry.market("UNKNOWN") is None
+    assert registry.tradingview_url("RHM.DE") == "https://en.tradingview.com/symbols/XETR-RHM/technicals/"
+    assert registry.tradingview_url("UNKNOWN") is None and registry.tradingview_url(None) is None
+    assert registry.provider_ticker("RHM.DE", "historicals") == "RHM"
+    assert registry.provider_ticker("RHM.DE", "alpha") == "RHM.DEX"
+    assert registry.provider_ticker("NVDA", "finnhub") == "NVDA"
+
+
+def test_reloads_changed_files_only(tmp_path, monkeypatch):
+    mapping_path, markets_path = write_resources(tmp_path, {"NVDA": {"market": "NASDAQ"}})
+    registry = symbol_registry.SymbolRegistry(mapping_path, markets_path, check_seconds=0)
+    reads = []
+    original = registry._read_markets
+    monkeypatch.setattr(registry, "_read_markets", lambda: reads.append(1) or original())
+
+    for _ in range(100):
+        assert registry.market("NVDA") == "NASDAQ"
+    assert len(reads) == 1
+
+    markets_path.write_text(json.dumps({"NVDA": {"market": "NYSE"}}), encoding="utf-8")
+    stat = markets_path.stat()
+    os.utime(markets_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert registry.market("NVDA") == "NYSE"
+    assert len(reads) == 2
+
+
+def test_missing_files_are_empty(tmp_path):
+    registry = symbol_registry.SymbolRegistry(tmp_path / "missing.csv", tmp_path / "missing.json")
+    assert registry.mapping_string("AAPL") is None and registry.market("AAPL") is None
+
+
+def test_analyze_symbol_keeps_listed_symbol(monkeypatch):
+    fetched = []
+    monkeypatch.setattr(main.historicals, "get_historical_data", lambda ticker: fetched.append(ticker))
+    monkeypatch.setattr(main.cfc, "evaluate_buy_interest", lambda ticker, hist, price: {"evaluation": "HOLD"})
+    result = main.analyze_symbol({"symbol": "RHM.DE", "current_price": 1500.0})
+    assert fetched == ["RHM"]
+    assert result["symbol"] == "RHM.DE"
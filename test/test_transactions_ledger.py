@@ -0,0 +1,114 @@
+import io
+import pandas as pd
+import pytest
+import main
+from tools import transactions_ledger as ledger
+from tools.storage import LocalStorage
+
+
+def csv_roundtrip(df):
+    # What Drive gives back on the next run
+    return pd.read_csv(io.StringIO(df.to_csv(index=False)))
+
+def make_snapshot():
+    return csv_roundtrip(pd.DataFrame({
+        "symbol": ["AAPL", "AMD"],
+        "buy_value": [150.0, 140.0],
+        "buy_date": ["2025-09-01 10:00", "2025-09-02 10:00"],
+        "sell_value": [None, None],
+        "sell_date": [None, None],
+        "buy_sell_days_diff": [None, None],
+        "percentage_benefit": [None, None],
+    }))
+
+def make_buys():
+    return pd.DataFrame({"symbol": ["NVDA"], "buy_value": [100.0], "buy_date": ["2025-09-05 10:00"], "action": ["BUY"]})
+
+def test_apply_log_inserts_and_closes():
+    snapshot = make_snapshot()
+    after = snapshot.copy()
+    after["sell_value"] = after["sell_value"].astype(object)
+    after["sell_date"] = after["sell_date"].astype(object)
+    after.at[0, "sell_value"] = 170.0
+    after.at[0, "sell_date"] = "2025-09-10"
+
+    entries = ledger.close_entries(snapshot, after) + ledger.insert_entries(make_buys())
+    assert [entry["op"] for entry in entries] == ["close", "insert"]
+
+    log = csv_roundtrip(ledger.append_entries(ledger.empty_log(), entries))
+    current = ledger.apply_log(snapshot, log)
+    assert current["symbol"].tolist() == ["AAPL", "AMD", "NVDA"]
+    assert current.at[0, "sell_value"] == 170.0
+    assert current.at[0, "sell_date"] == "2025-09-10"
+    assert pd.isna(current.at[1, "sell_value"])
+    assert current.at[2, "action"] == "BUY"
+
+def test_apply_log_is_idempotent_after_compaction():
+    snapshot = make_snapshot()
+    log = ledger.append_entries(None, ledger.insert_entries(make_buys()))
+    log = ledger.append_entries(log, ledger.close_entries_for_rows(pd.DataFrame({
+        "symbol": ["NVDA"], "buy_date": ["2025-09-05 10:00"], "sell_value": [120.0],
+        "sell_date": ["2025-09-08"], "buy_sell_days_diff": [3], "percentage_benefit": [20.0]})))
+
+    compacted, empty = ledger.compact(snapshot, log)
+    assert empty.empty and list(empty.columns) == ledger.DELTA_COLUMNS
+    assert compacted["symbol"].tolist() == ["NVDA", "AMD", "AAPL"]  # newest first
+    assert compacted.at[0, "sell_value"] == 120.0
+
+    # Replaying the log over the new snapshot (e.g. it could not be cleared) changes nothing
+    replayed = ledger.apply_log(csv_roundtrip(compacted), csv_roundtrip(log))
+    assert len(replayed) == 3
+    pd.testing.assert_frame_equal(replayed, csv_roundtrip(compacted), check_dtype=False)
+
+def test_transaction_key_ignores_date_formatting():
+    assert ledger.transaction_key("AAPL", "2025-09-01 10:00") == ledger.transaction_key("AAPL", "2025-09-01 10:00:00")
+    assert ledger.needs_compaction(ledger.empty_log(), compact_every=1) is False
+
+def test_update_transactions_df_delta_mode(monkeypatch, tmp_path):
+    storage = LocalStorage(tmp_path, "csv")
+    storage.save_frame(make_snapshot(), "tx")
+    storage.save_frame(ledger.empty_log(), "delta")
+    config = {"storage": storage, "transactions_file_id": "tx", "transactions_delta_file_id": "delta",
+              "revenue_percentage": "10", "max_records": 100}
+    prices = [{"symbol": "AAPL", "current_price": 170.0}, {"symbol": "AMD", "current_price": 141.0}]
+
+    frames, followup = main.update_transactions_df(config, prices, make_buys())
+    assert list(frames) == ["transactions_delta"] and followup == {}
+    log, file_id = frames["transactions_delta"]
+    assert file_id == "delta"
+    assert log["op"].tolist() == ["close", "insert"]
+
+    # Next run: snapshot + log is the current ledger; compaction rewrites the snapshot first
+    storage.save_frame(log, "delta")
+    monkeypatch.setattr(ledger, "COMPACT_EVERY", 3)
+    frames, followup = main.update_transactions_df(config, prices, make_buys().assign(buy_date="2025-09-06 10:00"))
+    snapshot, _ = frames["transactions"]
+    assert snapshot["symbol"].tolist() == ["NVDA", "NVDA", "AMD", "AAPL"]
+    assert snapshot.loc[snapshot["symbol"] == "AAPL", "sell_value"].item() == 170.0
+    assert followup["transactions_delta"][0].empty
+
+def test_unreadable_delta_log_stops_the_run(tmp_path):
+    storage = LocalStorage(tmp_path, "csv")
+    storage.save_frame(make_snapshot(), "tx")
+    with pytest.raises(Exception, match="delta log"):
+        main.load_ledger({"storage": storage, "transactions_file_id": "tx", "transactions_delta_file_id": "missing"})
+
+def test_update_transactions_df_starts_an_empty_local_ledger(tmp_path):
+    # First run with STORAGE_BACKEND=local: the transactions file doesn't exist yet
+    storage = LocalStorage(tmp_path, "parquet")
+    prices = [{"symbol": "NVDA", "current_price": 100.0}]
+    config = {"storage": storage, "transactions_file_id": "transactions", "revenue_percentage": "10", "max_records": 100}
+
+    frames, followup = main.update_transactions_df(config, prices, make_buys())
+    transactions, file_id = frames["transactions"]
+    assert file_id == "transactions" and followup == {}
+    assert transactions["symbol"].tolist() == ["NVDA"]
+    assert set(ledger.LEDGER_COLUMNS) <= set(transactions.columns)
+    storage.save_frame(transactions, file_id)
+    assert storage.load_frame("transactions")["symbol"].tolist() == ["NVDA"]
+
+def test_unreadable_transactions_file_stops_the_run(tmp_path):
+    storage = LocalStorage(tmp_path, "csv")
+    (tmp_path / "tx.csv").write_text("")
+    with pytest.raises(Exception, match="Transactions file"):
+        main.load_ledger({"storage": storage, "transactions_file_id": "tx"})
@@ -0,0 +1,302 @@
+import os
+import json
+import uuid
+import logging
+from datetime import datetime, timezone
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+# Append-only history of every analysis run, stored as Parquet under
+#   <HISTORY_DIR>/run_month=YYYY-MM/part-<run_id>.parquet
+# Each run adds one file (rows sorted by symbol); past months are compacted into a single file
+# sorted by symbol and run date, so the row group statistics let readers skip most of each file.
+# Queries prune the month directories first and push the symbol/date/action filters down to Parquet.
+# The directory can be a cache of a durable copy kept in the storage backend (ANALYSIS_HISTORY_FILE_ID):
+# runs missing locally are restored from it and the updated history is saved back after each run.
+HISTORY_DIR = os.environ.get("ANALYSIS_HISTORY_DIR", "history")
+ROW_GROUP_ROWS = int(os.environ.get("ANALYSIS_HISTORY_ROW_GROUP_ROWS") or 16_384)
+
+HISTORY_SCHEMA = pa.schema([
+    ("run_id", pa.string()),
+    ("run_at", pa.timestamp("us", tz="UTC")),
+    ("run_date", pa.date32()),
+    ("symbol", pa.string()),
+    ("current_price", pa.float64()),
+    ("change_percent", pa.float64()),
+    ("evaluation", pa.string()),
+    ("confidence", pa.float64()),
+    ("signals", pa.string()),  # JSON
+    ("llm_opinion", pa.string()),
+    ("llm_2_opinion", pa.string()),
+    ("action", pa.string()),
+    ("llm_model", pa.string()),
+    ("llm_latency_ms", pa.float64()),
+])
+
+_PARTITION_PREFIX = "run_month="
+
+
+def _llm_usage_by_symbol(llm_records):
+    # Models asked about each symbol and their latency (batched calls shared evenly between their symbols)
+    usage = {}
+    for record in llm_records or []:
+        share = 1 / max(len(record["symbols"]), 1)
+        for symbol in record["symbols"]:
+            models, latency = usage.get(symbol, ([], 0.0))
+            if record["model"] and record["model"] not in models:
+                models.append(record["model"])
+            usage[symbol] = (models, latency + (record["latency_ms"] or 0) * share)
+    return usage
+
+
+def build_run_frame(analysis_df, analysis_results, llm_records=None, run_at=None, run_id=None):
+    """
+    Rows of one run in the history schema.
+
+    Parameters:
+        analysis_df (pd.DataFrame): Final analysis of the run (prices, opinions, action)
+        analysis_results (list): Output of main.analyze_symbol (evaluation, confidence and signals per symbol)
+        llm_records (list): llm_telemetry.get_records() of the run (model and latency per symbol)
+        run_at (datetime): Run time (now by default)
+        run_id (str): Run identifier (generated by default)
+
+    Returns:
+        pd.DataFrame with the HISTORY_SCHEMA columns
+    """
+    run_at = pd.Timestamp(run_at or datetime.now(timezone.utc))
+    run_at = run_at.tz_localize("UTC") if run_at.tzinfo is None else run_at.tz_convert("UTC")
+    run_id = run_id or f"{run_at.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+    metrics = {item["symbol"]: item["metrics"] for item in analysis_results or []}
+    usage = _llm_usage_by_symbol(llm_records)
+
+    # A run without candidates may come as a frame without columns
+    symbols = analysis_df["symbol"] if "symbol" in analysis_df.columns else pd.Series(dtype=object)
+    df = pd.DataFrame({"symbol": symbols.astype(str).to_numpy()})
+    for column in ("current_price", "change_percent", "llm_opinion", "llm_2_opinion", "action"):
+        df[column] = analysis_df[column].to_numpy() if column in analysis_df.columns else None
+
+    df["evaluation"] = [metrics.get(symbol, {}).get("evaluation") for symbol in df["symbol"]]
+    df["confidence"] = [metrics.get(symbol, {}).get("confidence") for symbol in df["symbol"]]
+    df["signals"] = [json.dumps(metrics[symbol]["signals"], default=str) if symbol in metrics else None
+                     for symbol in df["symbol"]]
+    df["llm_model"] = [(",".join(usage[symbol][0]) or None) if symbol in usage else None for symbol in df["symbol"]]
+    df["llm_latency_ms"] = [round(usage[symbol][1], 2) if symbol in usage else None for symbol in df["symbol"]]
+
+    df["run_id"] = run_id
+    df["run_at"] = run_at
+    df["run_date"] = run_at.date()
+    return df[HISTORY_SCHEMA.names]
+
+
+_STRING_COLUMNS = [field.name for field in HISTORY_SCHEMA if pa.types.is_string(field.type)]
+_FLOAT_COLUMNS = [field.name for field in HISTORY_SCHEMA if pa.types.is_floating(field.type)]
+
+
+def _from_storage(df):
+    # A copy loaded from the storage backend (CSV on Drive, or Parquet) back to the history types
+    df = df.reindex(columns=HISTORY_SCHEMA.names)
+    df["run_at"] = pd.to_datetime(df["run_at"], utc=True, format="ISO8601")
+    df["run_date"] = pd.to_datetime(df["run_date"]).dt.date
+    for column in _FLOAT_COLUMNS:
+        df[column] = pd.to_numeric(df[column], errors="coerce")
+    for column in _STRING_COLUMNS:
+        df[column] = df[column].map(lambda value: None if pd.isna(value) else str(value)).astype(object)
+    return df
+
+
+def _to_table(df):
+    df = df.reindex(columns=HISTORY_SCHEMA.names)
+    for column in ("llm_opinion", "llm_2_opinion", "evaluation", "action"):
+        df[column] = df[column].map(lambda value: value if value is None or pd.isna(value) else str(value))
+    return pa.Table.from_pandas(df, schema=HISTORY_SCHEMA, preserve_index=False)
+
+
+def _write(table, path):
+    # Files starting with "." are ignored by dataset readers until renamed
+    tmp_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.tmp")
+    pq.write_table(table, tmp_path, row_group_size=ROW_GROUP_ROWS)
+    os.replace(tmp_path, path)
+
+
+def _month(value):
+    return pd.Timestamp(value).strftime("%Y-%m")
+
+
+def append_run(run_df, root=None):
+    """
+    Append the rows of one run to the history (one new Parquet file in the run's month partition).
+
+    Returns:
+        Path of the written file (None when the run has no rows: nothing is written)
+    """
+    root = root or HISTORY_DIR
+    if run_df.empty:
+        logger.info("No analysis rows in this run, nothing appended to the history")
+        return None
+    table = _to_table(run_df.sort_values("symbol", kind="stable"))
+    run_id = run_df["run_id"].iloc[0]
+    partition = os.path.join(root, f"{_PARTITION_PREFIX}{_month(run_df['run_date'].iloc[0])}")
+    os.makedirs(partition, exist_ok=True)
+    path = os.path.join(partition, f"part-{run_id}.parquet")
+    _write(table, path)
+    logger.info(f"✅ {len(run_df)} analysis rows appended to the history ({path})")
+    return path
+
+
+def _partitions(root, start=None, end=None):
+    # Month directories overlapping [start, end]
+    if not os.path.isdir(root):
+        return []
+    first = _month(start) if start is not None else None
+    last = _month(end) if end is not None else None
+    partitions = []
+    for name in sorted(os.listdir(root)):
+        if not name.startswith(_PARTITION_PREFIX):
+            continue
+        month = name[len(_PARTITION_PREFIX):]
+        if (first is None or month >= first) and (last is None or month <= last):
+            partitions.append(os.path.join(root, name))
+    return partitions
+
+
+def _files(partition):
+    return sorted(os.path.join(partition, name) for name in os.listdir(partition)
+                  if name.endswith(".parquet") and not name.startswith((".", "_")))
+
+
+def compact(root=None, keep_month=None):
+    """
+    Merge the run files of each month into one file sorted by symbol and run time.
+    The month of keep_month (the current one by default) is left alone, as runs are still being added to it.
+
+    Returns:
+        Number of months compacted
+    """
+    root = root or HISTORY_DIR
+    keep = _month(keep_month or datetime.now(timezone.utc))
+    compacted = 0
+    for partition in _partitions(root):
+        files = _files(partition)
+        if len(files) < 2 or os.path.basename(partition)[len(_PARTITION_PREFIX):] >= keep:
+            continue
+        table = ds.dataset(files, schema=HISTORY_SCHEMA, format="parquet").to_table()
+        table = table.sort_by([("symbol", "ascending"), ("run_at", "ascending")])
+        _write(table, os.path.join(partition, f"part-compacted-{uuid.uuid4().hex[:8]}.parquet"))
+        for path in files:
+            os.remove(path)
+        compacted += 1
+        logger.info(f"✅ Compacted {len(files)} history files of {partition} ({table.num_rows} rows)")
+    return compacted
+
+
+def query_history(symbols=None, start=None, end=None, actions=None, columns=None, root=None):
+    """
+    Read analysis history rows. Only the month partitions overlapping [start, end] are opened, and
+    the filters and column selection are pushed down to the Parquet reader.
+
+    Parameters:
+        symbols (list): Symbols to return (all when None)
+        start, end (date or str): Inclusive run date range (open when None)
+        actions (list): Final actions to return, e.g. ["BUY"] (all when None)
+        columns (list): Columns to read (all HISTORY_SCHEMA columns when None)
+        root (str): History directory (HISTORY_DIR by default)
+
+    Returns:
+        pd.DataFrame ordered by run time and symbol
+    """
+    root = root or HISTORY_DIR
+    columns = list(columns or HISTORY_SCHEMA.names)
+    files = [path for partition in _partitions(root, start, end) for path in _files(partition)]
+    if not files:
+        return pd.DataFrame(columns=columns)
+
+    conditions = []
+    if symbols is not None:
+        conditions.append(ds.field("symbol").isin(list(symbols)))
+    if start is not None:
+        conditions.append(ds.field("run_date") >= pd.Timestamp(start).date())
+    if end is not None:
+        conditions.append(ds.field("run_date") <= pd.Timestamp(end).date())
+    if actions is not None:
+        conditions.append(ds.field("action").isin(list(actions)))
+    condition = None
+    for expression in conditions:
+        condition = expression if condition is None else condition & expression
+
+    # Sort keys are read as well, and dropped afterwards if they were not asked for
+    read_columns = list(dict.fromkeys(columns + ["run_at", "symbol"]))
+    table = ds.dataset(files, schema=HISTORY_SCHEMA, format="parquet").to_table(columns=read_columns, filter=condition)
+    table = table.sort_by([("run_at", "ascending"), ("symbol", "ascending")])
+    return table.select(columns).to_pandas()
+
+
+def get_symbol_history(symbol, start=None, end=None, columns=None, root=None):
+    """Signals and decisions of one symbol over time."""
+    return query_history(symbols=[symbol], start=start, end=end, columns=columns, root=root)
+
+
+def restore_missing_runs(storage_backend, file_id, root=None):
+    """
+    Restore the runs of the stored copy of the history (file_id in the storage backend) that are missing
+    from the local directory, e.g. on a new CI runner whose cache was evicted.
+
+    Returns:
+        True when the local history now holds every stored run, so it can be saved over the stored copy;
+        False when the stored copy exists but could not be read (it must not be overwritten)
+    """
+    root = root or HISTORY_DIR
+    stored = storage_backend.load_frame(file_id)
+    if stored is None:
+        if storage_backend.exists(file_id):
+            logger.error(f"❌ Stored analysis history {file_id} could not be loaded, it is not updated by this run")
+            return False
+        return True
+    if stored.empty:
+        return True
+
+    stored = _from_storage(stored)
+    local_runs = set(query_history(columns=["run_id"], root=root)["run_id"])
+    missing = stored[~stored["run_id"].isin(local_runs)]
+    if missing.empty:
+        return True
+
+    if local_runs:
+        logger.warning(f"Local analysis history in {root} is behind the stored copy, restoring the missing runs")
+    else:
+        logger.error(f"❌ Local analysis history in {root} is empty (e.g. cache miss), restoring it from {file_id}")
+    for month, rows in missing.groupby(missing["run_date"].map(_month)):
+        partition = os.path.join(root, f"{_PARTITION_PREFIX}{month}")
+        os.makedirs(partition, exist_ok=True)
+        table = _to_table(rows.sort_values(["symbol", "run_at"], kind="stable"))
+        _write(table, os.path.join(partition, f"part-restored-{uuid.uuid4().hex[:8]}.parquet"))
+    logger.info(f"✅ {missing['run_id'].nunique()} runs ({len(missing)} rows) restored to the analysis history")
+    return True
+
+
+def save_to_storage(storage_backend, file_id, root=None):
+    """Save the whole local history as the stored copy (file_id in the storage backend)."""
+    df = query_history(root=root)
+    storage_backend.save_frame(df, file_id)
+    logger.info(f"✅ Analysis history saved to {file_id} ({len(df)} rows)")
+    return df
+
+
+def get_buys(start=None, end=None, columns=None, root=None):
+    """All BUY decisions in a run date range."""
+    return query_history(start=start, end=end, actions=["BUY"], columns=columns, root=root)
+
+
+def record_run(analysis_df, analysis_results, llm_records=None, run_at=None, root=None):
+    """Append the run to the history and compact the finished months (used by main.py)."""
+    root = root or HISTORY_DIR
+    run_df = build_run_frame(analysis_df, analysis_results, llm_records, run_at)
+    path = append_run(run_df, root)
+    if path is None:
+        return None
+    compact(root, keep_month=run_df["run_date"].iloc[0])
+    return path
@@ -1,8 +1,17 @@
 import os
+import json
+import time
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, Future
+import numpy as np
+import pandas as pd
+import websocket
 from dotenv import load_dotenv
 import ast
 import logging
+from tools import google_handler, run_metrics
 
 logger = logging.getLogger(__name__)
 
@@ -14,64 +23,415 @@ if not os.getenv("GITHUB_ACTIONS"):  # This var is auto-set in GitHub Actions
 SYMBOLS_INTEREST_LIST = ast.literal_eval(os.environ.get("SYMBOLS_INTEREST_LIST", "[]"))
 
 API_KEY = os.environ.get("FINNHUB_API_KEY")
+API_URL = os.environ.get("FINNHUB_API_URL", "https://finnhub.io/api/v1")
 
-def get_quote(symbol):
-    """Fetch current quote data for a symbol from Finnhub"""
-    url = "https://finnhub.io/api/v1/quote"
+# Request settings (Finnhub free tier: 60 calls/minute, at most 30 calls/second)
+RATE_LIMIT_PER_MINUTE = int(os.environ.get("FINNHUB_RATE_LIMIT_PER_MINUTE") or 60)
+RATE_LIMIT_BURST = int(os.environ.get("FINNHUB_RATE_LIMIT_BURST") or 30)
+MAX_WORKERS = int(os.environ.get("FINNHUB_MAX_WORKERS") or 8)
+TIMEOUT_SECONDS = float(os.environ.get("FINNHUB_TIMEOUT_SECONDS") or 10)
+MAX_RETRIES = 2
+
+# Quote cache: quotes younger than the TTL are reused (0 disables it), optionally persisted between runs
+QUOTE_CACHE_TTL_SECONDS = float(os.environ.get("FINNHUB_QUOTE_TTL_SECONDS") or 60)
+QUOTE_CACHE_FILE = os.environ.get("FINNHUB_QUOTE_CACHE_FILE", "")
+
+# Streaming mode (trade updates over WebSocket)
+WS_URL = os.environ.get("FINNHUB_WS_URL", "wss://ws.finnhub.io")
+STREAM_FLUSH_SIZE = int(os.environ.get("FINNHUB_STREAM_FLUSH_SIZE") or 10)
+STREAM_FLUSH_SECONDS = float(os.environ.get("FINNHUB_STREAM_FLUSH_SECONDS") or 60)
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: refills rate_per_minute tokens per minute up to capacity (the burst size).
+    acquire() blocks until a token is available.
+    """
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate_per_second = rate_per_minute / 60
+        self.capacity = capacity or rate_per_minute
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate_per_second)
+        self.updated = now
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate_per_second
+            time.sleep(wait)
+
+class QuoteCache:
+    """
+    Quote cache with a TTL, an in-process tier and an optional JSON file tier (shared between runs).
+    Concurrent callers asking for the same missing symbol share a single request (single flight).
+    Hits and misses are reported to run_metrics as finnhub.quote_cache.*.
+    """
+
+    def __init__(self, ttl=None, path=None):
+        self.ttl = QUOTE_CACHE_TTL_SECONDS if ttl is None else ttl
+        self.path = QUOTE_CACHE_FILE if path is None else path
+        self.entries = {}
+        self.inflight = {}
+        self.lock = threading.Lock()
+        self.disk_loaded = False
+        self.dirty = False
+
+    def _is_fresh(self, entry):
+        return entry is not None and time.time() - entry["fetched_at"] < self.ttl
+
+    def _load_disk(self):
+        # Called with the lock held
+        self.disk_loaded = True
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable quote cache {self.path}: {e}")
+            return {}
+
+    def _record(self, outcome):
+        run_metrics.increment(f"finnhub.quote_cache.{outcome}")
+        hits = run_metrics.get_counter("finnhub.quote_cache.memory_hits") + \
+            run_metrics.get_counter("finnhub.quote_cache.disk_hits") + \
+            run_metrics.get_counter("finnhub.quote_cache.shared")
+        total = hits + run_metrics.get_counter("finnhub.quote_cache.misses")
+        run_metrics.set_value("finnhub.quote_cache.hit_ratio", round(hits / total, 4))
+
+    def get(self, symbol, fetch):
+        """Return the cached quote of symbol or call fetch(symbol) once for all concurrent callers."""
+        if self.ttl <= 0:
+            return fetch(symbol)
+
+        with self.lock:
+            if self._is_fresh(self.entries.get(symbol)):
+                self._record("memory_hits")
+                return self.entries[symbol]["quote"]
+
+            if not self.disk_loaded:
+                for key, entry in self._load_disk().items():
+                    self.entries.setdefault(key, entry)
+                if self._is_fresh(self.entries.get(symbol)):
+                    self._record("disk_hits")
+                    return self.entries[symbol]["quote"]
+
+            future = self.inflight.get(symbol)
+            leader = future is None
+            if leader:
+                future = self.inflight[symbol] = Future()
+
+        if not leader:
+            self._record("shared")
+            return future.result()
+
+        self._record("misses")
+        try:
+            quote = fetch(symbol)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(quote)
+            with self.lock:
+                self.entries[symbol] = {"quote": quote, "fetched_at": time.time()}
+                self.dirty = True
+            return quote
+        finally:
+            with self.lock:
+                self.inflight.pop(symbol, None)
+
+    def save(self):
+        """Write fresh entries to the file tier (atomic replace), if enabled and changed."""
+        with self.lock:
+            if not self.path or not self.dirty:
+                return
+            entries = {symbol: entry for symbol, entry in self.entries.items() if self._is_fresh(entry)}
+            self.dirty = False
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.dirty = False
+
+quote_cache = QuoteCache()
+
+_rate_limiter = TokenBucket(RATE_LIMIT_PER_MINUTE, min(RATE_LIMIT_BURST, RATE_LIMIT_PER_MINUTE))
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """Shared pooled HTTP session for all Finnhub requests (keep-alive across symbols)."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            _session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=MAX_WORKERS))
+            _session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=MAX_WORKERS))
+        return _session
+
+def get_quote(symbol, use_cache=True):
+    """Fetch current quote data for a symbol from Finnhub (through the quote cache unless use_cache is False)"""
+    if use_cache:
+        return quote_cache.get(symbol, _fetch_quote)
+    return _fetch_quote(symbol)
+
+def _fetch_quote(symbol):
+    url = f"{API_URL}/quote"
     params = {"symbol": symbol, "token": API_KEY}
-    response = requests.get(url, params=params)
-    response.raise_for_status()
-    return response.json()
+
+    for attempt in range(MAX_RETRIES + 1):
+        _rate_limiter.acquire()
+        response = get_session().get(url, params=params, timeout=TIMEOUT_SECONDS)
+        if response.status_code == 429 and attempt < MAX_RETRIES:
+            retry_after = float(response.headers.get("Retry-After") or 1)
+            logger.warning(f"Finnhub rate limit hit for {symbol}, retrying in {retry_after}s")
+            time.sleep(retry_after)
+            continue
+        response.raise_for_status()
+        return response.json()
+
+def get_quotes(symbols, max_workers=None):
+    """
+    Fetch quotes concurrently, sharing the rate limiter and the pooled session.
+
+    Returns:
+        List of (symbol, quote dict or None, error or None) in the same order as symbols
+    """
+    def fetch(symbol):
+        try:
+            return symbol, get_quote(symbol), None
+        except Exception as e:
+            return symbol, None, e
+
+    if not symbols:
+        return []
+    with ThreadPoolExecutor(max_workers=max_workers or MAX_WORKERS, thread_name_prefix="finnhub") as executor:
+        results = list(executor.map(fetch, symbols))
+    quote_cache.save()
+    return results
 
 def get_symbols_info(symbols):
     symbols_info_list = []
 
     logger.info(f"Gathering market symbols info...")
+    started = time.perf_counter()
 
-    for symbol in symbols:
-        try:
-            quote = get_quote(symbol)
-            current_price = quote.get("c")
-            change_percent = quote.get("dp")
-
-            symbols_info_list.append({
-                "symbol": symbol,
-                "current_price": current_price,
-                "change_percent": change_percent
-            })
-        except Exception as e:
-            logger.error(f"❌ Error retrieving data for {symbol}: {e}")
+    for symbol, quote, error in get_quotes(symbols):
+        if error is not None:
+            logger.error(f"❌ Error retrieving data for {symbol}: {error}")
+            continue
+
+        symbols_info_list.append({
+            "symbol": symbol,
+            "current_price": quote.get("c"),
+            "change_percent": quote.get("dp")
+        })
 
-    # Sort the list by most negative change
+    logger.info(f"✅ Got {len(symbols_info_list)}/{len(symbols)} quotes in {time.perf_counter() - started:.2f}s")
     return symbols_info_list
 
+def _change_percent(symbol):
+    # change_percent as float, NaN when missing or not numeric (such symbols are never losers)
+    try:
+        value = symbol["change_percent"]
+        return float(value) if value is not None else np.nan
+    except (KeyError, TypeError, ValueError) as e:
+        logger.error(f"❌ Error retrieving data for {symbol}: {e}")
+        return np.nan
+
+def select_top_losers(change_percent, top_n=None):
+    """
+    Select the losers (change_percent < 0) from an array of changes, most negative first.
+
+    Uses a partial selection when top_n is smaller than the number of losers, so only the
+    selected items are sorted. Ties keep their input order, like a stable sort.
+
+    Parameters:
+        change_percent (array-like): Daily change per symbol (NaN for unknown)
+        top_n (int): Number of losers to return, None for all
+
+    Returns:
+        np.ndarray of indices into change_percent
+    """
+    change_percent = np.asarray(change_percent, dtype=float)
+    idx = np.flatnonzero(change_percent < 0)
+    values = change_percent[idx]
+
+    if top_n is not None and 0 <= top_n < len(idx):
+        if top_n == 0:
+            return idx[:0]
+        kth = np.partition(values, top_n - 1)[top_n - 1]
+        below = np.flatnonzero(values < kth)
+        ties = np.flatnonzero(values == kth)[:top_n - len(below)]
+        keep = np.sort(np.concatenate([below, ties]))
+        idx, values = idx[keep], values[keep]
+
+    order = np.argsort(values, kind="stable")
+    selected = idx[order]
+    return selected if top_n is None or top_n >= 0 else selected[:top_n]
+
 def analyze_market_losers_from_interest_list(symbols, top_n=None):
     """
     Analyze a list of predefined symbols and return the top losers
     based on percentage drop (dp field).
     """
-    losers = []
-
     logger.info(f"Analyzing market losers...")
 
-    for symbol in symbols:
-        try:
-            current_price = symbol['current_price']
-            change_percent = symbol['change_percent']
+    try:
+        # Fast path: one array conversion, None becomes NaN
+        change_percent = np.array([symbol["change_percent"] for symbol in symbols], dtype=float)
+    except (KeyError, TypeError, ValueError):
+        change_percent = np.fromiter((_change_percent(symbol) for symbol in symbols), dtype=float, count=len(symbols))
+    losers = [symbols[i] for i in select_top_losers(change_percent, top_n)]
 
-            # if symbol has had a change percent we add it as loser
-            if change_percent is not None and change_percent < 0:
-                losers.append(symbol)
-        except Exception as e:
-            logger.error(f"❌ Error retrieving data for {symbol}: {e}")
-
-    # Sort the list by most negative change
-    losers.sort(key=lambda x: x["change_percent"])
-    
     logger.info(f"✅  succesfully got market losers")
+    return losers
+
+
+# ---- streaming take-profit monitor ----
+
+class TakeProfitMonitor:
+    """
+    Applies the take-profit rule of google_handler.update_transactions to streamed trades:
+    an open transaction is sold as soon as a trade price reaches its REVENUE_PERCENTAGE target.
+    Sales are kept in memory and handed to on_flush in batches.
+    """
+
+    def __init__(self, transactions_df, revenue_percentage, on_flush, flush_size=None, flush_interval=None):
+        self.transactions = transactions_df.copy()
+        self.on_flush = on_flush
+        self.flush_size = flush_size or STREAM_FLUSH_SIZE
+        self.flush_interval = flush_interval if flush_interval is not None else STREAM_FLUSH_SECONDS
+        self.pending = []
+        self.last_flush = time.monotonic()
+        self.ticks = 0
+        self.sales = 0
+        self.flushes = 0
+
+        # symbol -> [(target_price, idx)] sorted by target, so each tick is one dict lookup and one comparison
+        self.targets = {}
+        if "sell_value" in self.transactions.columns:
+            open_rows = self.transactions[self.transactions["sell_value"].isna()]
+        else:
+            open_rows = self.transactions
+        for idx, row in open_rows.iterrows():
+            buy_value = pd.to_numeric(row["buy_value"], errors="coerce")
+            if pd.isna(buy_value):
+                continue
+            target = google_handler.get_target_price(buy_value, revenue_percentage)
+            self.targets.setdefault(row["symbol"], []).append((target, idx))
+        for targets in self.targets.values():
+            targets.sort(key=lambda target: target[0])
+
+    @property
+    def symbols(self):
+        return list(self.targets)
+
+    def on_trade(self, symbol, price):
+        """Process one trade. Returns True when it closed at least one position."""
+        self.ticks += 1
+        targets = self.targets.get(symbol)
+        if not targets or price < targets[0][0]:
+            return False
+
+        while targets and price >= targets[0][0]:
+            _, idx = targets.pop(0)
+            google_handler.register_sale(self.transactions, idx, price)
+            self.pending.append(idx)
+            self.sales += 1
+            logger.info(f"✅ Take profit reached for {symbol} at {price}")
+        if not targets:
+            del self.targets[symbol]
+        return True
+
+    def should_flush(self):
+        if not self.pending:
+            return False
+        return len(self.pending) >= self.flush_size or time.monotonic() - self.last_flush >= self.flush_interval
+
+    def flush(self):
+        """Hand the ledger and the rows sold since the last flush to on_flush."""
+        self.last_flush = time.monotonic()
+        if not self.pending:
+            return
+        sold, self.pending = self.pending, []
+        self.on_flush(self.transactions.copy(), sold)
+        self.flushes += 1
+
+    def get_stats(self):
+        return {"ticks": self.ticks, "sales": self.sales, "flushes": self.flushes, "open_symbols": len(self.targets)}
+
+
+def stream_take_profit(monitor, url=None, duration=None, stop_event=None):
+    """
+    Subscribe to trade updates of the symbols with open transactions and feed them to the monitor.
+
+    Parameters:
+        monitor (TakeProfitMonitor): Open positions and sell logic
+        url (str): WebSocket endpoint (FINNHUB_WS_URL, e.g. the local stub in tools/finnhub_ws_stub.py)
+        duration (float): Seconds to stream, None until every position is sold or the stream closes
+        stop_event (threading.Event): Optional event to stop streaming from another thread
+
+    Returns:
+        Monitor stats (ticks, sales, flushes, open_symbols) plus elapsed seconds and ticks per second
+    """
+    if not monitor.symbols:
+        logger.info("No open transactions to monitor")
+        return monitor.get_stats()
+
+    url = url or WS_URL
+    ws = websocket.create_connection(f"{url}?token={API_KEY}", timeout=TIMEOUT_SECONDS)
+    for symbol in monitor.symbols:
+        ws.send(json.dumps({"type": "subscribe", "symbol": symbol}))
+    logger.info(f"Streaming trades for {len(monitor.symbols)} symbols...")
+
+    # Wake up regularly to flush pending sales even when no trades arrive
+    ws.settimeout(max(min(1.0, monitor.flush_interval), 0.05))
+    started = time.monotonic()
+    try:
+        while monitor.symbols:
+            if duration is not None and time.monotonic() - started >= duration:
+                break
+            if stop_event is not None and stop_event.is_set():
+                break
+            try:
+                message = ws.recv()
+            except websocket.WebSocketTimeoutException:
+                message = None
+            except websocket.WebSocketConnectionClosedException:
+                logger.warning("Trade stream closed by the server")
+                break
+
+            if message:
+                data = json.loads(message)
+                if data.get("type") == "trade":
+                    for trade in data.get("data", []):
+                        if monitor.on_trade(trade["s"], trade["p"]) and trade["s"] not in monitor.targets:
+                            ws.send(json.dumps({"type": "unsubscribe", "symbol": trade["s"]}))
 
-    if top_n is None:
-        return losers  # return full list
-    else:
-        return losers[:top_n]
+            if monitor.should_flush():
+                monitor.flush()
+    finally:
+        monitor.flush()
+        ws.close()
 
+    elapsed = time.monotonic() - started
+    stats = monitor.get_stats()
+    stats["elapsed_seconds"] = round(elapsed, 3)
+    stats["ticks_per_second"] = round(stats["ticks"] / elapsed, 1) if elapsed else None
+    logger.info(f"✅ Trade stream finished: {stats}")
+    return stats
@@ -0,0 +1,242 @@
+import json
+import time
+import base64
+import random
+import struct
+import hashlib
+import argparse
+import threading
+import socketserver
+import logging
+
+logger = logging.getLogger(__name__)
+
+# RFC 6455 handshake constant
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+OP_TEXT = 0x1
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+
+def random_walk_prices(start=100.0, volatility=0.001, seed=None):
+    """Price function for the stub: an independent random walk per symbol starting at start."""
+    rng = random.Random(seed)
+    prices = {}
+    lock = threading.Lock()
+
+    def price(symbol, n):
+        with lock:
+            current = prices.get(symbol, start) * (1 + rng.gauss(0, volatility))
+            prices[symbol] = current
+            return round(current, 4)
+
+    return price
+
+
+def encode_frame(opcode, payload=b""):
+    """Server frame (never masked): FIN bit, opcode and 7/16/64-bit payload length."""
+    header = bytes([0x80 | opcode])
+    length = len(payload)
+    if length < 126:
+        header += bytes([length])
+    elif length < 1 << 16:
+        header += bytes([126]) + struct.pack("!H", length)
+    else:
+        header += bytes([127]) + struct.pack("!Q", length)
+    return header + payload
+
+
+def read_frame(rfile):
+    """Read one client frame (masked, per RFC 6455). Returns (opcode, payload) or (None, b"") on EOF."""
+    head = rfile.read(2)
+    if len(head) < 2:
+        return None, b""
+    opcode = head[0] & 0x0F
+    masked = head[1] & 0x80
+    length = head[1] & 0x7F
+    if length == 126:
+        length = struct.unpack("!H", rfile.read(2))[0]
+    elif length == 127:
+        length = struct.unpack("!Q", rfile.read(8))[0]
+    mask = rfile.read(4) if masked else b"\x00\x00\x00\x00"
+    data = rfile.read(length)
+    payload = bytes(byte ^ mask[i % 4] for i, byte in enumerate(data))
+    return opcode, payload
+
+
+class StubQuoteStreamHandler(socketserver.StreamRequestHandler):
+    """One WebSocket connection: handles subscribe/unsubscribe messages and pushes trade messages."""
+
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        if not self._handshake():
+            return
+        self.symbols = []
+        self.symbols_lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.closed = threading.Event()
+        self.server.count("connections")
+
+        threading.Thread(target=self._read_loop, daemon=True).start()
+        try:
+            self._send_loop()
+        except (BrokenPipeError, ConnectionResetError, OSError):
+            pass
+        self.closed.set()
+
+    def _handshake(self):
+        headers = {}
+        request_line = self.rfile.readline()
+        while True:
+            line = self.rfile.readline().decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        key = headers.get("sec-websocket-key")
+        if not request_line.startswith(b"GET") or not key:
+            self.wfile.write(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n")
+            return False
+
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode("ascii")).digest()).decode("ascii")
+        self.wfile.write(
+            "HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept}\r\n\r\n".encode("ascii")
+        )
+        return True
+
+    def _send(self, opcode, payload=b""):
+        with self.write_lock:
+            self.wfile.write(encode_frame(opcode, payload))
+
+    def _read_loop(self):
+        try:
+            while not self.closed.is_set():
+                opcode, payload = read_frame(self.rfile)
+                if opcode is None or opcode == OP_CLOSE:
+                    break
+                if opcode == OP_PING:
+                    self._send(OP_PONG, payload)
+                elif opcode == OP_TEXT:
+                    self._on_message(json.loads(payload.decode("utf-8")))
+        except (OSError, ValueError):
+            pass
+        self.closed.set()
+
+    def _on_message(self, message):
+        symbol = message.get("symbol")
+        with self.symbols_lock:
+            if message.get("type") == "subscribe" and symbol not in self.symbols:
+                self.symbols.append(symbol)
+                self.server.count("subscriptions")
+            elif message.get("type") == "unsubscribe" and symbol in self.symbols:
+                self.symbols.remove(symbol)
+                self.server.count("unsubscriptions")
+
+    def _send_loop(self):
+        server = self.server
+        sent = 0
+        n = 0
+        while not self.closed.is_set() and not server.stopping.is_set():
+            if server.max_messages is not None and sent >= server.max_messages:
+                # Done: close the stream like a server-side disconnect
+                self._send(OP_CLOSE, struct.pack("!H", 1000))
+                break
+
+            with self.symbols_lock:
+                symbols = list(self.symbols)
+            if not symbols:
+                time.sleep(0.001)
+                continue
+
+            now_ms = int(time.time() * 1000)
+            trades = []
+            for _ in range(server.trades_per_message):
+                symbol = symbols[n % len(symbols)]
+                trades.append({"s": symbol, "p": server.price_fn(symbol, n), "t": now_ms, "v": 1})
+                n += 1
+            self._send(OP_TEXT, json.dumps({"type": "trade", "data": trades}).encode("utf-8"))
+            sent += 1
+            server.count("messages", 1)
+            server.count("trades", len(trades))
+
+            if server.interval:
+                time.sleep(server.interval)
+
+
+class StubQuoteStreamServer(socketserver.ThreadingTCPServer):
+    """Minimal Finnhub-compatible trade stream (WebSocket over a raw socket, text frames only)."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, price_fn=None, interval=0.0, trades_per_message=1, max_messages=None, seed=None):
+        super().__init__(address, StubQuoteStreamHandler)
+        self.price_fn = price_fn or random_walk_prices(seed=seed)
+        self.interval = interval
+        self.trades_per_message = trades_per_message
+        self.max_messages = max_messages
+        self.stats = {"connections": 0, "subscriptions": 0, "unsubscriptions": 0, "messages": 0, "trades": 0}
+        self.stats_lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.url = f"ws://{address[0]}:{self.server_address[1]}"
+
+    def count(self, stat, amount=1):
+        with self.stats_lock:
+            self.stats[stat] += amount
+
+
+def start_stub_stream_server(host="127.0.0.1", port=0, price_fn=None, interval=0.0, trades_per_message=1,
+                             max_messages=None, seed=None):
+    """
+    Start a local Finnhub-like trade stream in a daemon thread.
+
+    Parameters:
+        host (str): Interface to bind (localhost only by default)
+        port (int): Port to bind, 0 picks a free one
+        price_fn (callable): Function (symbol, tick number) returning the trade price, random walk by default
+        interval (float): Seconds between trade messages, 0 sends as fast as possible
+        trades_per_message (int): Trades per message (Finnhub groups trades in the "data" list)
+        max_messages (int): Messages per connection before the server closes it, None for no limit
+        seed (int): Seed of the default random walk
+
+    Returns:
+        The running server. Use server.url to connect and stop_stub_stream_server() to stop it.
+    """
+    server = StubQuoteStreamServer((host, port), price_fn=price_fn, interval=interval,
+                                   trades_per_message=trades_per_message, max_messages=max_messages, seed=seed)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    logger.info(f"Stub quote stream listening on {server.url}")
+    return server
+
+
+def stop_stub_stream_server(server):
+    server.stopping.set()
+    server.shutdown()
+    server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="local Finnhub-like trade stream")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--interval", type=float, default=0.1)
+    parser.add_argument("--trades-per-message", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    stub = start_stub_stream_server(port=args.port, interval=args.interval,
+                                    trades_per_message=args.trades_per_message, seed=args.seed)
+    print(f"FINNHUB_WS_URL={stub.url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stop_stub_stream_server(stub)
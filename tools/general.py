@@ -4,42 +4,57 @@ import re
 import logging
 from datetime import datetime
 import pytz
-import os
-import csv
-import json
-from pathlib import Path
+from tools import symbol_registry
 
 logger = logging.getLogger(__name__)
 
-def get_mapping_string(symbol, csv_file_path='resources/investing_symbol_mapping.csv'):
-    # Check if the CSV file exists
-    if not os.path.exists(csv_file_path):
-        print(f"Error: The file {csv_file_path} was not found.")
-        return None
-
-    try:
-        # Open the CSV file for reading
-        with open(csv_file_path, mode='r', newline='', encoding='utf-8') as file:
-            reader = csv.DictReader(file)  # Use DictReader to work with headers
-
-            # Iterate through the rows of the CSV file
-            for row in reader:
-                # Compare the symbol and return the mapping_string if there is a match
-                if row['symbol'] == symbol:
-                    return row['mapping_string']
-
-        # If no match is found, return None
+def get_mapping_string(symbol, csv_file_path=None):
+    # Mapping strings are loaded once by the symbol registry (reloaded if the CSV changes)
+    mapping_string = symbol_registry.get_registry(mapping_path=csv_file_path).mapping_string(symbol)
+    if mapping_string is None:
         print(f"The symbol {symbol} was not found in the CSV file.")
-        return None
-
-    except Exception as e:
-        # Handle any exceptions that occur while reading the CSV file
-        print(f"Error reading the CSV file: {e}")
-        return None
+    return mapping_string
 
 def add_opinion(symbol,df,new_column_name,opinion):
     df.loc[df['symbol'] == symbol, new_column_name] = opinion
 
+def add_opinions(df, opinions, symbol_col="symbol"):
+    """
+    Bulk version of add_opinion: set the opinions of many symbols, for one or more columns, with one
+    indexed lookup per column instead of a full-column scan per symbol. Updates df in place.
+
+    Parameters:
+        df (pd.DataFrame): DataFrame with a symbol column
+        opinions (dict or pd.DataFrame): {column: {symbol: opinion}}, or a frame indexed by symbol
+            (or with a symbol column) holding one column per opinion
+        symbol_col (str): Column of df holding the symbols
+
+    Returns:
+        pd.DataFrame: df, where rows of the given symbols have the new opinions and the other rows keep
+        their values (NaN in new columns)
+    """
+    if isinstance(opinions, pd.DataFrame):
+        frame = opinions.set_index(symbol_col) if symbol_col in opinions.columns else opinions
+        opinions = {column: frame[column] for column in frame.columns}
+
+    for column, values in opinions.items():
+        values = values if isinstance(values, pd.Series) else pd.Series(values, dtype=object)
+        if values.empty:
+            # Nothing to set (e.g. a run without candidates, whose frame may have no columns at all)
+            continue
+        symbols = df[symbol_col]
+        # Last opinion of a symbol wins, as with repeated add_opinion calls
+        values = values[~values.index.duplicated(keep="last")].astype(object)
+        current = df[column] if column in df.columns else pd.Series(np.nan, index=df.index, dtype=object)
+        positions = values.index.get_indexer(symbols)
+        has_opinion = positions >= 0
+        column_values = current.to_numpy(dtype=object, copy=True)
+        column_values[has_opinion] = values.to_numpy(dtype=object)[positions[has_opinion]]
+        column_values = pd.Series(column_values, index=df.index)
+        # Same dtype as add_opinion would leave (e.g. str for text opinions, object if all missing)
+        df[column] = column_values.infer_objects() if column_values.notna().any() else column_values
+    return df
+
 def parse_transactions_df(df):
     parsed_df = df.copy()
 
@@ -67,11 +82,18 @@ def extract_trading_view_decision(opinion):
     matches = [(op.upper(), int(score)) for op, score in matches]
     return max(matches, key=lambda x: x[1])[0]  # Returns 'SELL', 'BUY', etc.
 
+# Characters around the decision word of an LLM answer: whitespace and markdown emphasis ('**BUY** - ...')
+DECISION_STRIP_CHARS = " \t\r\n*"
+
+def normalize_decision(text):
+    """Decision word as stored and compared: 'BUY', 'SELL', etc. (shared by validation, streaming and extraction)."""
+    return text.strip(DECISION_STRIP_CHARS).upper()
+
 # Function to extract the decision from llm_op
 def extract_llm_decision(opinion):
     if not isinstance(opinion, str):
         return None
-    return opinion.split('-')[0].strip().upper()  # Returns 'SELL', 'BUY', etc.
+    return normalize_decision(opinion.split('-')[0])  # Returns 'SELL', 'BUY', etc.
 
 def extract_custom_decision(opinion):
     if not isinstance(opinion, str):
@@ -82,6 +104,10 @@ def extract_custom_decision(opinion):
 def decide_final_action(llm_decision,llm_2_decision):
     error_values = [None, 'error']
 
+    # Missing opinions may arrive as NaN from string columns
+    llm_decision = llm_decision if isinstance(llm_decision, str) else None
+    llm_2_decision = llm_2_decision if isinstance(llm_2_decision, str) else None
+
     # If both decisions are the same and valid, return it
     if llm_2_decision == llm_decision and (llm_2_decision not in error_values) and (llm_decision not in error_values):
         return llm_2_decision
@@ -97,47 +123,138 @@ def decide_final_action(llm_decision,llm_2_decision):
 
     
 
-def generate_action_column(df: pd.DataFrame, opinion_type: str) -> pd.DataFrame:
+# Opinion columns combined by the default (consensus) decision logic, and how each one is read
+DEFAULT_OPINION_SOURCES = ("llm_opinion", "llm_2_opinion")
+CONSENSUS_POLICIES = ("unanimous", "majority", "weighted")
+EMPTY_DECISION = "EMPTY_DECISION"
+
+
+def _text_values(series):
+    # Opinion columns hold strings or missing values; an all-missing column may come back as float
+    if series.dtype == object or pd.api.types.is_string_dtype(series):
+        return series
+    return pd.Series(None, index=series.index, dtype=object)
+
+
+def _as_decisions(values):
+    # Missing decisions as None (like the per-value extractors)
+    values = values.astype(object)
+    return values.where(values.notna(), None)
+
+
+def extract_llm_decisions(series):
+    """Vectorized extract_llm_decision over a column of LLM opinions."""
+    # Text before the first '-' (the opinion may span several lines)
+    text = _text_values(series).str.replace(r"-.*", "", regex=True, flags=re.DOTALL)
+    return _as_decisions(text.str.strip(DECISION_STRIP_CHARS).str.upper())
+
+
+def extract_custom_decisions(series):
+    """Vectorized extract_custom_decision over a column like '✋ HOLD' (None when there is no second word)."""
+    return _as_decisions(_text_values(series).str.split(" ").str[1].str.strip().str.upper())
+
+
+OPINION_EXTRACTORS = {"manual_financial_analysis": extract_custom_decisions}
+
+
+def resolve_consensus(decisions, policy="unanimous", weights=None):
+    """
+    Final action of each row from the decisions of several sources.
+
+    Missing decisions (None/NaN) and 'error' don't vote. Policies:
+        unanimous: every source that voted agrees (with two sources this is decide_final_action)
+        majority: the decision with the most votes
+        weighted: the decision with the highest total weight (weights per source, 1 by default)
+    Rows without votes, and ties, get EMPTY_DECISION.
+
+    Parameters:
+        decisions (pd.DataFrame): One column of normalized decisions per source
+        policy (str): 'unanimous', 'majority' or 'weighted'
+        weights (dict): Source column -> weight (weighted policy)
+
+    Returns:
+        np.ndarray of actions (object)
+    """
+    policy = (policy or "unanimous").strip().lower()
+    if policy not in CONSENSUS_POLICIES:
+        raise ValueError(f"Unknown consensus policy '{policy}', expected one of {', '.join(CONSENSUS_POLICIES)}")
+
+    rows = len(decisions)
+    values = decisions.to_numpy(dtype=object).reshape(rows, len(decisions.columns))
+    voted = ~pd.isna(values) & (values != "error")
+    codes, uniques = pd.factorize(values[voted])
+    if len(uniques) == 0:
+        return np.full(rows, EMPTY_DECISION, dtype=object)
+
+    # scores[row, decision] = votes (or weights) for that decision
+    source_codes = np.full(values.shape, -1)
+    source_codes[voted] = codes
+    source_weights = np.ones(values.shape[1])
+    if policy == "weighted" and weights:
+        source_weights = np.array([float(weights.get(column, 1)) for column in decisions.columns])
+    scores = np.zeros((rows, len(uniques)))
+    row_index = np.arange(rows)
+    for source in range(values.shape[1]):
+        has_vote = source_codes[:, source] >= 0
+        scores[row_index[has_vote], source_codes[has_vote, source]] += source_weights[source]
+
+    best = scores.argmax(axis=1)
+    if policy == "unanimous":
+        resolved = (scores > 0).sum(axis=1) == 1
+    else:
+        ranked = np.sort(scores, axis=1)
+        runner_up = ranked[:, -2] if len(uniques) > 1 else np.zeros(rows)
+        resolved = (ranked[:, -1] > 0) & (ranked[:, -1] > runner_up)
+    return np.where(resolved, np.asarray(uniques, dtype=object)[best], EMPTY_DECISION)
+
+
+def generate_action_column(df: pd.DataFrame, opinion_type: str, sources=None, policy="unanimous",
+                           weights=None) -> pd.DataFrame:
     """
     Adds a 'action' column to the DataFrame based on matching logic
-    between 'llm_opinion' and 'llm_2_opinion'.
+    between the opinion columns ('llm_opinion' and 'llm_2_opinion' by default).
 
     Parameters:
-        df (pd.DataFrame): DataFrame containing 'llm_opinion' and 'llm_2_opinion' columns.
+        df (pd.DataFrame): DataFrame containing the opinion columns.
         force_opinion (str): Optionally force decision source: "LLM", "LLM2", or "CUSTOM".
+        sources (list): Opinion columns combined by the default logic (missing columns don't vote).
+        policy (str): Consensus policy of the default logic: "unanimous", "majority" or "weighted".
+        weights (dict): Column -> weight, for the weighted policy.
 
     Returns:
         pd.DataFrame: Original DataFrame with 'action' column added.
     """
     # Clean force_opinion input
-    opinion_type = opinion_type.strip().upper()
+    opinion_type = (opinion_type or "").strip().upper()
     logger.debug(f"Opinion type: {opinion_type}")
 
     if opinion_type == "LLM1":
         logger.debug("set decision logic as LLM-1")
 
-        df['action'] = df['llm_opinion'].apply(extract_llm_decision)
+        df['action'] = extract_llm_decisions(df['llm_opinion'])
 
     elif opinion_type == "LLM2":
         logger.debug("set decision logic as LLM-2")
 
-        df['action'] = df['llm_2_opinion'].apply(extract_llm_decision)
+        df['action'] = extract_llm_decisions(df['llm_2_opinion'])
 
     elif opinion_type == "CUSTOM":
         logger.debug("set decision logic as CUSTOM")
 
-        df['action'] = df['manual_financial_analysis'].apply(extract_custom_decision)
+        df['action'] = extract_custom_decisions(df['manual_financial_analysis'])
+
+    else:  # Default logic: combine the sources with the consensus policy
+        logger.debug(f"set decision logic as DEFAULT ({policy})")
 
-    else:  # Default logic: compare both and apply decision logic
-        logger.debug("set decision logic as DEFAULT")
+        sources = list(sources or DEFAULT_OPINION_SOURCES)
+        decisions = pd.DataFrame({
+            column: OPINION_EXTRACTORS.get(column, extract_llm_decisions)(df[column]) if column in df.columns
+            else pd.Series(None, index=df.index, dtype=object)
+            for column in sources
+        }, index=df.index)
+        df['action'] = resolve_consensus(decisions, policy, weights)
 
-        df['llm_opinion'] = df['llm_opinion'].apply(extract_llm_decision)
-        df['llm_2_opinion'] = df['llm_2_opinion'].apply(extract_llm_decision)
-        df['action'] = df.apply(
-            lambda row: decide_final_action(row['llm_opinion'], row['llm_2_opinion']), axis=1
-        )
-        
-        df = df.drop(columns=['llm_opinion', 'llm_2_opinion'])
+        df = df.drop(columns=[column for column in sources if column in df.columns])
 
     return df
 
@@ -151,35 +268,16 @@ def normalize_for_tradingview(symbol, info):
     Otherwise, use the original symbol.
     Remove any suffix like '.DE' when building the URL.
     """
-    tv_symbol = info.get("symbol", symbol)
-    return tv_symbol.split(".")[0]
+    return symbol_registry.base_symbol(info.get("symbol", symbol))
 
 def add_urls_column(buy_df, symbol_col="symbol"):
     """
     Adds a 'tradingview_url' column to the DataFrame.
-    The URL is built based on the market and symbol info loaded from JSON.
+    The URL is built from the market and symbol info of the symbol registry (resources/symbols_markets.json).
     If symbol is not found, the value is 'NOT FOUND'.
     """
-
-    # Load SYMBOLS_MARKETS from JSON
-    project_root = Path(__file__).resolve().parent.parent
-    json_path = project_root / "resources" / "symbols_markets.json"
-    with open(json_path, "r", encoding="utf-8") as f:
-        SYMBOLS_MARKETS = json.load(f)
-
-    def build_url(symbol):
-        if not isinstance(symbol, str):
-            return "NOT FOUND"
-
-        info = SYMBOLS_MARKETS.get(symbol)
-        if not info or "market" not in info:
-            return "NOT FOUND"
-
-        tv_symbol = normalize_for_tradingview(symbol, info)
-        market = info["market"]
-
-        return f"https://en.tradingview.com/symbols/{market}-{tv_symbol}/technicals/"
+    registry = symbol_registry.get_registry()
 
     # Add the new column at the end
-    buy_df["tradingview_url"] = buy_df[symbol_col].apply(build_url)
+    buy_df["tradingview_url"] = [registry.tradingview_url(symbol) or "NOT FOUND" for symbol in buy_df[symbol_col]]
     return buy_df
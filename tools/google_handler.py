@@ -2,13 +2,23 @@ import pandas as pd
 import os
 import io
 import json
+import time
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta
+import httplib2
+import google_auth_httplib2
+from google.auth.transport.requests import Request
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseDownload, MediaIoBaseUpload
 from datetime import datetime
 import logging
 from dotenv import load_dotenv
+from tools import run_metrics
 
 logger = logging.getLogger(__name__)
 
@@ -16,37 +26,218 @@ logger = logging.getLogger(__name__)
 if not os.getenv("GITHUB_ACTIONS"):  # This var is auto-set in GitHub Actions
     load_dotenv()
 
+DRIVE_SCOPES = ["https://www.googleapis.com/auth/drive"]
+HTTP_TIMEOUT_SECONDS = float(os.environ.get("GDRIVE_TIMEOUT_SECONDS") or 120)
+
+# One Drive service per process, built on first use (rebuilt if GDRIVE_CREDENTIALS_JSON changes).
+# httplib2 connections are not thread-safe, so requests are executed with a per-thread AuthorizedHttp.
+_service_lock = threading.Lock()
+_service_state = {"creds_json": None, "credentials": None, "service": None}
+_thread_local = threading.local()
+
+# Local copies of downloaded/uploaded files, reused while the Drive file version is unchanged (empty disables)
+CACHE_DIR = os.environ.get("GDRIVE_CACHE_DIR", ".gdrive_cache")
+
+# Transfers are streamed in chunks of this size (resumable uploads need multiples of 256 KiB),
+# so memory use is bounded by the chunk size rather than by the file size (except for Google Sheets
+# exports, which Drive only serves whole)
+_CHUNK_UNIT = 256 * 1024
+CHUNK_SIZE_BYTES = max(1, round(float(os.environ.get("GDRIVE_CHUNK_SIZE_MB") or 8) * 1024 * 1024 / _CHUNK_UNIT)) * _CHUNK_UNIT
+TRANSFER_RETRIES = 3
+GOOGLE_APPS_MIME_PREFIX = "application/vnd.google-apps."
+
 def get_drive_service():
-    # Retrieve Google Drive service client using credentials from environment variable
+    # Retrieve the cached Google Drive service client (credentials from environment variable)
     creds_json = os.environ.get("GDRIVE_CREDENTIALS_JSON")
     if not creds_json:
         raise Exception("Environment variable GDRIVE_CREDENTIALS_JSON not found")
-    creds_dict = json.loads(creds_json)
-    credentials = service_account.Credentials.from_service_account_info(
-        creds_dict, scopes=["https://www.googleapis.com/auth/drive"]
-    )
-    service = build("drive", "v3", credentials=credentials)
-    return service
+
+    with _service_lock:
+        if _service_state["service"] is None or _service_state["creds_json"] != creds_json:
+            creds_dict = json.loads(creds_json)
+            credentials = service_account.Credentials.from_service_account_info(creds_dict, scopes=DRIVE_SCOPES)
+            # Bundled discovery document: no discovery request at startup
+            service = build("drive", "v3", credentials=credentials, static_discovery=True, cache_discovery=False)
+            _service_state.update(creds_json=creds_json, credentials=credentials, service=service)
+        return _service_state["service"]
+
+def get_authorized_http():
+    """
+    Authorized HTTP client of the current thread (keeps its connection alive between requests).
+    Pass it to request.execute(http=...) so the shared service can be used from several threads.
+    """
+    get_drive_service()
+    with _service_lock:
+        credentials = _service_state["credentials"]
+        # Refresh expired tokens once for all threads instead of on every thread's first 401
+        if not credentials.valid:
+            credentials.refresh(Request())
+
+    cached = getattr(_thread_local, "http", None)
+    if cached is None or cached.credentials is not credentials:
+        _thread_local.http = google_auth_httplib2.AuthorizedHttp(credentials, http=httplib2.Http(timeout=HTTP_TIMEOUT_SECONDS))
+    return _thread_local.http
+
+def reset_drive_service():
+    # Drop the cached service (e.g. after rotating credentials)
+    with _service_lock:
+        _service_state.update(creds_json=None, credentials=None, service=None)
+
+def _cache_paths(file_id):
+    return os.path.join(CACHE_DIR, f"{file_id}.csv"), os.path.join(CACHE_DIR, f"{file_id}.json")
+
+def get_file_metadata(file_id):
+    # Version, modification time and type of a Drive file (small request), None if unavailable
+    try:
+        return get_drive_service().files().get(
+            fileId=file_id, fields="version,modifiedTime,mimeType"
+        ).execute(http=get_authorized_http())
+    except Exception as e:
+        logger.warning(f"Could not get metadata of {file_id}: {e}")
+        return None
+
+def cached_file_path(file_id, metadata):
+    """Return the path of the cached copy of file_id if it belongs to the given Drive version, else None."""
+    if not CACHE_DIR or not metadata:
+        return None
+    csv_path, meta_path = _cache_paths(file_id)
+    try:
+        with open(meta_path, encoding="utf-8") as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if (cached.get("version"), cached.get("modifiedTime")) != (metadata.get("version"), metadata.get("modifiedTime")):
+        return None
+    return csv_path if os.path.exists(csv_path) else None
+
+@contextmanager
+def cache_writer(file_id, metadata):
+    """
+    Yield a binary file to write the cached copy of file_id into (None when caching is off).
+    The copy is only kept, with its Drive version, if the block completes; the metadata file is written last.
+    """
+    if not CACHE_DIR or not metadata or not metadata.get("version"):
+        yield None
+        return
+    csv_path, meta_path = _cache_paths(file_id)
+    tmp_path = f"{csv_path}.tmp"
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        f = open(tmp_path, "wb")
+    except OSError as e:
+        logger.warning(f"Could not cache {file_id}: {e}")
+        yield None
+        return
+
+    try:
+        yield f
+    except BaseException:
+        f.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    f.close()
+
+    try:
+        os.replace(tmp_path, csv_path)
+        with open(f"{meta_path}.tmp", "w", encoding="utf-8") as meta:
+            json.dump({"version": metadata.get("version"), "modifiedTime": metadata.get("modifiedTime")}, meta)
+        os.replace(f"{meta_path}.tmp", meta_path)
+    except OSError as e:
+        logger.warning(f"Could not cache {file_id}: {e}")
+
+def write_cached_file(file_id, data, metadata):
+    """Store the content of file_id (bytes or a binary file object) with the Drive version it corresponds to."""
+    with cache_writer(file_id, metadata) as f:
+        if f is None:
+            return
+        if isinstance(data, (bytes, bytearray)):
+            f.write(data)
+        else:
+            data.seek(0)
+            shutil.copyfileobj(data, f, CHUNK_SIZE_BYTES)
+
+
+class DriveDownloadStream(io.RawIOBase):
+    """
+    Read-only file object over a chunked Drive download (get_media: the server answers Range requests):
+    the next chunk is only requested once the previous one has been read, so at most one chunk is held
+    in memory. Downloaded bytes are also written to tee (e.g. the local cache file) when given.
+    """
+
+    def __init__(self, request, chunk_size=None, tee=None):
+        self._chunk = io.BytesIO()
+        self._downloader = MediaIoBaseDownload(self._chunk, request, chunksize=chunk_size or CHUNK_SIZE_BYTES)
+        self._pending = memoryview(b"")
+        self._done = False
+        self._tee = tee
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._pending and not self._done:
+            _, self._done = self._downloader.next_chunk(num_retries=TRANSFER_RETRIES)
+            data = self._chunk.getvalue()
+            self._chunk.seek(0)
+            self._chunk.truncate()
+            run_metrics.increment("gdrive.download.chunks")
+            if self._tee is not None:
+                self._tee.write(data)
+            self._pending = memoryview(data)
+
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+def open_download_stream(service, file_id, tee=None, chunk_size=None, mime_type=None):
+    """
+    Binary file object with the CSV content of a Drive file (also written to tee when given).
+
+    Binary files (e.g. an uploaded .csv) are downloaded with get_media in Range requests of chunk_size
+    and read while they arrive. Google Sheets, and files of unknown type, are exported as CSV with
+    export_media: the export endpoint doesn't serve byte ranges, so the whole export (at most 10 MB,
+    Drive's export limit) arrives in a single response and is held in memory.
+    """
+    if mime_type and not mime_type.startswith(GOOGLE_APPS_MIME_PREFIX):
+        request = service.files().get_media(fileId=file_id)
+        request.http = get_authorized_http()
+        return io.BufferedReader(DriveDownloadStream(request, chunk_size, tee), buffer_size=_CHUNK_UNIT)
+
+    data = service.files().export_media(fileId=file_id, mimeType='text/csv').execute(
+        http=get_authorized_http(), num_retries=TRANSFER_RETRIES)
+    run_metrics.increment("gdrive.download.exports")
+    if tee is not None:
+        tee.write(data)
+    return io.BytesIO(data)
 
 def load_data(file_id):
-    # Load CSV data exported from Google Sheets on Google Drive
+    # Load CSV data exported from Google Sheets on Google Drive (local copy reused while the file is unchanged)
     service = get_drive_service()
     
     if not file_id:
         raise Exception("Environment variable GDRIVE_FILE_ID not found")
     try:
-        # Use export_media to export Google Sheets as CSV
-        request = service.files().export_media(fileId=file_id, mimeType='text/csv')
-        fh = io.BytesIO()
-        downloader = MediaIoBaseDownload(fh, request)
-        done = False
-        while not done:
-            status, done = downloader.next_chunk()
+        # Also tells Sheets (exported) from binary files (downloaded in chunks)
+        metadata = get_file_metadata(file_id)
+        cached_path = cached_file_path(file_id, metadata)
 
-        file_bytes = fh.getvalue()
+        if cached_path is not None:
+            run_metrics.increment("gdrive.cache.hits")
+            df = pd.read_csv(cached_path)
+            source = "local cache, unchanged on Drive"
+        else:
+            run_metrics.increment("gdrive.cache.misses")
+            # The CSV is parsed while it downloads (and copied to the cache)
+            mime_type = (metadata or {}).get("mimeType")
+            with cache_writer(file_id, metadata) as cache_file:
+                df = pd.read_csv(open_download_stream(service, file_id, tee=cache_file, mime_type=mime_type))
+            source = "Google Sheets export" if not mime_type or mime_type.startswith(GOOGLE_APPS_MIME_PREFIX) else "download"
 
-        df = pd.read_csv(io.BytesIO(file_bytes))
-        logger.info(f"✅ CSV loaded from Google Drive (Google Sheets export) with {len(df)} rows.")
+        logger.info(f"✅ CSV loaded from Google Drive ({source}) with {len(df)} rows.")
 
     except Exception as e:
 
@@ -54,6 +245,39 @@ def load_data(file_id):
         return None
     return df
 
+def get_target_price(buy_value, revenue_percentage):
+    # Price at which an open position reaches the REVENUE_PERCENTAGE target
+    return buy_value * (1 + float(revenue_percentage) / 100)
+
+def register_sale(df_transactions, idx, current_price):
+    """
+    Close the open transaction at idx at current_price (updates df_transactions in place).
+
+    Parameters:
+        df_transactions (pd.DataFrame): Transactions ledger
+        idx: Index label of the transaction to close
+        current_price (float): Sell price
+    """
+    buy_value = df_transactions.at[idx, 'buy_value']
+    sell_date = datetime.today().date()
+    buy_date = pd.to_datetime(df_transactions.at[idx, 'buy_date']).date()
+    days_diff = (sell_date - buy_date).days
+    percentage_benefit = ((current_price - buy_value) / buy_value) * 100
+
+    # Update the transaction record
+    _set_cell(df_transactions, idx, 'sell_value', round(current_price, 2))
+    _set_cell(df_transactions, idx, 'sell_date', sell_date)
+    _set_cell(df_transactions, idx, 'buy_sell_days_diff', days_diff)
+    _set_cell(df_transactions, idx, 'percentage_benefit', round(percentage_benefit, 2))
+
+def _set_cell(df, idx, column, value):
+    # Columns read from CSV are float (all empty) or str; widen them to object when the value doesn't fit
+    try:
+        df.at[idx, column] = value
+    except (TypeError, ValueError):
+        df[column] = df[column].astype(object)
+        df.at[idx, column] = value
+
 def update_transactions(df_analysis, df_transactions, revenue_percentage):
     # Make a copy to avoid changing the original dataframe
     df_transactions = df_transactions.copy()
@@ -72,43 +296,113 @@ def update_transactions(df_analysis, df_transactions, revenue_percentage):
         
         if not analysis_row.empty:
             current_price = analysis_row.iloc[0]['current_price']
-            target_price = buy_value * (1 + float(revenue_percentage) / 100)
-            
-            if current_price >= target_price:
-                sell_date = datetime.today().date()
-                buy_date = pd.to_datetime(row['buy_date']).date()
-                days_diff = (sell_date - buy_date).days
-                percentage_benefit = ((current_price - buy_value) / buy_value) * 100
-
-                # Update the transaction record
-                df_transactions.at[idx, 'sell_value'] = round(current_price, 2)
-                df_transactions.at[idx, 'sell_date'] = sell_date
-                df_transactions.at[idx, 'buy_sell_days_diff'] = days_diff
-                df_transactions.at[idx, 'percentage_benefit'] = round(percentage_benefit, 2)
+
+            if current_price >= get_target_price(buy_value, revenue_percentage):
+                register_sale(df_transactions, idx, current_price)
 
     return df_transactions
 
 
-def save_dataframe_file_id(df, file_id):
+def dataframe_to_csv_file(df, chunk_size=None):
+    """
+    Serialize a DataFrame as CSV into a temporary file (upload payload): kept in memory up to
+    chunk_size bytes, spilled to disk beyond. The file is returned rewound; close it when done.
     """
-    Updates an existing CSV file on Google Drive using in-memory upload (no temp file).
-    Fully Windows-compatible.
+    fh = tempfile.SpooledTemporaryFile(max_size=chunk_size or CHUNK_SIZE_BYTES)
+    df.to_csv(fh, index=False)
+    fh.seek(0)
+    return fh
+
+def upload_csv_file(fh, file_id, chunk_size=None):
+    """
+    Replace the content of an existing Drive file with the CSV in the binary file object fh.
+
+    Files larger than one chunk are sent as a resumable upload, chunk by chunk (an interrupted chunk
+    is retried from where Drive says the upload stopped); smaller ones in a single request.
     """
+    chunk_size = chunk_size or CHUNK_SIZE_BYTES
     service = get_drive_service()
+    size = fh.seek(0, os.SEEK_END)
+    fh.seek(0)
+    resumable = size > chunk_size
+    media = MediaIoBaseUpload(fh, mimetype='text/csv', chunksize=chunk_size, resumable=resumable)
+    request = service.files().update(
+        fileId=file_id,
+        media_body=media,
+        fields="id,version,modifiedTime"
+    )
+    http = get_authorized_http()
+    if resumable:
+        updated_file = None
+        while updated_file is None:
+            _, updated_file = request.next_chunk(http=http, num_retries=TRANSFER_RETRIES)
+            run_metrics.increment("gdrive.upload.chunks")
+    else:
+        updated_file = request.execute(http=http, num_retries=TRANSFER_RETRIES)
+        run_metrics.increment("gdrive.upload.chunks")
+
+    # The next load_data of this version reuses the uploaded file instead of exporting it again
+    write_cached_file(file_id, fh, updated_file)
+    return updated_file
+
+def save_dataframe_file_id(df, file_id):
+    """
+    Updates an existing CSV file on Google Drive, streaming the CSV through a spooled temporary file
+    into a chunked upload. Fully Windows-compatible.
+    """
     logger.info("saving data into google drive...")
 
     if not file_id:
         raise Exception("❌ file_id not provided or environment variable GDRIVE_FILE_ID is missing.")
 
-    # Write CSV to an in-memory bytes buffer
-    csv_buffer = io.BytesIO()
-    df.to_csv(csv_buffer, index=False)
-    csv_buffer.seek(0)  # Rewind to start
+    with dataframe_to_csv_file(df) as fh:
+        return upload_csv_file(fh, file_id)
 
-    media = MediaIoBaseUpload(csv_buffer, mimetype='text/csv')
+def save_dataframes(frames, max_workers=None):
+    """
+    Save several DataFrames to their Drive files concurrently.
 
-    updated_file = service.files().update(
-        fileId=file_id,
-        media_body=media
-    ).execute()
+    Each frame is serialized and uploaded on its own worker thread (with its own HTTP connection),
+    so the whole save takes about as long as the slowest upload. Drive batch requests cannot carry
+    media uploads, hence one request per file.
+
+    Parameters:
+        frames (dict): name -> (DataFrame, file_id)
+        max_workers (int): Worker threads, one per frame by default
+
+    Returns:
+        dict name -> {"file_id", "status" ("ok" or "error"), "error", "rows", "bytes", "serialize_ms", "upload_ms"}
+    """
+    def save(name, df, file_id):
+        result = {"file_id": file_id, "status": "ok", "error": None, "rows": len(df), "bytes": None,
+                  "serialize_ms": None, "upload_ms": None}
+        try:
+            if not file_id:
+                raise Exception(f"file_id not provided for {name}")
+            started = time.perf_counter()
+            with dataframe_to_csv_file(df) as fh:
+                result["bytes"] = fh.seek(0, os.SEEK_END)
+                fh.seek(0)
+                result["serialize_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+                started = time.perf_counter()
+                upload_csv_file(fh, file_id)
+                result["upload_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        except Exception as e:
+            result.update(status="error", error=str(e))
+            logger.error(f"❌ Error saving {name} into google drive: {e}")
+        return name, result
+
+    if not frames:
+        return {}
+
+    logger.info(f"saving {len(frames)} files into google drive...")
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers or len(frames), thread_name_prefix="gdrive") as executor:
+        futures = [executor.submit(save, name, df, file_id) for name, (df, file_id) in frames.items()]
+        results = dict(future.result() for future in futures)
 
+    saved = sum(1 for result in results.values() if result["status"] == "ok")
+    logger.info(f"✅ Saved {saved}/{len(results)} files in {(time.perf_counter() - started) * 1000:.0f} ms: "
+                + ", ".join(f"{name}={result['upload_ms']} ms" for name, result in results.items()))
+    return results
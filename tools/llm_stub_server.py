@@ -0,0 +1,274 @@
+import re
+import json
+import random
+import hashlib
+import argparse
+import threading
+import time
+import logging
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ANSWER = "HOLD - stub answer (RSI neutral, MACD flat)"
+STUB_DECISIONS = ("BUY", "HOLD", "SELL", "EMPTY_DECISION")
+
+
+def default_responder(body):
+    """Deterministic answer used when no custom responder is given."""
+    return DEFAULT_ANSWER
+
+
+def hashed_responder(body):
+    """
+    Deterministic answer that depends on the prompt: the same metrics always get the same DECISION,
+    while different symbols spread over all decisions (useful for load tests of the whole pipeline).
+    """
+    prompt = json.dumps(body.get("messages", []), sort_keys=True)
+    digest = hashlib.sha256(prompt.encode("utf-8")).digest()
+    decision = STUB_DECISIONS[digest[0] % len(STUB_DECISIONS)]
+    return f"{decision} - stub answer {digest.hex()[:8]} (RSI, MACD, SMA50 vs SMA200)"
+
+
+def latency_sampler(spec="fixed:0", seed=None):
+    """
+    Build a function returning response delays in seconds from a spec string:
+        fixed:<ms>                  constant delay
+        uniform:<min_ms>:<max_ms>   uniformly distributed
+        normal:<mean_ms>:<std_ms>   gaussian, clipped at 0
+        lognormal:<median_ms>:<sigma>  long-tailed, like real LLM latencies
+    """
+    name, *params = str(spec).split(":")
+    params = [float(param) for param in params]
+    rng = random.Random(seed)
+    lock = threading.Lock()
+
+    samplers = {
+        "fixed": lambda: params[0],
+        "uniform": lambda: rng.uniform(params[0], params[1]),
+        "normal": lambda: max(rng.gauss(params[0], params[1]), 0.0),
+        "lognormal": lambda: rng.lognormvariate(0.0, params[1]) * params[0],
+    }
+    if name not in samplers:
+        raise ValueError(f"Unknown latency distribution '{name}', expected one of {', '.join(samplers)}")
+
+    def sample():
+        with lock:
+            return samplers[name]() / 1000
+
+    return sample
+
+
+def build_completion(model, content, prompt_tokens=0, completion_tokens=0):
+    """Build an OpenAI-compatible chat completion payload."""
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop"
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+    }
+
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps connections alive so pooled clients can be measured
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; avoid Nagle stalls on reused connections
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.stats_lock:
+            self.server.stats["connections"] += 1
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length) if length else b"{}"
+
+        if not self.path.endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+            return
+
+        body = json.loads(raw or b"{}")
+        with self.server.stats_lock:
+            self.server.stats["requests"] += 1
+
+        if self.server.is_rate_limited():
+            self._count("rate_limited")
+            self._send_json(429, {"error": {"message": "stub rate limit exceeded", "type": "rate_limit_error"}},
+                            {"retry-after-ms": str(self.server.retry_after_ms)})
+            return
+
+        time.sleep(self.server.latency())
+
+        if self.server.should_fail():
+            self._count("errors")
+            self._send_json(500, {"error": {"message": "stub injected server error", "type": "server_error"}})
+            return
+
+        content = self.server.responder(body)
+        if body.get("stream"):
+            self._send_stream(body.get("model", "stub-model"), content)
+            return
+
+        prompt_text = " ".join(str(m.get("content", "")) for m in body.get("messages", []))
+        payload = build_completion(
+            body.get("model", "stub-model"),
+            content,
+            prompt_tokens=len(prompt_text) // 4,
+            completion_tokens=len(content) // 4
+        )
+        self._send_json(200, payload)
+
+    def _send_stream(self, model, content):
+        """Send the answer as server-sent events, one word per chunk (chunked transfer encoding)."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def chunk(delta, finish_reason=None):
+            return {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            }
+
+        events = [chunk({"role": "assistant", "content": piece}) for piece in re.findall(r"\S+\s*", content)]
+        events.append(chunk({}, "stop"))
+        try:
+            for event in events:
+                self._write_chunk(f"data: {json.dumps(event)}\n\n")
+                if self.server.stream_delay:
+                    time.sleep(self.server.stream_delay)
+            self._write_chunk("data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # Client stopped reading early (e.g. decision already parsed)
+            self.close_connection = True
+            with self.server.stats_lock:
+                self.server.stats["streams_aborted"] += 1
+
+    def _write_chunk(self, text):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _count(self, stat):
+        with self.server.stats_lock:
+            self.server.stats[stat] += 1
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logger.debug(f"stub llm server: {format % args}")
+
+
+class StubLLMServer(ThreadingHTTPServer):
+    """Threaded chat-completions server with injectable latency, errors and rate limits."""
+
+    daemon_threads = True
+
+    def __init__(self, address, responder=None, stream_delay=0.0, latency="fixed:0", error_rate=0.0,
+                 max_rps=None, retry_after_ms=100, seed=None):
+        super().__init__(address, StubLLMHandler)
+        self.responder = responder or default_responder
+        self.stream_delay = stream_delay
+        self.latency = latency if callable(latency) else latency_sampler(latency, seed)
+        self.error_rate = error_rate
+        self.max_rps = max_rps
+        self.retry_after_ms = retry_after_ms
+        self.stats = {"connections": 0, "requests": 0, "streams_aborted": 0, "rate_limited": 0, "errors": 0}
+        self.stats_lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self._recent = deque()
+        self.base_url = f"http://{address[0]}:{self.server_address[1]}"
+
+    def is_rate_limited(self):
+        """Sliding one-second window: more than max_rps accepted requests gets a 429."""
+        if not self.max_rps:
+            return False
+        now = time.monotonic()
+        with self.stats_lock:
+            while self._recent and now - self._recent[0] >= 1.0:
+                self._recent.popleft()
+            if len(self._recent) >= self.max_rps:
+                return True
+            self._recent.append(now)
+            return False
+
+    def should_fail(self):
+        with self.stats_lock:
+            return self._rng.random() < self.error_rate
+
+
+def start_stub_server(host="127.0.0.1", port=0, responder=None, stream_delay=0.0, latency="fixed:0",
+                      error_rate=0.0, max_rps=None, seed=None):
+    """
+    Start a local OpenAI/DeepSeek compatible chat-completions server in a daemon thread.
+
+    Parameters:
+        host (str): Interface to bind (localhost only by default)
+        port (int): Port to bind, 0 picks a free one
+        responder (callable): Function receiving the request body and returning the answer text
+        stream_delay (float): Seconds between chunks of streamed answers
+        latency (str or callable): Response delay spec for latency_sampler(), or a function returning seconds
+        error_rate (float): Fraction of requests answered with HTTP 500
+        max_rps (int): Requests per second accepted before answering HTTP 429
+        seed (int): Seed for latency and error sampling (reproducible runs)
+
+    Returns:
+        The running server. Use server.base_url for the endpoint and stop_stub_server() to stop it.
+    """
+    server = StubLLMServer((host, port), responder=responder, stream_delay=stream_delay, latency=latency,
+                           error_rate=error_rate, max_rps=max_rps, seed=seed)
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    logger.info(f"Stub LLM server listening on {server.base_url}")
+    return server
+
+
+def stop_stub_server(server):
+    server.shutdown()
+    server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="local OpenAI/DeepSeek compatible stub server")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", default="fixed:0", help="e.g. fixed:200, uniform:100:400, lognormal:800:0.5")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--max-rps", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    stub = start_stub_server(port=args.port, responder=hashed_responder, latency=args.latency,
+                             error_rate=args.error_rate, max_rps=args.max_rps, seed=args.seed)
+    print(f"OPENAI_BASE_URL={stub.base_url}/v1  DEEPSEEK_API_URL={stub.base_url}/chat/completions")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stop_stub_server(stub)
@@ -0,0 +1,257 @@
+import os
+import json
+import time
+import threading
+import logging
+from tools import run_metrics
+
+logger = logging.getLogger(__name__)
+
+# USD per 1M tokens (input, output). Override or extend with LLM_PRICES_JSON, e.g. '{"gpt-4o": [2.5, 10]}'
+DEFAULT_PRICES_PER_MILLION = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1": (2.00, 8.00),
+    "deepseek-chat": (0.27, 1.10),
+    "deepseek-reasoner": (0.55, 2.19),
+}
+
+# Batch API requests are billed at half price
+BATCH_DISCOUNT = 0.5
+
+_lock = threading.Lock()
+_records = []
+
+# Per-thread state filled by the HTTP hooks of the pooled clients and by the LLM worker pool
+_context = threading.local()
+
+
+def get_prices():
+    prices = dict(DEFAULT_PRICES_PER_MILLION)
+    overrides = os.getenv("LLM_PRICES_JSON")
+    if overrides:
+        try:
+            prices.update({model: tuple(value) for model, value in json.loads(overrides).items()})
+        except (ValueError, TypeError) as e:
+            logger.warning(f"Ignoring invalid LLM_PRICES_JSON: {e}")
+    return prices
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens, discount=1.0):
+    """Estimated USD cost of a call. Versioned model names use the longest matching price prefix."""
+    prices = get_prices()
+    matches = [name for name in prices if model and model.startswith(name)]
+    if not matches:
+        return None
+    input_price, output_price = prices[max(matches, key=len)]
+    cost = ((prompt_tokens or 0) * input_price + (completion_tokens or 0) * output_price) / 1_000_000
+    return round(cost * discount, 8)
+
+
+# ---- hooks ----
+
+def on_http_request(*args, **kwargs):
+    """httpx request hook: counts HTTP attempts of the current call (more than one means retries)."""
+    _context.http_requests = getattr(_context, "http_requests", 0) + 1
+
+
+def on_http_response(*args, **kwargs):
+    """httpx/requests response hook: headers received, i.e. time to first byte."""
+    if getattr(_context, "first_byte_at", None) is None:
+        _context.first_byte_at = time.perf_counter()
+
+
+def on_requests_response(response, *args, **kwargs):
+    """requests response hook (no request hook exists there): one response per attempt."""
+    on_http_request()
+    on_http_response()
+    return response
+
+
+def run_queued(fn, submitted_at):
+    """Run fn on a worker thread, recording how long it waited in the queue."""
+    _context.queue_wait = time.perf_counter() - submitted_at
+    try:
+        return fn()
+    finally:
+        _context.queue_wait = 0.0
+
+
+# ---- call tracking ----
+
+class LLMCall:
+    """
+    Tracks one LLM call. Use as a context manager around the request:
+
+        with LLMCall("openai", model, [symbol]) as call:
+            ...
+            call.set_usage(prompt_tokens, completion_tokens)
+    """
+
+    def __init__(self, provider, model, symbols, discount=1.0):
+        self.provider = provider
+        self.model = model
+        self.symbols = list(symbols)
+        self.discount = discount
+        self.prompt_tokens = None
+        self.completion_tokens = None
+        self.tokens_estimated = False
+        self.extra_retries = 0
+        self.status = "ok"
+        self.error = None
+
+    def __enter__(self):
+        self.queue_wait = getattr(_context, "queue_wait", 0.0)
+        _context.http_requests = 0
+        _context.first_byte_at = None
+        self.started = time.perf_counter()
+        return self
+
+    def set_usage(self, prompt_tokens, completion_tokens, estimated=False):
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.tokens_estimated = estimated
+
+    def add_retries(self, count=1):
+        self.extra_retries += count
+
+    def fail(self, error):
+        self.status = "error"
+        self.error = str(error)
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.fail(exc)
+        ended = time.perf_counter()
+        # Set by the HTTP response hooks of the pooled clients
+        first_byte_at = getattr(_context, "first_byte_at", None)
+        http_requests = getattr(_context, "http_requests", 0)
+
+        record_call(
+            provider=self.provider,
+            model=self.model,
+            symbols=self.symbols,
+            status=self.status,
+            error=self.error,
+            queue_wait_ms=self.queue_wait * 1000,
+            ttfb_ms=(first_byte_at - self.started) * 1000 if first_byte_at else None,
+            latency_ms=(ended - self.started) * 1000,
+            prompt_tokens=self.prompt_tokens,
+            completion_tokens=self.completion_tokens,
+            tokens_estimated=self.tokens_estimated,
+            retries=max(http_requests - 1, 0) + self.extra_retries,
+            discount=self.discount,
+        )
+        return False
+
+
+def record_call(provider, model, symbols, status="ok", error=None, queue_wait_ms=0.0, ttfb_ms=None,
+                latency_ms=None, prompt_tokens=None, completion_tokens=None, tokens_estimated=False,
+                retries=0, discount=1.0):
+    """Store one call record (also used directly for batch job results, which have no latency of their own)."""
+    record = {
+        "timestamp": time.time(),
+        "provider": provider,
+        "model": model,
+        "symbols": list(symbols),
+        "status": status,
+        "error": error,
+        "queue_wait_ms": _round(queue_wait_ms),
+        "ttfb_ms": _round(ttfb_ms),
+        "latency_ms": _round(latency_ms),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "tokens_estimated": tokens_estimated,
+        "retries": retries,
+        "cost_usd": estimate_cost(model, prompt_tokens, completion_tokens, discount),
+    }
+    with _lock:
+        _records.append(record)
+
+    run_metrics.increment("llm.calls")
+    if record["cost_usd"] is not None:
+        run_metrics.increment("llm.cost_usd", record["cost_usd"])
+    logger.debug(f"LLM call telemetry: {record}")
+    return record
+
+
+def _round(value, digits=2):
+    return round(value, digits) if value is not None else None
+
+
+def get_records():
+    with _lock:
+        return list(_records)
+
+
+def reset():
+    with _lock:
+        _records.clear()
+
+
+def _values(records, key):
+    return [record[key] for record in records if record[key] is not None]
+
+
+def get_summary():
+    """Aggregate the call records of the run per provider/model and per symbol."""
+    records = get_records()
+
+    by_model = {}
+    for record in records:
+        by_model.setdefault(f"{record['provider']}/{record['model']}", []).append(record)
+
+    models = {}
+    for key, group in sorted(by_model.items()):
+        models[key] = {
+            "calls": len(group),
+            "errors": sum(1 for record in group if record["status"] != "ok"),
+            "retries": sum(record["retries"] for record in group),
+            "queue_wait_ms": run_metrics.summarize(_values(group, "queue_wait_ms")),
+            "ttfb_ms": run_metrics.summarize(_values(group, "ttfb_ms")),
+            "latency_ms": run_metrics.summarize(_values(group, "latency_ms")),
+            "prompt_tokens": sum(_values(group, "prompt_tokens")),
+            "completion_tokens": sum(_values(group, "completion_tokens")),
+            "cost_usd": round(sum(_values(group, "cost_usd")), 6),
+        }
+
+    # Batched calls are shared evenly between their symbols
+    symbols = {}
+    for record in records:
+        share = 1 / max(len(record["symbols"]), 1)
+        for symbol in record["symbols"]:
+            entry = symbols.setdefault(symbol, {"calls": 0, "latency_ms": 0.0, "tokens": 0.0, "cost_usd": 0.0})
+            entry["calls"] += 1
+            entry["latency_ms"] += (record["latency_ms"] or 0) * share
+            entry["tokens"] += ((record["prompt_tokens"] or 0) + (record["completion_tokens"] or 0)) * share
+            entry["cost_usd"] += (record["cost_usd"] or 0) * share
+    for entry in symbols.values():
+        entry["latency_ms"] = round(entry["latency_ms"], 2)
+        entry["tokens"] = round(entry["tokens"], 1)
+        entry["cost_usd"] = round(entry["cost_usd"], 8)
+
+    return {
+        "totals": {
+            "calls": len(records),
+            "errors": sum(1 for record in records if record["status"] != "ok"),
+            "prompt_tokens": sum(_values(records, "prompt_tokens")),
+            "completion_tokens": sum(_values(records, "completion_tokens")),
+            "cost_usd": round(sum(_values(records, "cost_usd")), 6),
+        },
+        "by_model": models,
+        "by_symbol": dict(sorted(symbols.items(), key=lambda item: -item[1]["latency_ms"])),
+        "calls": records,
+    }
+
+
+def save_summary(path=None):
+    """Write the per-run telemetry summary as JSON (LLM_TELEMETRY_FILE, default llm_telemetry.json)."""
+    path = path or os.getenv("LLM_TELEMETRY_FILE") or "llm_telemetry.json"
+    summary = get_summary()
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2, default=str)
+    totals = summary["totals"]
+    logger.info(f"✅ LLM telemetry saved to {path}: {totals['calls']} calls, "
+                f"{totals['prompt_tokens'] + totals['completion_tokens']} tokens, ~${totals['cost_usd']}")
+    return path
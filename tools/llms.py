@@ -1,26 +1,252 @@
 import requests
 import httpx
+from requests.adapters import HTTPAdapter
 from openai import OpenAI
 from dotenv import load_dotenv
 import os
+import re
+import json
+import math
+import time
+import uuid
+import atexit
+import threading
+import concurrent.futures
+from functools import partial
 import logging
+from pathlib import Path
+from tools import run_metrics, llm_telemetry, general
 
 logger = logging.getLogger(__name__)
 
 system_prompt = "You are a financial assistant providing buy, hold or sell advice based on given metrics."
 
-def generate_prompt(metrics, current_price):
+VALID_DECISIONS = ("SELL", "HOLD", "BUY", "EMPTY_DECISION")
+
+def get_revenue_percentage():
     revenue_percentage = os.getenv('REVENUE_PERCENTAGE') 
     if not revenue_percentage:
         logger.warning("REVENUE_PERCENTAGE is not defined in the environment.")
+    return revenue_percentage
+
+# Short, stable keys for the compact prompt encoding (unknown signals keep their own name)
+COMPACT_SIGNAL_KEYS = {
+    "SMA_50": "sma50",
+    "SMA_200": "sma200",
+    "RSI": "rsi14",
+    "MACD": "macd",
+    "MACD_Signal": "macd_sig",
+    "MACD_Hist": "macd_hist",
+    "MA50_Slope": "sma50_slope5d",
+    "ROC_10": "roc10",
+    "Volatility_20": "vol20",
+    "ATR_14": "atr14",
+    "Breakout_20": "breakout20",
+    "Monthly_10pct_Prob": "p_month_up10pct",
+    "Current_Price": "price",
+}
+
+def use_compact_prompt():
+    return os.getenv("LLM_COMPACT_PROMPT", "true").strip().lower() not in ("false", "0", "no")
+
+# Signals in price units keep fixed decimals: with significant digits a 5-digit price would be
+# sent in scientific notation and close levels (price vs SMAs) could collapse to the same string
+PRICE_SIGNALS = ("Current_Price", "SMA_50", "SMA_200", "ATR_14")
+PRICE_DECIMALS = 2
+
+def _format_value(value, precision, is_price=False):
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, float):
+        return f"{value:.{PRICE_DECIMALS}f}" if is_price else f"{value:.{precision}g}"
+    return str(value)
+
+def encode_signals(signals, current_price=None, precision=None, omit_redundant=True):
+    """
+    Compact one-line encoding of the signals: short keys, fixed decimals for prices and
+    significant digits for ratios and oscillators.
+
+    Parameters:
+    - signals: dict of indicators as returned by evaluate_buy_interest
+    - current_price: price argument; emitted once as 'price' so a duplicated Current_Price is dropped
+    - precision: significant digits for non-price floats (LLM_PROMPT_PRECISION, default 4);
+      prices and price-level signals (PRICE_SIGNALS) always use PRICE_DECIMALS decimals
+    - omit_redundant: drop Current_Price when it equals current_price and empty (None/NaN) values
+    """
+    precision = precision or int(os.getenv("LLM_PROMPT_PRECISION", 4))
+    fields = []
+    if current_price is not None:
+        fields.append(("price", current_price, True))
+
+    for signal, value in signals.items():
+        if omit_redundant:
+            if value is None or (isinstance(value, float) and math.isnan(value)):
+                continue
+            if signal == "Current_Price" and current_price is not None and _same_price(value, current_price):
+                continue
+        key = COMPACT_SIGNAL_KEYS.get(signal, signal)
+        if signal == "Current_Price" and current_price is not None:
+            key = signal  # differs from the price argument, keep it distinguishable
+        fields.append((key, value, signal in PRICE_SIGNALS))
+
+    return ", ".join(f"{key}={_format_value(value, precision, is_price)}" for key, value, is_price in fields)
+
+def _same_price(value, current_price):
+    try:
+        return math.isclose(float(value), float(current_price), rel_tol=1e-6)
+    except (TypeError, ValueError):
+        return False
+
+def format_metrics(signals, current_price=None):
+    """Serialize the signals for a prompt, compact unless LLM_COMPACT_PROMPT=false."""
+    if use_compact_prompt():
+        return encode_signals(signals, current_price)
+    return "\n".join([f"{signal} = {value} " for signal, value in signals.items()])
+
+def generate_prompt(metrics, current_price):
+    revenue_percentage = get_revenue_percentage()
 
     return (
         f"Return a clear answer about the symbol using these historical metrics:\n{metrics}\n\n"
         f"Goal: identify short-term bullish setups (1–4 weeks) potentially capable of yielding ~{revenue_percentage}% profit.\n"
         f"Output format: DECISION - brief explanation (max 30 words, include indicators in parentheses).\n"
-        f"Options for DECISION: SELL, HOLD, BUY, EMPTY_DECISION."
+        f"Options for DECISION: {', '.join(VALID_DECISIONS)}."
     )
 
+def generate_batch_prompt(items):
+    """
+    Build one prompt covering several symbols, asking for a JSON array answer.
+
+    Parameters:
+    - items: list of dicts with 'symbol', 'signals' and 'current_price'
+    """
+    revenue_percentage = get_revenue_percentage()
+    blocks = "\n\n".join(
+        f"[{item['symbol']}]\n{format_metrics(item['signals'], item.get('current_price'))}" for item in items
+    )
+
+    return (
+        f"Return a clear answer about each symbol using these historical metrics:\n{blocks}\n\n"
+        f"Goal: identify short-term bullish setups (1–4 weeks) potentially capable of yielding ~{revenue_percentage}% profit.\n"
+        f"Output format: only a JSON array with one object per symbol: "
+        f'{{"symbol": "<symbol>", "decision": "<DECISION>", "explanation": "<max 30 words, include indicators in parentheses>"}}.\n'
+        f"Options for DECISION: {', '.join(VALID_DECISIONS)}."
+    )
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token for English/numeric text)."""
+    return math.ceil(len(text) / 4) if text else 0
+
+def record_prompt_tokens(prompt, symbols=1):
+    """Record the estimated prompt tokens (system + user) per symbol in the run metrics."""
+    tokens = estimate_tokens(system_prompt) + estimate_tokens(prompt)
+    for _ in range(symbols):
+        run_metrics.observe("llm.prompt_tokens_est_per_symbol", tokens / symbols)
+    return tokens
+
+def compute_batch_size(items, context_window=None, max_batch_size=None, output_tokens_per_symbol=60):
+    """
+    Largest number of symbols per request that fits in the model context window.
+
+    Parameters:
+    - items: list of dicts with 'symbol' and 'signals' (used to size one symbol block)
+    - context_window: model context in tokens (LLM_CONTEXT_WINDOW, default 128000)
+    - max_batch_size: upper bound (LLM_BATCH_SIZE, default 20)
+    - output_tokens_per_symbol: answer tokens reserved per symbol
+    """
+    context_window = context_window or int(os.getenv("LLM_CONTEXT_WINDOW", 128000))
+    max_batch_size = max_batch_size or int(os.getenv("LLM_BATCH_SIZE", 20))
+    if not items:
+        return max_batch_size
+
+    overhead = estimate_tokens(system_prompt) + estimate_tokens(generate_batch_prompt([]))
+    per_symbol = max(
+        estimate_tokens(f"[{item['symbol']}]\n{format_metrics(item['signals'], item.get('current_price'))}")
+        for item in items
+    ) + output_tokens_per_symbol
+
+    fits = (context_window - overhead) // per_symbol
+    return int(max(1, min(max_batch_size, fits)))
+
+def parse_batch_answer(answer, symbols):
+    """
+    Validate a JSON batch answer and map it back to the requested symbols.
+
+    Returns:
+    - (opinions, failed): dict symbol -> "DECISION - explanation", and the symbols without a valid entry
+    """
+    opinions = {}
+    requested = set(symbols)
+
+    # Models sometimes wrap the JSON in a markdown fence or add text around it
+    match = re.search(r"\[.*\]", answer or "", re.DOTALL)
+    try:
+        entries = json.loads(match.group(0)) if match else []
+    except json.JSONDecodeError as e:
+        logger.warning(f"Batch answer is not valid JSON: {e}")
+        entries = []
+
+    for entry in entries if isinstance(entries, list) else []:
+        if not isinstance(entry, dict):
+            continue
+        symbol = str(entry.get("symbol", "")).strip()
+        decision = str(entry.get("decision", "")).strip().upper()
+        explanation = str(entry.get("explanation", "")).strip()
+        if symbol in requested and decision in VALID_DECISIONS and symbol not in opinions:
+            opinions[symbol] = f"{decision} - {explanation}"
+
+    failed = [symbol for symbol in symbols if symbol not in opinions]
+    return opinions, failed
+
+def get_confidence_band(value=None):
+    """
+    Parse the ambiguous confidence band 'low,high' (LLM_CONFIDENCE_BAND, e.g. '-0.5,0.5').
+    Returns None (gate disabled, every symbol goes to the LLM) when it is not set.
+    """
+    value = os.getenv("LLM_CONFIDENCE_BAND", "") if value is None else value
+    if not value or not value.strip():
+        return None
+    low, high = (float(bound) for bound in value.split(","))
+    if low > high:
+        raise ValueError(f"Invalid confidence band '{value}': low bound is greater than high bound")
+    return low, high
+
+def rule_based_opinion(evaluation, confidence):
+    """Opinion string for symbols decided without the LLM (same 'DECISION - explanation' format)."""
+    return f"{evaluation} - rule-based decision, clear-cut signals (confidence {confidence:+.2f})"
+
+def apply_confidence_gate(items, band):
+    """
+    Split symbols between the LLM and the rule-based decision of evaluate_buy_interest.
+
+    Parameters:
+    - items: list of dicts with 'symbol', 'evaluation' and 'confidence' (-1 to +1)
+    - band: (low, high) ambiguous confidence range sent to the LLM, or None to send everything
+
+    Returns:
+    - (items to query, dict symbol -> rule-based opinion for the gated ones)
+    """
+    if band is None:
+        return items, {}
+
+    low, high = band
+    to_query = [item for item in items if low <= item["confidence"] <= high]
+    gated = {
+        item["symbol"]: rule_based_opinion(item["evaluation"], item["confidence"])
+        for item in items if not low <= item["confidence"] <= high
+    }
+
+    run_metrics.increment("llm.gate.evaluated", len(items))
+    run_metrics.increment("llm.gate.passed", len(to_query))
+    run_metrics.increment("llm.gate.saved_calls", len(gated))
+    evaluated = run_metrics.get_counter("llm.gate.evaluated")
+    if evaluated:
+        run_metrics.set_value("llm.gate.pass_rate", round(run_metrics.get_counter("llm.gate.passed") / evaluated, 4))
+
+    logger.info(f"Confidence gate {band}: {len(to_query)}/{len(items)} symbols sent to the LLM, "
+                f"{len(gated)} calls saved")
+    return to_query, gated
+
 def check_llm_env():
     """
     Ensure the necessary environment variables are set for the LLM API key, model name, and revenue percentage.
@@ -43,25 +269,230 @@ def check_llm_env():
 if not os.getenv("GITHUB_ACTIONS"):  # This var is auto-set in GitHub Actions
     load_dotenv()
 
+DEFAULT_DEEPSEEK_URL = "https://api.deepseek.com/chat/completions"
+
+class LLMClientManager:
+    """
+    Lazily creates one pooled HTTP client per LLM provider and reuses it for every call,
+    so keep-alive connections (and their TCP/TLS handshakes) are shared across symbols.
+
+    Settings come from the environment unless given explicitly:
+        LLM_POOL_SIZE: max pooled connections per provider (default 10)
+        LLM_TIMEOUT_SECONDS: per-request timeout in seconds (default 60)
+    """
+
+    def __init__(self, pool_size=None, timeout=None):
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._executor = None
+        self._pool_size = pool_size
+        self._timeout = timeout
+
+    @property
+    def pool_size(self):
+        return self._pool_size or int(os.getenv("LLM_POOL_SIZE", 10))
+
+    @property
+    def timeout(self):
+        return self._timeout or float(os.getenv("LLM_TIMEOUT_SECONDS", 60))
+
+    def configure(self, pool_size=None, timeout=None):
+        """Change pool settings. Open clients are closed so the next call uses the new values."""
+        self.close()
+        self._pool_size = pool_size
+        self._timeout = timeout
+
+    def get_openai_client(self):
+        with self._lock:
+            client = self._clients.get("openai")
+            if client is None:
+                http_client = httpx.Client(
+                    verify=False,
+                    timeout=self.timeout,
+                    limits=httpx.Limits(
+                        max_connections=self.pool_size,
+                        max_keepalive_connections=self.pool_size
+                    ),
+                    event_hooks={
+                        "request": [llm_telemetry.on_http_request],
+                        "response": [llm_telemetry.on_http_response]
+                    }
+                )
+                client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=http_client)
+                self._clients["openai"] = client
+                logger.debug(f"Created pooled OpenAI client (pool_size={self.pool_size}, timeout={self.timeout})")
+            return client
+
+    def get_deepseek_session(self):
+        with self._lock:
+            session = self._clients.get("deepseek")
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.hooks["response"].append(llm_telemetry.on_requests_response)
+                self._clients["deepseek"] = session
+                logger.debug(f"Created pooled DeepSeek session (pool_size={self.pool_size})")
+            return session
+
+    def get_executor(self):
+        """Shared worker pool for concurrent provider calls (two workers per pooled connection slot)."""
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.pool_size * 2, thread_name_prefix="llm"
+                )
+            return self._executor
+
+    def close(self):
+        """Close every open client. Safe to call more than once."""
+        with self._lock:
+            clients, self._clients = self._clients, {}
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        for provider, client in clients.items():
+            try:
+                client.close()
+            except Exception as e:
+                logger.warning(f"Error closing {provider} client: {e}")
+
+client_manager = LLMClientManager()
+atexit.register(client_manager.close)
+
+# Text before the first separator, as read by general.extract_llm_decision
+DECISION_PATTERN = re.compile(r"^([^-]*)-")
+
+def use_streaming():
+    return os.getenv("LLM_STREAM", "false").strip().lower() in ("true", "1", "yes")
+
+def stop_stream_early():
+    return os.getenv("LLM_STREAM_STOP_EARLY", "true").strip().lower() not in ("false", "0", "no")
+
+class DecisionStreamParser:
+    """
+    Incrementally parses a streamed 'DECISION - explanation' answer.
+    The decision is known as soon as the separator following it arrives.
+    """
+
+    def __init__(self, max_words=None, started=None):
+        self.text = ""
+        self.decision = None
+        self.separator_seen = False
+        self.time_to_decision = None
+        self.max_words = max_words
+        self.started = started if started is not None else time.perf_counter()
+
+    def feed(self, delta):
+        if not delta:
+            return
+        self.text += delta
+        if not self.separator_seen:
+            match = DECISION_PATTERN.match(self.text)
+            if match:
+                # Normalized like the stored opinion will be read downstream ('**BUY** -' is BUY);
+                # text before the separator that is not a decision never becomes one
+                self.separator_seen = True
+                decision = general.normalize_decision(match.group(1))
+                if decision in VALID_DECISIONS:
+                    self.decision = decision
+                    self.time_to_decision = time.perf_counter() - self.started
+
+    def _explanation_words(self):
+        return self.text.split("-", 1)[1].split() if self.decision else []
+
+    @property
+    def limit_reached(self):
+        """True once more than max_words explanation words arrived (the last complete word is known)."""
+        return bool(self.max_words) and len(self._explanation_words()) > self.max_words
+
+    def answer(self):
+        """Streamed text, cut to max_words explanation words when the limit was exceeded."""
+        if not self.limit_reached:
+            return self.text
+        head = self.text.split("-", 1)[0]
+        return f"{head}- {' '.join(self._explanation_words()[:self.max_words])}"
+
+def _consume_stream(deltas, provider, started, stop_early):
+    """Feed streamed text deltas into a DecisionStreamParser. Returns (parser, stopped_early)."""
+    max_words = int(os.getenv("LLM_STREAM_MAX_WORDS", 30)) if stop_early else None
+    parser = DecisionStreamParser(max_words=max_words, started=started)
+    stopped = False
+    for delta in deltas:
+        if _call_abandoned():
+            break
+        parser.feed(delta)
+        if parser.limit_reached:
+            stopped = True
+            run_metrics.increment(f"llm.{provider}.streams_stopped_early")
+            break
+    _record_latency(provider, started, parser.time_to_decision)
+    return parser, stopped
+
+def _record_latency(provider, started, time_to_decision=None):
+    total = time.perf_counter() - started
+    run_metrics.observe(f"llm.{provider}.total_latency_ms", total * 1000)
+    run_metrics.observe(f"llm.{provider}.time_to_decision_ms",
+                        (time_to_decision if time_to_decision is not None else total) * 1000)
+
+def _set_usage(call, usage):
+    if usage:
+        call.set_usage(usage.get("prompt_tokens"), usage.get("completion_tokens"))
+
+def _estimate_usage(call, prompt, answer):
+    """Fall back to estimated tokens when the provider did not report usage (e.g. stopped streams)."""
+    if call.prompt_tokens is None:
+        call.set_usage(estimate_tokens(system_prompt) + estimate_tokens(prompt), estimate_tokens(answer), estimated=True)
+
+def _openai_stream_deltas(stream, call):
+    for chunk in stream:
+        if getattr(chunk, "usage", None):
+            _set_usage(call, chunk.usage.model_dump())
+        if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+def _sse_deltas(response, call):
+    """Text deltas of an OpenAI-compatible server-sent events response (DeepSeek streaming)."""
+    response.encoding = "utf-8"
+    for line in response.iter_lines(decode_unicode=True):
+        if not line or not line.startswith("data:"):
+            continue
+        payload = line[len("data:"):].strip()
+        if payload == "[DONE]":
+            break
+        event = json.loads(payload)
+        _set_usage(call, event.get("usage"))
+        choices = event.get("choices") or [{}]
+        content = (choices[0].get("delta") or {}).get("content")
+        if content:
+            yield content
+
 def get_llm_file_analysis():
     # Placeholder for uploading a file to OpenAI
     logger.warning("get_llm_file_analysis function is not yet implemented.")
     raise NotImplementedError("Function 'get_llm_file_analysis' is not implemented yet.")
 
-def get_deepseek_signals_analysis(signals, symbol, current_price):
+def get_deepseek_signals_analysis(signals, symbol, current_price, stream=None):
+    """
+    Query DeepSeek with stock signals. With stream=True (default: LLM_STREAM) the answer is read as
+    server-sent events and, unless LLM_STREAM_STOP_EARLY=false, reading stops at the explanation limit.
+    """
     API_KEY = os.getenv("DEEPKSEEK_API_KEY")
     if not API_KEY:
         logger.error("DEEPKSEEK_API_KEY is not defined in the environment.")
         return "Missing DEEPKSEEK_API_KEY"
 
-    url = "https://api.deepseek.com/chat/completions"
+    stream = use_streaming() if stream is None else stream
+    url = os.getenv("DEEPSEEK_API_URL", DEFAULT_DEEPSEEK_URL)
     headers = {
         "Content-Type": "application/json",
         "Authorization": f"Bearer {API_KEY}"
     }
 
-    metrics = "\n".join([f"{signal} = {value} " for signal, value in signals.items()])
+    metrics = format_metrics(signals, current_price)
     prompt = generate_prompt(metrics, current_price)
+    record_prompt_tokens(prompt)
 
     data = {
         "model": "deepseek-reasoner",  # Use 'deepseek-reasoner' for R1 model or 'deepseek-chat' for V3 model
@@ -69,25 +500,45 @@ def get_deepseek_signals_analysis(signals, symbol, current_price):
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": prompt}
         ],
-        "stream": False  # Disable streaming
+        "stream": stream
     }
 
-    try:
-        response = requests.post(url, headers=headers, json=data)
-        response.raise_for_status()  # Will raise HTTPError for bad responses (4xx or 5xx)
+    with llm_telemetry.LLMCall("deepseek", data["model"], [symbol]) as call:
+        try:
+            session = client_manager.get_deepseek_session()
+            started = time.perf_counter()
+            response = session.post(url, headers=headers, json=data, timeout=_request_timeout(), stream=stream)
+            response.raise_for_status()  # Will raise HTTPError for bad responses (4xx or 5xx)
+
+            if response.status_code != 200:
+                logger.error(f"DeepSeek Request failed for symbol {symbol}, error code: {response.status_code}")
+                call.fail(f"status {response.status_code}")
+                return f"error {response.status_code}"
 
-        if response.status_code == 200:
-            result = response.json()
-            return result['choices'][0]['message']['content']
-        else:
-            logger.error(f"DeepSeek Request failed for symbol {symbol}, error code: {response.status_code}")
-            return f"error {response.status_code}"
+            if stream:
+                try:
+                    parser, _ = _consume_stream(_sse_deltas(response, call), "deepseek", started, stop_stream_early())
+                finally:
+                    response.close()
+                if _call_abandoned():
+                    call.fail("abandoned at the run deadline")
+                answer = parser.answer()
+            else:
+                result = response.json()
+                _record_latency("deepseek", started)
+                _set_usage(call, result.get("usage"))
+                answer = result['choices'][0]['message']['content']
 
-    except requests.exceptions.RequestException as e:
-        logger.error(f"DeepSeek Request failed for symbol {symbol}: {e}")
-        return f"error {str(e)}"
+            _estimate_usage(call, prompt, answer)
+            return answer
 
-def get_gpt_signals_analysis(signals, symbol, current_price):
+        except (requests.exceptions.RequestException, ValueError) as e:
+            # ValueError: malformed JSON body or server-sent event
+            logger.error(f"DeepSeek Request failed for symbol {symbol}: {e}")
+            call.fail(e)
+            return f"error {str(e)}"
+
+def get_gpt_signals_analysis(signals, symbol, current_price, stream=None):
     """
     Query the LLM model with stock signals and get a concise buy/hold/sell recommendation.
     
@@ -95,6 +546,7 @@ def get_gpt_signals_analysis(signals, symbol, current_price):
     - signals: dict of financial indicators (e.g., SMA_50, RSI, MACD)
     - symbol: ticker symbol string
     - current_price: current stock price (not used here but may be useful)
+    - stream: stream the answer and parse the decision as soon as it arrives (default: LLM_STREAM)
     
     Returns:
     - LLM-generated text recommendation or error message string
@@ -106,36 +558,512 @@ def get_gpt_signals_analysis(signals, symbol, current_price):
     logger.info(f"Calling GPT model {model_name}...")
 
     # Prepare metrics string from signals dictionary
-    metrics = "\n".join([f"{signal} = {value} " for signal, value in signals.items()])
+    metrics = format_metrics(signals, current_price)
     prompt = generate_prompt(metrics, current_price)
+    prompt_tokens = record_prompt_tokens(prompt)
+
+    with llm_telemetry.LLMCall("openai", model_name, [symbol]) as call:
+        try:
+            openai = client_manager.get_openai_client()
+            llm_temperature = 0
+
+            messages_prompt = [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt}
+            ]
+
+            logger.info(f"LLM prompt sent for {symbol} (~{prompt_tokens} tokens)")
+            logger.debug(f"LLM prompt: {prompt}")
+
+            stream = use_streaming() if stream is None else stream
+            started = time.perf_counter()
+            response = openai.chat.completions.create(
+                model=model_name,
+                messages=messages_prompt,
+                temperature=llm_temperature,
+                stream=stream,
+                timeout=_request_timeout(),
+                **({"stream_options": {"include_usage": True}} if stream else {})
+            )
+
+            if stream:
+                try:
+                    parser, _ = _consume_stream(_openai_stream_deltas(response, call), "openai", started, stop_stream_early())
+                finally:
+                    response.close()
+                if _call_abandoned():
+                    call.fail("abandoned at the run deadline")
+                llm_answer = parser.answer()
+            else:
+                _record_latency("openai", started)
+                if response.usage is not None:
+                    call.set_usage(response.usage.prompt_tokens, response.usage.completion_tokens)
+                llm_answer = response.choices[0].message.content
 
+            _estimate_usage(call, prompt, llm_answer)
+            logger.info(f"LLM answer: {llm_answer}")
+
+            return llm_answer
+
+        except Exception as e:
+            error_msg = f"Error getting GPT analysis for {symbol}: {e}"
+            logger.error(error_msg)
+            call.fail(e)
+            return error_msg
+
+def is_valid_opinion(opinion):
+    """True when the answer starts with one of the expected decisions."""
+    if not isinstance(opinion, str):
+        return False
+    return general.normalize_decision(opinion.split('-')[0]) in VALID_DECISIONS
+
+# Set on the worker thread of a call submitted through PendingCalls (unset for direct calls)
+_pending_call = threading.local()
+
+class _CallHandle:
+    """Run deadline of one submitted call, and whether it was abandoned at that deadline."""
+
+    def __init__(self, deadline_at):
+        self.deadline_at = deadline_at
+        self.abandoned = threading.Event()
+
+def _run_call(fn, submitted_at, handle):
+    _pending_call.handle = handle
     try:
-        openai = OpenAI(
-            api_key=os.getenv("OPENAI_API_KEY"),
-            http_client=httpx.Client(verify=False)
+        return llm_telemetry.run_queued(fn, submitted_at)
+    finally:
+        _pending_call.handle = None
+
+def _call_abandoned():
+    """True on the worker of a call that missed its run deadline: it stops reading and closes its response."""
+    handle = getattr(_pending_call, "handle", None)
+    return handle is not None and handle.abandoned.is_set()
+
+def _request_timeout():
+    """HTTP timeout of a call: LLM_TIMEOUT_SECONDS, capped at the time left before the run deadline."""
+    handle = getattr(_pending_call, "handle", None)
+    if handle is None:
+        return client_manager.timeout
+    return max(0.1, min(client_manager.timeout, handle.deadline_at - time.monotonic()))
+
+class PendingCalls:
+    """
+    Provider calls submitted at once to the shared worker pool, collected under one deadline that
+    starts at submission (LLM_DEADLINE_SECONDS, default 60).
+    """
+
+    def __init__(self, calls, deadline=None):
+        self.deadline = deadline if deadline is not None else float(os.getenv("LLM_DEADLINE_SECONDS", 60))
+        self.deadline_at = time.monotonic() + self.deadline
+        executor = client_manager.get_executor()
+        self.futures = {}
+        for name, fn in calls.items():
+            handle = _CallHandle(self.deadline_at)
+            future = executor.submit(_run_call, fn, time.perf_counter(), handle)
+            self.futures[future] = (name, handle)
+
+    def results(self):
+        """
+        Wait until the deadline. Calls still queued are cancelled, and running streams stop at their
+        next chunk and close their response, so the workers are released.
+
+        Returns:
+        - dict call name -> answer, None for timeouts and failures
+        """
+        _, not_done = concurrent.futures.wait(self.futures, timeout=max(0.0, self.deadline_at - time.monotonic()))
+
+        results = {}
+        for future, (name, handle) in self.futures.items():
+            provider = name[0] if isinstance(name, tuple) else name
+            if future in not_done:
+                future.cancel()
+                handle.abandoned.set()
+                logger.warning(f"{name} did not answer within the {self.deadline}s deadline")
+                run_metrics.increment(f"llm.{provider}.timeouts")
+                results[name] = None
+                continue
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                logger.error(f"{name} call failed: {e}")
+                results[name] = None
+        return results
+
+def query_with_deadline(calls, deadline=None):
+    """
+    Run provider calls concurrently and wait at most `deadline` seconds (LLM_DEADLINE_SECONDS, default 60)
+    for all of them.
+
+    Parameters:
+    - calls: dict call name -> callable without arguments
+
+    Returns:
+    - dict call name -> answer, None for timeouts and failures
+    """
+    return PendingCalls(calls, deadline).results()
+
+def submit_signals_analyses(items, providers=("openai", "deepseek"), deadline=None):
+    """
+    Submit the analysis of every item by every provider at once. The deadline covers them all.
+
+    Parameters:
+    - items: dicts with symbol, signals and current_price
+    - providers: "openai" and/or "deepseek"
+
+    Returns:
+    - PendingCalls, to read with collect_signals_analyses
+    """
+    analyses = {"openai": get_gpt_signals_analysis, "deepseek": get_deepseek_signals_analysis}
+    return PendingCalls({
+        (provider, item["symbol"]): partial(analyses[provider], item["signals"], item["symbol"], item["current_price"])
+        for provider in providers for item in items
+    }, deadline)
+
+def collect_signals_analyses(pending):
+    """
+    Wait for submitted analyses.
+
+    Returns:
+    - dict provider -> {symbol: opinion}; a model that timed out or gave no valid decision has None,
+      so general.decide_final_action proceeds with the other answer.
+    """
+    opinions = {}
+    for (provider, symbol), opinion in pending.results().items():
+        if opinion is not None and not is_valid_opinion(opinion):
+            logger.warning(f"Discarding {provider} answer without a valid decision for {symbol}: {opinion}")
+            opinion = None
+        opinions.setdefault(provider, {})[symbol] = opinion
+    return opinions
+
+def get_dual_signals_analysis(signals, symbol, current_price, deadline=None):
+    """
+    Query GPT and DeepSeek concurrently for one symbol under a shared deadline.
+
+    Returns:
+    - (gpt opinion, deepseek opinion), None for a model that timed out or gave no valid decision
+    """
+    item = {"symbol": symbol, "signals": signals, "current_price": current_price}
+    opinions = collect_signals_analyses(submit_signals_analyses([item], deadline=deadline))
+    return opinions["openai"][symbol], opinions["deepseek"][symbol]
+
+def get_latency_report(providers=("openai", "deepseek")):
+    """Per-model latency percentiles and timeout counts of the run, to tune LLM_DEADLINE_SECONDS."""
+    report = {}
+    for provider in providers:
+        samples = run_metrics.get_observations(f"llm.{provider}.total_latency_ms")
+        report[provider] = {
+            "calls": len(samples),
+            **{f"p{pct}_ms": run_metrics.percentile(samples, pct) for pct in (50, 90, 95, 99)},
+            "timeouts": run_metrics.get_counter(f"llm.{provider}.timeouts"),
+        }
+    return report
+
+def _request_gpt_batch(items, model_name, attempt=0):
+    """Send one batched request. Returns (opinions, failed symbols)."""
+    symbols = [item["symbol"] for item in items]
+    prompt = generate_batch_prompt(items)
+    record_prompt_tokens(prompt, symbols=len(symbols))
+
+    with llm_telemetry.LLMCall("openai", model_name, symbols) as call:
+        call.add_retries(attempt)
+        try:
+            response = client_manager.get_openai_client().chat.completions.create(
+                model=model_name,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0
+            )
+        except Exception as e:
+            logger.error(f"Error getting GPT batch analysis for {symbols}: {e}")
+            call.fail(e)
+            return {}, symbols
+
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            call.set_usage(usage.prompt_tokens, usage.completion_tokens)
+        _estimate_usage(call, prompt, response.choices[0].message.content)
+
+    run_metrics.increment("llm.batch.requests")
+    if usage is not None:
+        per_symbol = (usage.prompt_tokens + usage.completion_tokens) / len(symbols)
+        for _ in symbols:
+            run_metrics.observe("llm.batch.tokens_per_symbol", per_symbol)
+        logger.info(f"GPT batch of {len(symbols)} symbols used {usage.prompt_tokens} prompt + "
+                    f"{usage.completion_tokens} completion tokens ({per_symbol:.1f} per symbol)")
+
+    answer = response.choices[0].message.content
+    logger.debug(f"LLM batch answer: {answer}")
+    return parse_batch_answer(answer, symbols)
+
+def get_gpt_batch_signals_analysis(items, batch_size=None, max_retries=1):
+    """
+    Query the GPT model for several symbols per request and map the answers back per symbol.
+
+    Parameters:
+    - items: list of dicts with 'symbol', 'signals' and 'current_price'
+    - batch_size: max symbols per request (LLM_BATCH_SIZE), reduced if needed to fit the context window
+    - max_retries: extra requests for symbols whose answer could not be parsed
+
+    Returns:
+    - dict symbol -> "DECISION - explanation" (same format as get_gpt_signals_analysis) or an error message
+    """
+    check_llm_env()
+    model_name = os.getenv('GPT_MODEL_NAME', 'gpt-4o')
+    batch_size = compute_batch_size(items, max_batch_size=batch_size)
+    by_symbol = {item["symbol"]: item for item in items}
+
+    logger.info(f"Calling GPT model {model_name} for {len(items)} symbols in batches of {batch_size}...")
+
+    opinions = {}
+    pending = list(by_symbol)
+    for attempt in range(max_retries + 1):
+        if attempt:
+            logger.warning(f"Retrying {len(pending)} symbols without a valid batch answer: {pending}")
+            run_metrics.increment("llm.batch.retried_symbols", len(pending))
+
+        failed = []
+        for start in range(0, len(pending), batch_size):
+            batch = [by_symbol[symbol] for symbol in pending[start:start + batch_size]]
+            batch_opinions, batch_failed = _request_gpt_batch(batch, model_name, attempt)
+            opinions.update(batch_opinions)
+            failed.extend(batch_failed)
+
+        pending = failed
+        if not pending:
+            break
+
+    for symbol in pending:
+        opinions[symbol] = f"Error getting GPT analysis for {symbol}: no valid answer in batch response"
+        run_metrics.increment("llm.batch.failed_symbols")
+
+    return opinions
+
+BATCH_TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+def build_batch_job_lines(items, model_name=None):
+    """
+    Build one chat-completions request per symbol in the OpenAI Batch API JSONL format.
+    The symbol is used as custom_id so answers can be merged back.
+    """
+    model_name = model_name or os.getenv('GPT_MODEL_NAME', 'gpt-4o')
+    return [
+        {
+            "custom_id": item["symbol"],
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": model_name,
+                "messages": [
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": generate_prompt(format_metrics(item["signals"], item["current_price"]), item["current_price"])}
+                ],
+                "temperature": 0
+            }
+        }
+        for item in items
+    ]
+
+def write_batch_job(items, path, model_name=None):
+    """Write all prompts of the run as a JSONL batch job file and return its path."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for line in build_batch_job_lines(items, model_name):
+            record_prompt_tokens(line["body"]["messages"][-1]["content"])
+            f.write(json.dumps(line) + "\n")
+    logger.info(f"Batch job with {len(items)} requests written to {path}")
+    return path
+
+def parse_batch_results(lines):
+    """
+    Map batch output lines (OpenAI Batch API format) to custom_id -> answer text or error message.
+    """
+    answers = {}
+    for line in lines:
+        if not line.strip():
+            continue
+        result = json.loads(line)
+        custom_id = result.get("custom_id")
+        response = result.get("response") or {}
+        error = result.get("error")
+
+        if error or response.get("status_code") != 200:
+            answers[custom_id] = f"Error getting GPT analysis for {custom_id}: {error or response.get('status_code')}"
+            continue
+        answers[custom_id] = response["body"]["choices"][0]["message"]["content"]
+    return answers
+
+class BatchBackend:
+    """
+    Interface of the offline batch backends: submit a JSONL job, poll its status and fetch its output lines.
+    """
+
+    def submit(self, job_path):
+        """Submit the job file and return a job id."""
+        raise NotImplementedError
+
+    def poll(self, job_id):
+        """Return the job status, one of BATCH_TERMINAL_STATUSES once it is finished."""
+        raise NotImplementedError
+
+    def fetch_results(self, job_id):
+        """Return the output JSONL lines of a finished job."""
+        raise NotImplementedError
+
+class OpenAIBatchBackend(BatchBackend):
+    """OpenAI Batch API (asynchronous, completed within 24h at a discounted price)."""
+
+    def __init__(self, completion_window="24h"):
+        self.completion_window = completion_window
+
+    def submit(self, job_path):
+        client = client_manager.get_openai_client()
+        with open(job_path, "rb") as f:
+            input_file = client.files.create(file=f, purpose="batch")
+        batch = client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window=self.completion_window
         )
-        llm_temperature = 0
+        return batch.id
 
-        messages_prompt = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": prompt}
-        ]
-        
-        logger.info(f"LLM prompt sent: {prompt}")
-
-        response = openai.chat.completions.create(
-            model=model_name,
-            messages=messages_prompt,
-            temperature=llm_temperature
+    def poll(self, job_id):
+        return client_manager.get_openai_client().batches.retrieve(job_id).status
+
+    def fetch_results(self, job_id):
+        client = client_manager.get_openai_client()
+        batch = client.batches.retrieve(job_id)
+        lines = []
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                lines.extend(client.files.content(file_id).text.splitlines())
+        return lines
+
+class LocalFileBatchBackend(BatchBackend):
+    """
+    File-based stand-in for a batch service: jobs live in a local folder and are answered by
+    a responder function on the first poll, so the whole flow runs without network.
+    """
+
+    def __init__(self, work_dir="batch_jobs", responder=None):
+        # The stub server is only needed by this offline backend: imported here so the
+        # production pipeline does not depend on it
+        from tools import llm_stub_server
+        self.work_dir = Path(work_dir)
+        self.responder = responder or llm_stub_server.default_responder
+        self.build_completion = llm_stub_server.build_completion
+
+    def _job_dir(self, job_id):
+        return self.work_dir / job_id
+
+    def submit(self, job_path):
+        job_id = f"local-{uuid.uuid4().hex[:12]}"
+        job_dir = self._job_dir(job_id)
+        job_dir.mkdir(parents=True, exist_ok=True)
+        (job_dir / "input.jsonl").write_bytes(Path(job_path).read_bytes())
+        (job_dir / "status").write_text("in_progress")
+        return job_id
+
+    def poll(self, job_id):
+        job_dir = self._job_dir(job_id)
+        status = (job_dir / "status").read_text()
+        if status != "in_progress":
+            return status
+
+        with open(job_dir / "input.jsonl", encoding="utf-8") as src, \
+                open(job_dir / "output.jsonl", "w", encoding="utf-8") as dst:
+            for line in src:
+                if not line.strip():
+                    continue
+                request = json.loads(line)
+                try:
+                    content = self.responder(request["body"])
+                    output = {
+                        "custom_id": request["custom_id"],
+                        "response": {"status_code": 200, "body": self.build_completion(request["body"]["model"], content)},
+                        "error": None
+                    }
+                except Exception as e:
+                    output = {"custom_id": request["custom_id"], "response": None, "error": str(e)}
+                dst.write(json.dumps(output) + "\n")
+
+        (job_dir / "status").write_text("completed")
+        return "completed"
+
+    def fetch_results(self, job_id):
+        return (self._job_dir(job_id) / "output.jsonl").read_text(encoding="utf-8").splitlines()
+
+def get_batch_backend(name=None):
+    """Return the batch backend configured in LLM_BATCH_BACKEND ('openai' or 'local')."""
+    name = (name or os.getenv("LLM_BATCH_BACKEND") or "openai").strip().lower()
+    if name == "openai":
+        return OpenAIBatchBackend()
+    if name == "local":
+        return LocalFileBatchBackend(os.getenv("LLM_BATCH_JOB_DIR", "batch_jobs"))
+    raise ValueError(f"Unknown batch backend: {name}")
+
+def _record_batch_job_telemetry(lines, backend):
+    """One telemetry record per answered request of a batch job (no latency: they share the job wait)."""
+    provider = f"batch-{type(backend).__name__}"
+    for line in lines:
+        if not line.strip():
+            continue
+        result = json.loads(line)
+        body = (result.get("response") or {}).get("body") or {}
+        usage = body.get("usage") or {}
+        llm_telemetry.record_call(
+            provider=provider,
+            model=body.get("model"),
+            symbols=[result.get("custom_id")],
+            status="ok" if not result.get("error") else "error",
+            error=result.get("error"),
+            prompt_tokens=usage.get("prompt_tokens"),
+            completion_tokens=usage.get("completion_tokens"),
+            discount=llm_telemetry.BATCH_DISCOUNT
         )
 
-        llm_answer = response.choices[0].message.content
+def run_batch_job(items, backend=None, job_dir=None, poll_interval=None, timeout=None):
+    """
+    Run the LLM analysis of all symbols as one offline batch job.
+
+    Parameters:
+    - items: list of dicts with 'symbol', 'signals' and 'current_price'
+    - backend: BatchBackend instance (default: get_batch_backend())
+    - job_dir: folder for the JSONL job file (LLM_BATCH_JOB_DIR, default 'batch_jobs')
+    - poll_interval / timeout: seconds between status checks / before giving up
+      (LLM_BATCH_POLL_SECONDS, default 30 / LLM_BATCH_TIMEOUT_SECONDS, default 10800)
+
+    Returns:
+    - dict symbol -> "DECISION - explanation" or an error message
+    """
+    backend = backend or get_batch_backend()
+    job_dir = Path(job_dir or os.getenv("LLM_BATCH_JOB_DIR", "batch_jobs"))
+    poll_interval = poll_interval if poll_interval is not None else float(os.getenv("LLM_BATCH_POLL_SECONDS", 30))
+    timeout = timeout if timeout is not None else float(os.getenv("LLM_BATCH_TIMEOUT_SECONDS", 10800))
+
+    job_path = write_batch_job(items, job_dir / f"job-{time.strftime('%Y%m%d-%H%M%S')}.jsonl")
+    job_id = backend.submit(job_path)
+    logger.info(f"Batch job {job_id} submitted with {len(items)} requests")
+    run_metrics.increment("llm.batch_job.requests", len(items))
 
-        logger.info(f"LLM answer: {llm_answer}")
+    started = time.monotonic()
+    status = backend.poll(job_id)
+    while status not in BATCH_TERMINAL_STATUSES:
+        if time.monotonic() - started > timeout:
+            logger.error(f"Batch job {job_id} not finished after {timeout}s (status: {status})")
+            break
+        time.sleep(poll_interval)
+        status = backend.poll(job_id)
 
-        return llm_answer
+    run_metrics.observe("llm.batch_job.wait_seconds", time.monotonic() - started)
+    lines = backend.fetch_results(job_id) if status in BATCH_TERMINAL_STATUSES else []
+    _record_batch_job_telemetry(lines, backend)
+    answers = parse_batch_results(lines)
+    logger.info(f"Batch job {job_id} finished with status {status}: {len(answers)}/{len(items)} answers")
 
-    except Exception as e:
-        error_msg = f"Error getting GPT analysis for {symbol}: {e}"
-        logger.error(error_msg)
-        return error_msg
+    return {
+        item["symbol"]: answers.get(item["symbol"], f"Error getting GPT analysis for {item['symbol']}: batch job {status}")
+        for item in items
+    }
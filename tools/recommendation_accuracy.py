@@ -0,0 +1,192 @@
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from tools import general, historicals, symbol_registry
+
+logger = logging.getLogger(__name__)
+
+# Walk-forward evaluation of past BUY recommendations against the daily prices that followed them.
+# Everything is computed on flat arrays of all symbols' prices (sorted by symbol and date), so the
+# whole history is evaluated at once instead of symbol by symbol.
+HORIZONS = (1, 5, 10, 20, 60)  # trading days after the buy
+MAX_DAYS = int(os.environ.get("ACCURACY_MAX_DAYS") or 252)  # trading days searched for the revenue target
+BLOCK_ROWS = 4096  # recommendations evaluated per block (bounds the size of the window matrices)
+
+# Decision sources of generate_action_column: column holding each source's opinion and how to read it
+DECISION_SOURCES = {
+    "LLM1": ("llm_opinion", general.extract_llm_decision),
+    "LLM2": ("llm_2_opinion", general.extract_llm_decision),
+    "CUSTOM": ("evaluation", lambda value: value.split()[-1].upper() if isinstance(value, str) and value.strip() else None),
+    "FINAL": ("action", lambda value: value.strip().upper() if isinstance(value, str) else None),
+}
+
+
+def _days(values):
+    # Calendar day numbers (days since epoch); NaT for unparseable dates
+    dates = pd.to_datetime(pd.Series(values), errors="coerce", utc=True).dt.tz_localize(None)
+    return dates.to_numpy(dtype="datetime64[D]")
+
+
+def build_recommendations(history_df):
+    """
+    One row per BUY decision of each source found in analysis history rows (tools/analysis_history.py).
+
+    Parameters:
+        history_df (pd.DataFrame): Rows with symbol, run_at, current_price and the opinion columns
+
+    Returns:
+        pd.DataFrame with symbol, buy_date, buy_value and source
+    """
+    frames = []
+    for source, (column, extract) in DECISION_SOURCES.items():
+        if column not in history_df.columns:
+            continue
+        values = history_df[column]
+        # Opinions repeat a lot: parse each distinct value once
+        decisions = values.map({value: extract(value) for value in values.dropna().unique()})
+        buys = history_df.loc[decisions == "BUY", ["symbol", "run_at", "current_price"]]
+        frames.append(buys.rename(columns={"run_at": "buy_date", "current_price": "buy_value"}).assign(source=source))
+    if not frames:
+        return pd.DataFrame(columns=["symbol", "buy_date", "buy_value", "source"])
+    return pd.concat(frames, ignore_index=True)
+
+
+def load_price_history(symbols, fetch=historicals.get_historical_data, max_workers=8):
+    """
+    Daily prices of the given symbols in long format (symbol, date, close, high, low).
+
+    Parameters:
+        symbols (list): Listed symbols to fetch (rows keep them; the provider ticker comes from the
+            symbol registry, e.g. RHM.DE -> RHM)
+        fetch (callable): ticker -> DataFrame with date/close/high/low columns (historicals by default)
+        max_workers (int): Symbols fetched concurrently
+    """
+    registry = symbol_registry.get_registry()
+
+    def load(symbol):
+        try:
+            df = fetch(registry.provider_ticker(symbol, "historicals"))
+        except Exception as e:
+            logger.error(f"❌ Error fetching price history of {symbol}: {e}")
+            return None
+        if df is None or df.empty:
+            return None
+        columns = [column for column in ("date", "close", "high", "low") if column in df.columns]
+        return df[columns].assign(symbol=symbol)
+
+    symbols = list(dict.fromkeys(symbols))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        frames = [df for df in executor.map(load, symbols) if df is not None]
+    if not frames:
+        return pd.DataFrame(columns=["symbol", "date", "close", "high", "low"])
+    logger.info(f"✅ Price history loaded for {len(frames)}/{len(symbols)} symbols")
+    return pd.concat(frames, ignore_index=True)
+
+
+def evaluate_recommendations(recommendations, prices, revenue_percentage, horizons=HORIZONS, max_days=MAX_DAYS):
+    """
+    Walk-forward outcome of each recommendation, using the daily bars after its buy date.
+
+    Parameters:
+        recommendations (pd.DataFrame): symbol, buy_date, buy_value (and optionally source)
+        prices (pd.DataFrame): Long daily prices: symbol, date, close (high/low used when present)
+        revenue_percentage (float): Target gain, as REVENUE_PERCENTAGE
+        horizons (tuple): Trading-day horizons of the forward returns
+        max_days (int): Trading days searched for the target (and for the drawdown when it is not reached)
+
+    Returns:
+        Copy of recommendations with:
+            return_<h>d: close of the h-th bar after the buy vs buy_value (NaN if not reached yet)
+            reached_target: the high of a bar reached buy_value * (1 + revenue_percentage / 100)
+            days_to_target / bars_to_target: calendar days / bars from the buy to that bar (NaN if not reached)
+            max_drawdown: lowest low vs buy_value while the position was open (until the target, or the window end)
+            bars_available: bars after the buy in the price history
+    """
+    result = recommendations.copy()
+    prices = prices.dropna(subset=["close"])
+    codes, symbols = pd.factorize(prices["symbol"])
+    day = _days(prices["date"]).astype(np.int64)
+    order = np.lexsort((day, codes))
+    codes, day = codes[order], day[order]
+    close = prices["close"].to_numpy(dtype=float)[order]
+    high = prices["high"].to_numpy(dtype=float)[order] if "high" in prices.columns else close
+    low = prices["low"].to_numpy(dtype=float)[order] if "low" in prices.columns else close
+    high = np.where(np.isnan(high), close, high)
+    low = np.where(np.isnan(low), close, low)
+
+    rec_code = symbols.get_indexer(recommendations["symbol"]) if len(symbols) else np.full(len(recommendations), -1)
+    rec_day = _days(recommendations["buy_date"])
+    buy_value = pd.to_numeric(recommendations["buy_value"], errors="coerce").to_numpy(dtype=float)
+    valid = (rec_code >= 0) & ~np.isnat(rec_day) & (buy_value > 0)
+    rec_day = np.where(valid, rec_day.astype(np.int64), 0)
+    rec_code = np.where(valid, rec_code, 0)
+
+    # (symbol, day) as one sortable key: the first bar after the buy day is a binary search away
+    first_day = day.min() if len(day) else 0
+    span = (day.max() - first_day + 2) if len(day) else 2
+    keys = codes.astype(np.int64) * span + (day - first_day)
+    segment_end = np.searchsorted(codes, np.arange(len(symbols)), side="right")
+    offset = np.clip(rec_day - first_day, -1, span - 1)
+    start = np.searchsorted(keys, rec_code.astype(np.int64) * span + offset, side="right")
+    available = np.where(valid, segment_end[rec_code] - start if len(symbols) else 0, 0)
+    last = max(len(close) - 1, 0)
+
+    for horizon in horizons:
+        idx = np.minimum(start + horizon - 1, last)
+        reached = available >= horizon
+        result[f"return_{horizon}d"] = np.where(reached, close[idx] / buy_value - 1, np.nan) if len(close) else np.nan
+
+    target = buy_value * (1 + float(revenue_percentage) / 100)
+    reached_target = np.zeros(len(result), dtype=bool)
+    bars_to_target = np.full(len(result), np.nan)
+    days_to_target = np.full(len(result), np.nan)
+    max_drawdown = np.full(len(result), np.nan)
+    steps = np.arange(max_days)
+    for block_start in range(0, len(result) if len(close) else 0, BLOCK_ROWS):
+        block = slice(block_start, block_start + BLOCK_ROWS)
+        window = np.minimum(available[block], max_days)
+        idx = np.minimum(start[block, None] + steps, last)
+        in_window = steps < window[:, None]
+
+        hits = in_window & (high[idx] >= target[block, None])
+        hit = hits.any(axis=1)
+        first_hit = hits.argmax(axis=1)
+        # The position is open until the target bar, or until the end of the window
+        open_until = np.where(hit, first_hit, window - 1)
+        lowest = np.where(in_window & (steps <= open_until[:, None]), low[idx], np.inf).min(axis=1)
+
+        reached_target[block] = hit
+        bars_to_target[block] = np.where(hit, first_hit + 1, np.nan)
+        hit_day = day[np.minimum(start[block] + first_hit, last)]
+        days_to_target[block] = np.where(hit, hit_day - rec_day[block], np.nan)
+        max_drawdown[block] = np.where(window > 0, np.minimum(lowest / buy_value[block] - 1, 0), np.nan)
+
+    result["reached_target"] = reached_target
+    result["days_to_target"] = days_to_target
+    result["bars_to_target"] = bars_to_target
+    result["max_drawdown"] = max_drawdown
+    result["bars_available"] = available
+    return result
+
+
+def summarize_by_source(results, horizons=HORIZONS):
+    """
+    Accuracy per decision source: hit rate of the revenue target, time to reach it, mean forward
+    returns and drawdowns. Recommendations without any bar after the buy are left out.
+    """
+    results = results[results["bars_available"] > 0]
+    if "source" not in results.columns:
+        results = results.assign(source="FINAL")
+    grouped = results.groupby("source")
+    summary = pd.DataFrame({
+        "recommendations": grouped.size(),
+        "hit_rate": grouped["reached_target"].mean().round(3),
+        "median_days_to_target": grouped["days_to_target"].median(),
+        "median_max_drawdown": grouped["max_drawdown"].median().round(4),
+        "worst_drawdown": grouped["max_drawdown"].min().round(4),
+    })
+    for horizon in horizons:
+        summary[f"mean_return_{horizon}d"] = grouped[f"return_{horizon}d"].mean().round(4)
+    return summary
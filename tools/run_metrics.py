@@ -0,0 +1,93 @@
+import json
+import math
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Per-run counters and observations shared by the pipeline stages.
+# Counters add up (e.g. "llm.requests"), observations keep every sample (e.g. latencies)
+# and are summarized when the run report is built.
+_lock = threading.Lock()
+_counters = {}
+_observations = {}
+
+
+def increment(name, amount=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def set_value(name, value):
+    with _lock:
+        _counters[name] = value
+
+
+def observe(name, value):
+    with _lock:
+        _observations.setdefault(name, []).append(value)
+
+
+def get_counter(name, default=0):
+    with _lock:
+        return _counters.get(name, default)
+
+
+def get_observations(name):
+    with _lock:
+        return list(_observations.get(name, []))
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers (pct in 0-100)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(ordered)), 1)
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(values):
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "total": round(sum(values), 4),
+        "mean": round(sum(values) / len(values), 4),
+        "p50": round(percentile(values, 50), 4),
+        "p95": round(percentile(values, 95), 4),
+        "max": round(max(values), 4),
+    }
+
+
+def get_summary():
+    """Return counters and summarized observations of the current run."""
+    with _lock:
+        counters = dict(_counters)
+        observations = {name: list(values) for name, values in _observations.items()}
+    summary = dict(sorted(counters.items()))
+    for name, values in sorted(observations.items()):
+        summary[name] = summarize(values)
+    return summary
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _observations.clear()
+
+
+def log_summary():
+    summary = get_summary()
+    if not summary:
+        return
+    logger.info("📊 Run metrics:")
+    for name, value in summary.items():
+        logger.info(f"  {name}: {value}")
+
+
+def save_summary(path):
+    """Write the current run summary as JSON."""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(get_summary(), f, indent=2, default=str)
+    logger.info(f"✅ Run metrics saved to {path}")
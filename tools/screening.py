@@ -0,0 +1,141 @@
+import os
+import json
+import time
+import logging
+import numpy as np
+from dotenv import load_dotenv
+from tools import run_metrics
+
+logger = logging.getLogger(__name__)
+
+# Load .env file only if not running in production (e.g., GitHub Actions)
+if not os.getenv("GITHUB_ACTIONS"):  # This var is auto-set in GitHub Actions
+    load_dotenv()
+
+# Stage 1 filters (empty = no filter)
+MAX_CHANGE_PERCENT = os.environ.get("SCREEN_MAX_CHANGE_PERCENT", "")
+MIN_PRICE = os.environ.get("SCREEN_MIN_PRICE", "")
+# Weight of the cached rule-based confidence (-1..1) against the daily drop (in %) in the stage 1 score
+CONFIDENCE_WEIGHT = float(os.environ.get("SCREEN_CONFIDENCE_WEIGHT") or 2.0)
+
+# Indicators of fully evaluated symbols, reused by stage 1 of later runs
+INDICATOR_CACHE_FILE = os.environ.get("SCREEN_INDICATOR_CACHE_FILE") or "indicator_cache.json"
+INDICATOR_TTL_HOURS = float(os.environ.get("SCREEN_INDICATOR_TTL_HOURS") or 72)
+CACHED_SIGNALS = ("RSI", "SMA_50", "SMA_200", "Monthly_10pct_Prob")
+
+
+def _optional_float(value):
+    return float(value) if value not in (None, "") else None
+
+
+def load_universe(path):
+    """
+    Load the screening universe: a JSON file (list of symbols or an object keyed by symbol,
+    like resources/symbols_markets.json) or a text file with one symbol per line.
+    """
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".json"):
+            return list(json.load(f))
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+def load_indicator_cache(path=None, ttl_hours=None):
+    """Cached indicators per symbol, without entries older than ttl_hours."""
+    path = path or INDICATOR_CACHE_FILE
+    ttl_hours = INDICATOR_TTL_HOURS if ttl_hours is None else ttl_hours
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            entries = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable indicator cache {path}: {e}")
+        return {}
+    oldest = time.time() - ttl_hours * 3600
+    return {symbol: entry for symbol, entry in entries.items() if entry.get("updated_at", 0) >= oldest}
+
+
+def update_indicator_cache(analysis_results, path=None):
+    """
+    Store the confidence, evaluation and main signals of fully evaluated symbols (failed evaluations are skipped).
+
+    Parameters:
+        analysis_results (list): Items as returned by main.analyze_symbol
+        path (str): Cache file (SCREEN_INDICATOR_CACHE_FILE, default indicator_cache.json)
+    """
+    path = path or INDICATOR_CACHE_FILE
+    entries = load_indicator_cache(path)
+    now = time.time()
+    for item in analysis_results:
+        metrics = item["metrics"]
+        if "failed" in str(metrics.get("evaluation", "")).lower():
+            continue
+        signals = metrics.get("signals", {})
+        entries[item["symbol"]] = {
+            "confidence": metrics.get("confidence", 0.0),
+            "evaluation": metrics.get("evaluation"),
+            "signals": {key: signals[key] for key in CACHED_SIGNALS if key in signals},
+            "updated_at": now,
+        }
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(entries, f)
+    os.replace(tmp_path, path)
+    return entries
+
+
+def screen_symbols(symbols_info, top_k, indicators=None, max_change_percent=None, min_price=None,
+                   confidence_weight=None):
+    """
+    Stage 1 of the screening funnel: rank quoted symbols cheaply and keep the top_k.
+
+    Symbols without a valid quote, above max_change_percent or below min_price are dropped.
+    The rest are ranked by score = -change_percent + confidence_weight * cached confidence,
+    so large daily drops of symbols that looked good in earlier evaluations come first.
+
+    Parameters:
+        symbols_info (list): Quotes as returned by finnhub_client.get_symbols_info
+        top_k (int): Number of survivors passed to the full evaluation
+        indicators (dict): Cached indicators per symbol (load_indicator_cache), none when empty
+        max_change_percent (float): Keep symbols whose change_percent is at most this value
+        min_price (float): Keep symbols whose price is at least this value
+        confidence_weight (float): Weight of the cached confidence in the score
+
+    Returns:
+        (survivors, report): the selected quotes, best first, and a dict with stage sizes and timing
+    """
+    started = time.perf_counter()
+    indicators = indicators or {}
+    max_change_percent = _optional_float(MAX_CHANGE_PERCENT if max_change_percent is None else max_change_percent)
+    min_price = _optional_float(MIN_PRICE if min_price is None else min_price)
+    confidence_weight = CONFIDENCE_WEIGHT if confidence_weight is None else confidence_weight
+
+    change = np.array([item.get("change_percent") for item in symbols_info], dtype=float)
+    price = np.array([item.get("current_price") for item in symbols_info], dtype=float)
+    confidence = np.array([indicators.get(item["symbol"], {}).get("confidence", 0.0) or 0.0
+                           for item in symbols_info], dtype=float)
+
+    valid = ~np.isnan(change) & (price > 0)
+    if max_change_percent is not None:
+        valid &= change <= max_change_percent
+    if min_price is not None:
+        valid &= price >= min_price
+
+    candidates = np.flatnonzero(valid)
+    score = -change[candidates] + confidence_weight * confidence[candidates]
+    selected = candidates[np.argsort(-score, kind="stable")[:max(top_k, 0)]]
+    survivors = [symbols_info[i] for i in selected]
+
+    report = {
+        "universe": len(symbols_info),
+        "passed_filters": len(candidates),
+        "with_cached_indicators": int(sum(1 for item in symbols_info if item["symbol"] in indicators)),
+        "survivors": len(survivors),
+        "stage1_ms": round((time.perf_counter() - started) * 1000, 3),
+    }
+    for key, value in report.items():
+        run_metrics.set_value(f"screening.{key}", value)
+    logger.info(f"✅ Screening stage 1: {report['universe']} symbols -> {report['passed_filters']} "
+                f"after filters -> {report['survivors']} survivors ({report['stage1_ms']} ms)")
+    return survivors, report
@@ -0,0 +1,188 @@
+import os
+import time
+import shutil
+import logging
+from pathlib import Path
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from dotenv import load_dotenv
+from tools import google_handler
+
+logger = logging.getLogger(__name__)
+
+# Load .env file only if not running in production (e.g., GitHub Actions)
+if not os.getenv("GITHUB_ACTIONS"):  # This var is auto-set in GitHub Actions
+    load_dotenv()
+
+LOCAL_FORMATS = ("parquet", "csv")
+
+
+class StorageBackend:
+    """
+    Interface of the storage backends used by main.py: DataFrames are loaded and saved by file id
+    (a Drive file id, or a file name for local storage).
+    """
+
+    def load_frame(self, file_id):
+        """Return the DataFrame stored under file_id, or None if it can't be loaded."""
+        raise NotImplementedError
+
+    def save_frame(self, df, file_id):
+        """Store df under file_id (replacing the current version)."""
+        raise NotImplementedError
+
+    def list_versions(self, file_id):
+        """Return the stored versions of file_id, oldest first: [{"version", "modified_time", "size"}]."""
+        raise NotImplementedError
+
+    def exists(self, file_id):
+        """False only when file_id is known not to exist yet (a failed load of an existing file is an error)."""
+        return True
+
+    def save_frames(self, frames):
+        """
+        Save several frames concurrently.
+
+        Parameters:
+            frames (dict): name -> (DataFrame, file_id)
+
+        Returns:
+            dict name -> {"file_id", "status", "error", "rows", "bytes", "serialize_ms", "upload_ms"}
+        """
+        def save(name, df, file_id):
+            result = {"file_id": file_id, "status": "ok", "error": None, "rows": len(df), "bytes": None,
+                      "serialize_ms": None, "upload_ms": None}
+            try:
+                if not file_id:
+                    raise Exception(f"file_id not provided for {name}")
+                started = time.perf_counter()
+                self.save_frame(df, file_id)
+                result["upload_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            except Exception as e:
+                result.update(status="error", error=str(e))
+                logger.error(f"❌ Error saving {name}: {e}")
+            return name, result
+
+        if not frames:
+            return {}
+        with ThreadPoolExecutor(max_workers=len(frames), thread_name_prefix="storage") as executor:
+            futures = [executor.submit(save, name, df, file_id) for name, (df, file_id) in frames.items()]
+            return dict(future.result() for future in futures)
+
+    def default_file_id(self, name):
+        """File id used when none is configured for an output (None: it must be configured)."""
+        return None
+
+
+class DriveStorage(StorageBackend):
+    """Google Drive (CSV content, Google Sheets exports), through google_handler."""
+
+    def load_frame(self, file_id):
+        return google_handler.load_data(file_id)
+
+    def save_frame(self, df, file_id):
+        return google_handler.save_dataframe_file_id(df, file_id)
+
+    def save_frames(self, frames):
+        return google_handler.save_dataframes(frames)
+
+    def list_versions(self, file_id):
+        revisions = google_handler.get_drive_service().revisions().list(
+            fileId=file_id, fields="revisions(id,modifiedTime,size)"
+        ).execute(http=google_handler.get_authorized_http())
+        return [{"version": revision["id"], "modified_time": revision.get("modifiedTime"),
+                 "size": int(revision["size"]) if revision.get("size") else None}
+                for revision in revisions.get("revisions", [])]
+
+
+class LocalStorage(StorageBackend):
+    """
+    Local filesystem storage: <root>/<file_id>.parquet or .csv, with previous versions kept in
+    <root>/.versions/<file_id>/ (the newest keep_versions of them).
+    """
+
+    def __init__(self, root="data", file_format="parquet", keep_versions=10):
+        if file_format not in LOCAL_FORMATS:
+            raise ValueError(f"Unknown local storage format '{file_format}', expected one of {', '.join(LOCAL_FORMATS)}")
+        self.root = Path(root)
+        self.file_format = file_format
+        self.keep_versions = keep_versions
+
+    def _path(self, file_id):
+        return self.root / f"{file_id}.{self.file_format}"
+
+    def _versions_dir(self, file_id):
+        return self.root / ".versions" / str(file_id)
+
+    def load_frame(self, file_id):
+        path = self._path(file_id)
+        try:
+            if self.file_format == "parquet":
+                df = pd.read_parquet(path)
+            else:
+                df = pd.read_csv(path)
+            logger.info(f"✅ {path} loaded with {len(df)} rows.")
+            return df
+        except Exception as e:
+            logger.error(f"❌ {path} not found or error occurred: {e}.")
+            return None
+
+    def save_frame(self, df, file_id):
+        path = self._path(file_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.tmp")
+        if self.file_format == "parquet":
+            _parquet_safe(df).to_parquet(tmp_path, index=False)
+        else:
+            df.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+        if self.keep_versions:
+            versions_dir = self._versions_dir(file_id)
+            versions_dir.mkdir(parents=True, exist_ok=True)
+            stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+            shutil.copyfile(path, versions_dir / f"{stamp}.{self.file_format}")
+            for old in sorted(versions_dir.iterdir())[:-self.keep_versions]:
+                old.unlink()
+        logger.info(f"✅ {len(df)} rows saved to {path}")
+
+    def list_versions(self, file_id):
+        versions_dir = self._versions_dir(file_id)
+        if not versions_dir.exists():
+            return []
+        return [{"version": path.stem,
+                 "modified_time": datetime.fromtimestamp(path.stat().st_mtime, timezone.utc).isoformat(),
+                 "size": path.stat().st_size}
+                for path in sorted(versions_dir.iterdir())]
+
+    def exists(self, file_id):
+        return self._path(file_id).exists()
+
+    def default_file_id(self, name):
+        return name
+
+
+def _parquet_safe(df):
+    # Parquet needs one type per column: object columns holding numbers become numeric, the rest strings
+    df = df.copy()
+    for column in df.columns[df.dtypes == object]:
+        try:
+            df[column] = pd.to_numeric(df[column])
+        except (ValueError, TypeError):
+            df[column] = df[column].map(lambda value: value if pd.isna(value) else str(value)).astype("string")
+    return df
+
+
+def get_storage(name=None):
+    """Return the storage backend configured in STORAGE_BACKEND ('drive' or 'local')."""
+    name = (name or os.getenv("STORAGE_BACKEND") or "drive").strip().lower()
+    if name == "drive":
+        return DriveStorage()
+    if name == "local":
+        return LocalStorage(
+            os.getenv("STORAGE_LOCAL_DIR") or "data",
+            (os.getenv("STORAGE_LOCAL_FORMAT") or "parquet").strip().lower(),
+            int(os.getenv("STORAGE_LOCAL_KEEP_VERSIONS") or 10),
+        )
+    raise ValueError(f"Unknown storage backend: {name}")
@@ -0,0 +1,148 @@
+import csv
+import json
+import time
+import threading
+import logging
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+MAPPING_FILE = PROJECT_ROOT / "resources" / "investing_symbol_mapping.csv"
+MARKETS_FILE = PROJECT_ROOT / "resources" / "symbols_markets.json"
+
+# Files are checked for changes at most this often (seconds), not on every lookup
+RELOAD_CHECK_SECONDS = 1.0
+
+TRADINGVIEW_URL = "https://en.tradingview.com/symbols/{market}-{symbol}/technicals/"
+
+
+def base_symbol(symbol):
+    # Listed symbol without its exchange suffix: RHM.DE -> RHM
+    return symbol.split(".")[0]
+
+
+class SymbolRegistry:
+    """
+    Symbol metadata of resources/investing_symbol_mapping.csv (investing.com mapping strings) and
+    resources/symbols_markets.json (market, TradingView symbol and provider tickers), indexed by symbol.
+
+    Files are read on the first lookup and again only when their modification time changes.
+    Entries of symbols_markets.json may override the ticker used by a provider:
+        "RHM.DE": {"market": "XETR", "symbol": "RHM", "tickers": {"historicals": "RHM.DE"}}
+    """
+
+    def __init__(self, mapping_path=MAPPING_FILE, markets_path=MARKETS_FILE, check_seconds=RELOAD_CHECK_SECONDS):
+        self.mapping_path = Path(mapping_path)
+        self.markets_path = Path(markets_path)
+        self.check_seconds = check_seconds
+        self._lock = threading.Lock()
+        self._mtimes = {}
+        self._checked_at = None
+        self._mapping = {}
+        self._markets = {}
+
+    def _mtime(self, path):
+        try:
+            return path.stat().st_mtime_ns
+        except OSError:
+            return None
+
+    def _read_mapping(self):
+        with open(self.mapping_path, mode="r", newline="", encoding="utf-8") as f:
+            # First row of a symbol wins, as in the former linear scan
+            mapping = {}
+            for row in csv.DictReader(f):
+                mapping.setdefault(row["symbol"], row["mapping_string"])
+            return mapping
+
+    def _read_markets(self):
+        with open(self.markets_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.check_seconds:
+            return
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < self.check_seconds:
+                return
+            for path, attribute, read in ((self.mapping_path, "_mapping", self._read_mapping),
+                                          (self.markets_path, "_markets", self._read_markets)):
+                mtime = self._mtime(path)
+                if path in self._mtimes and self._mtimes[path] == mtime:
+                    continue
+                try:
+                    setattr(self, attribute, read() if mtime is not None else {})
+                    if mtime is None:
+                        logger.error(f"❌ Symbol metadata file {path} not found")
+                    else:
+                        logger.debug(f"Loaded symbol metadata from {path}")
+                except Exception as e:
+                    logger.error(f"❌ Error reading symbol metadata file {path}: {e}")
+                    setattr(self, attribute, {})
+                self._mtimes[path] = mtime
+            self._checked_at = now
+
+    def reload(self):
+        """Force the files to be read again on the next lookup."""
+        with self._lock:
+            self._mtimes.clear()
+            self._checked_at = None
+
+    def mapping_string(self, symbol):
+        """investing.com mapping string of a symbol, or None."""
+        self._refresh()
+        return self._mapping.get(symbol)
+
+    def info(self, symbol):
+        """Entry of symbols_markets.json for a symbol ({} when unknown)."""
+        self._refresh()
+        return self._markets.get(symbol) or {}
+
+    def market(self, symbol):
+        return self.info(symbol).get("market")
+
+    def tradingview_symbol(self, symbol):
+        """Symbol used by TradingView: the 'symbol' of the entry if set, without exchange suffix."""
+        return base_symbol(self.info(symbol).get("symbol", symbol))
+
+    def tradingview_url(self, symbol):
+        """TradingView technicals page of a symbol, or None when its market is unknown."""
+        if not isinstance(symbol, str):
+            return None
+        market = self.market(symbol)
+        if not market:
+            return None
+        return TRADINGVIEW_URL.format(market=market, symbol=self.tradingview_symbol(symbol))
+
+    def provider_ticker(self, symbol, provider):
+        """
+        Ticker of a symbol for a data provider.
+
+        Parameters:
+            symbol (str): Listed symbol (as in SYMBOLS_INTEREST_LIST)
+            provider (str): 'finnhub' (listed symbol), 'historicals' (without exchange suffix),
+                'tradingview' or any provider named in the entry's "tickers"
+        """
+        tickers = self.info(symbol).get("tickers") or {}
+        if provider in tickers:
+            return tickers[provider]
+        if provider == "historicals":
+            return base_symbol(symbol)
+        if provider == "tradingview":
+            return self.tradingview_symbol(symbol)
+        return symbol
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_registry(mapping_path=None, markets_path=None):
+    """Shared registry of the given files (the resources/ files by default)."""
+    key = (str(mapping_path or MAPPING_FILE), str(markets_path or MARKETS_FILE))
+    with _registries_lock:
+        if key not in _registries:
+            _registries[key] = SymbolRegistry(*key)
+        return _registries[key]
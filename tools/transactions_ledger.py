@@ -0,0 +1,144 @@
+import os
+import json
+import logging
+from datetime import datetime, timezone
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Append-only delta log of the transactions ledger.
+# Each entry is one operation on a transaction identified by symbol and buy_date:
+#   insert: a new transaction (the whole row)
+#   close:  the sell fields of a transaction that reached its target
+# The full snapshot is only rewritten when the log is compacted.
+DELTA_COLUMNS = ["op", "key", "recorded_at", "data"]
+# Columns of a ledger with no transactions yet (new rows bring the columns of the analysis as well)
+LEDGER_COLUMNS = ["symbol", "buy_value", "buy_date", "sell_value", "sell_date", "buy_sell_days_diff",
+                  "percentage_benefit"]
+CLOSE_FIELDS = ["sell_value", "sell_date", "buy_sell_days_diff", "percentage_benefit"]
+
+# Compact the log into the snapshot once it holds this many entries
+COMPACT_EVERY = int(os.environ.get("TRANSACTIONS_COMPACT_EVERY") or 100)
+
+
+def transaction_key(symbol, buy_date):
+    # buy_date is normalized so keys still match after a spreadsheet reformats the dates
+    try:
+        buy_date = pd.Timestamp(buy_date).strftime("%Y-%m-%d %H:%M")
+    except (ValueError, TypeError):
+        pass
+    return f"{symbol}|{buy_date}"
+
+
+def _json_value(value):
+    if value is None or (not isinstance(value, (list, dict)) and pd.isna(value)):
+        return None
+    if hasattr(value, "item"):  # numpy scalars
+        return value.item()
+    if isinstance(value, (int, float, str, bool)):
+        return value
+    return str(value)
+
+
+def _entry(op, key, data):
+    return {
+        "op": op,
+        "key": key,
+        "recorded_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "data": json.dumps({column: _json_value(value) for column, value in data.items()}),
+    }
+
+
+def empty_log():
+    return pd.DataFrame(columns=DELTA_COLUMNS)
+
+
+def empty_ledger():
+    return pd.DataFrame(columns=LEDGER_COLUMNS)
+
+
+def insert_entries(new_transactions_df):
+    """Delta entries for new transactions (e.g. the BUY recommendations of the run)."""
+    return [_entry("insert", transaction_key(row["symbol"], row["buy_date"]), row.to_dict())
+            for _, row in new_transactions_df.iterrows()]
+
+
+def close_entries(before_df, after_df):
+    """
+    Delta entries for transactions closed between two versions of the ledger
+    (open in before_df, sold in after_df, as done by google_handler.update_transactions).
+    """
+    if before_df is None or before_df.empty or "sell_value" not in after_df.columns:
+        return []
+    was_open = before_df["sell_value"].isna() if "sell_value" in before_df.columns else pd.Series(True, index=before_df.index)
+    closed = after_df[was_open.reindex(after_df.index, fill_value=False) & after_df["sell_value"].notna()]
+    return close_entries_for_rows(closed)
+
+
+def close_entries_for_rows(closed_df):
+    """Delta entries for the given sold transactions."""
+    return [_entry("close", transaction_key(row["symbol"], row["buy_date"]),
+                   {field: row.get(field) for field in CLOSE_FIELDS})
+            for _, row in closed_df.iterrows()]
+
+
+def append_entries(log_df, entries):
+    """Append entries to the log (the log is never rewritten, only compacted)."""
+    if not entries:
+        return log_df if log_df is not None else empty_log()
+    new_df = pd.DataFrame(entries, columns=DELTA_COLUMNS)
+    if log_df is None or log_df.empty:
+        return new_df
+    return pd.concat([log_df[DELTA_COLUMNS], new_df], ignore_index=True)
+
+
+def apply_log(snapshot_df, log_df):
+    """
+    Current ledger = snapshot + delta log. Applying is idempotent: inserts of known keys are skipped
+    and closes only set the sell fields, so a log that was already compacted can be replayed safely.
+    """
+    ledger = snapshot_df.copy() if snapshot_df is not None else pd.DataFrame()
+    if log_df is None or log_df.empty:
+        return ledger
+
+    keys = {}
+    if not ledger.empty:
+        keys = {transaction_key(symbol, buy_date): idx
+                for idx, symbol, buy_date in zip(ledger.index, ledger["symbol"], ledger["buy_date"])}
+
+    inserts = {}
+    closes = {}
+    for op, key, data in zip(log_df["op"], log_df["key"], log_df["data"]):
+        if op == "insert" and key not in keys and key not in inserts:
+            inserts[key] = json.loads(data)
+        elif op == "close":
+            closes.setdefault(key, {}).update(json.loads(data))
+
+    for key, fields in closes.items():
+        if key in inserts:
+            inserts[key].update(fields)
+        elif key in keys:
+            for field, value in fields.items():
+                # Sell columns are empty (float NaN) until something is sold
+                if field not in ledger.columns or ledger[field].dtype != object:
+                    ledger[field] = ledger[field].astype(object) if field in ledger.columns else None
+                ledger.at[keys[key], field] = value
+
+    if inserts:
+        inserted = pd.DataFrame(list(inserts.values()))
+        ledger = inserted if ledger.empty else pd.concat([ledger, inserted], ignore_index=True)
+    return ledger
+
+
+def needs_compaction(log_df, compact_every=None):
+    compact_every = COMPACT_EVERY if compact_every is None else compact_every
+    return log_df is not None and len(log_df) >= compact_every
+
+
+def compact(snapshot_df, log_df):
+    """Fold the log into a new snapshot (newest transactions first); the log starts empty again."""
+    ledger = apply_log(snapshot_df, log_df)
+    if "buy_date" in ledger.columns:
+        ledger = ledger.sort_values(by="buy_date", ascending=False, kind="stable", ignore_index=True)
+    logger.info(f"✅ Compacted {0 if log_df is None else len(log_df)} ledger changes into {len(ledger)} transactions")
+    return ledger, empty_log()